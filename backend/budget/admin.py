@@ -1,12 +1,83 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 from import_export import fields
 from import_export.widgets import ForeignKeyWidget, JSONWidget
 import json
 from json import JSONDecodeError
+from import_export.signals import post_export
+from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+from django.utils import timezone
+from django.utils.text import capfirst
 from .models import BudgetItem, Work, Material, QuarterReserve, Group
-from .models import BudgetItem
+from .models import BudgetItem, ImportJob, Job
+from . import exports, imports
+from .rollover import rollover
+from .snapshot import set_age_header, use_snapshot
+
+
+def _month_part(value, part):
+    """Сумма или статус месяца: значение бывает и числом, и {"amount", "status"}."""
+    if isinstance(value, dict):
+        return value.get(part, '')
+    return value if part == 'amount' else ''
+
+
+def _first_month(work, attr):
+    """
+    (месяц, значение) первой записи JSON-карты attr работы. Карта разбирается
+    один раз на работу: её читают три колонки выгрузки (месяц, сумма, статус).
+    """
+    cache = work.__dict__.setdefault('_export_first_months', {})
+    if attr not in cache:
+        raw = getattr(work, attr)
+        try:
+            data = json.loads(raw) if isinstance(raw, str) else raw or {}
+        except JSONDecodeError:
+            data = {}
+        cache[attr] = next(iter(data.items()), ('', None))
+    return cache[attr]
+
+
+def _first_month_part(work, attr, part):
+    month, value = _first_month(work, attr)
+    return _month_part(value, part) if month else ''
+
+
+AMBIGUOUS = object()
+
+
+class CachedForeignKeyWidget(ForeignKeyWidget):
+    """
+    ForeignKeyWidget, который при импорте читает таблицу один раз, а не делает
+    запрос на каждую строку. Ресурс копирует поля при создании, так что кэш
+    живёт одну загрузку.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._objects = None
+
+    def clean(self, value, row=None, **kwargs):
+        if value in (None, ''):
+            return None
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)  # числа из XLSX приходят как float
+        if self._objects is None:
+            self._objects = {}
+            for obj in self.get_queryset(value, row, **kwargs):
+                key = str(getattr(obj, self.field))
+                # одинаковые ключи: как MultipleObjectsReturned у ForeignKeyWidget
+                self._objects[key] = AMBIGUOUS if key in self._objects else obj
+        name = capfirst(self.model._meta.verbose_name)
+        try:
+            obj = self._objects[str(value)]
+        except KeyError:
+            raise ValueError(f"{name} «{value}» не найден")
+        if obj is AMBIGUOUS:
+            raise ValueError(f"{name} «{value}» не однозначен: таких несколько")
+        return obj
+
 
 class WorkResource(resources.ModelResource):
     class JsonSplitWidget(JSONWidget):
@@ -21,7 +92,12 @@ class WorkResource(resources.ModelResource):
     item = fields.Field(
         column_name='item',
         attribute='item',
-        widget=ForeignKeyWidget(BudgetItem, 'name')
+        widget=CachedForeignKeyWidget(BudgetItem, 'name')
+    )
+    responsible = fields.Field(
+        column_name='responsible',
+        attribute='responsible',
+        widget=CachedForeignKeyWidget(get_user_model())
     )
     # Split accruals JSON
     accruals_month = fields.Field(column_name='accruals_month', attribute='accruals')
@@ -63,108 +139,40 @@ class WorkResource(resources.ModelResource):
     )
 
     def dehydrate_accruals_month(self, work):
-        raw = work.accruals
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        return next(iter(data.keys()), '')
+        return _first_month(work, 'accruals')[0]
 
     def dehydrate_accruals_amount(self, work):
-        raw = work.accruals
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        key = next(iter(data.keys()), None)
-        return data[key].get('amount', '') if key else ''
+        return _first_month_part(work, 'accruals', 'amount')
 
     def dehydrate_accruals_status(self, work):
-        raw = work.accruals
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        key = next(iter(data.keys()), None)
-        return data[key].get('status', '') if key else ''
+        return _first_month_part(work, 'accruals', 'status')
 
     def dehydrate_payments_month(self, work):
-        raw = work.payments
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        return next(iter(data.keys()), '')
+        return _first_month(work, 'payments')[0]
 
     def dehydrate_payments_amount(self, work):
-        raw = work.payments
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        key = next(iter(data.keys()), None)
-        return data[key].get('amount', '') if key else ''
+        return _first_month_part(work, 'payments', 'amount')
 
     def dehydrate_payments_status(self, work):
-        raw = work.payments
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        key = next(iter(data.keys()), None)
-        return data[key].get('status', '') if key else ''
+        return _first_month_part(work, 'payments', 'status')
 
     def dehydrate_actual_accruals_month(self, work):
-        raw = work.actual_accruals
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        return next(iter(data.keys()), '')
+        return _first_month(work, 'actual_accruals')[0]
 
     def dehydrate_actual_accruals_amount(self, work):
-        raw = work.actual_accruals
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        key = next(iter(data.keys()), None)
-        return data[key].get('amount', '') if key else ''
+        return _first_month_part(work, 'actual_accruals', 'amount')
 
     def dehydrate_actual_accruals_status(self, work):
-        raw = work.actual_accruals
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        key = next(iter(data.keys()), None)
-        return data[key].get('status', '') if key else ''
+        return _first_month_part(work, 'actual_accruals', 'status')
 
     def dehydrate_actual_payments_month(self, work):
-        raw = work.actual_payments
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        return next(iter(data.keys()), '')
+        return _first_month(work, 'actual_payments')[0]
 
     def dehydrate_actual_payments_amount(self, work):
-        raw = work.actual_payments
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        key = next(iter(data.keys()), None)
-        return data[key].get('amount', '') if key else ''
+        return _first_month_part(work, 'actual_payments', 'amount')
 
     def dehydrate_actual_payments_status(self, work):
-        raw = work.actual_payments
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw or {}
-        except JSONDecodeError:
-            data = {}
-        key = next(iter(data.keys()), None)
-        return data[key].get('status', '') if key else ''
+        return _first_month_part(work, 'actual_payments', 'status')
 
     def before_import_row(self, row, **kwargs):
         for prefix in ['accruals', 'payments', 'actual_accruals', 'actual_payments']:
@@ -177,9 +185,15 @@ class WorkResource(resources.ModelResource):
                 obj = {}
             row[prefix] = json.dumps(obj, ensure_ascii=False)
 
+    def filter_export(self, queryset, **kwargs):
+        # колонки item и responsible — без запроса на каждую строку
+        return queryset.select_related('item', 'responsible')
+
     class Meta:
         model = Work
         import_id_fields = ('id',)
+        # строки выгрузки читаются queryset.iterator() пачками
+        chunk_size = 500
         # Required for import: id, item, name; other fields are optional
         fields = (
             'id', 'item', 'name', 'justification', 'comment',
@@ -227,6 +241,51 @@ class WorkAdmin(ImportExportModelAdmin):
     )
     autocomplete_fields = ("responsible",)
     inlines = [MaterialInline]
+    actions = ("copy_to_next_year",)
+
+    @admin.action(description="Скопировать в следующий год (план и резервы)",
+                  permissions=("add",))
+    def copy_to_next_year(self, request, queryset):
+        # сдвиг и масштаб карт — в manage.py rollover_year
+        years = set(queryset.values_list("year", flat=True))
+        if len(years) != 1:
+            self.message_user(request, "Выберите работы одного года", messages.ERROR)
+            return
+        target = years.pop() + 1
+        result = rollover(queryset, target)
+        self.message_user(
+            request,
+            f"В {target} год скопировано работ: {result.works} (уже были {result.skipped_works}), "
+            f"резервов: {result.reserves}",
+        )
+
+    def export_action(self, request):
+        # выгрузка читает снимок для отчётов, а не основную базу
+        with use_snapshot() as snapshot_age:
+            response = super().export_action(request)
+        return set_age_header(response, snapshot_age)
+
+    def _do_file_export(self, file_format, request, queryset, export_form=None):
+        # CSV и XLSX — потоком (budget.exports), остальные форматы — через tablib
+        if file_format.get_extension() not in exports.STREAMED_FORMATS:
+            return super()._do_file_export(file_format, request, queryset, export_form=export_form)
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+        resource_class = self.choose_export_resource_class(export_form, request)
+        resource = resource_class(**self.get_export_resource_kwargs(request, export_form=export_form))
+        # строки CSV читаются уже после выхода из use_snapshot: базу фиксируем сейчас
+        queryset = queryset.using(queryset.db)
+        filename = self.get_export_filename(request, queryset, file_format)
+        rows = exports.rows(
+            resource, queryset, self.get_export_resource_fields_from_form(export_form),
+            force_native_type=file_format.is_binary(), export_form=export_form,
+        )
+        if file_format.get_extension() == "csv":
+            response = exports.csv_response(request, rows, filename, self.to_encoding)
+        else:
+            response = exports.xlsx_response(request, rows, filename)
+        post_export.send(sender=None, model=self.model)
+        return response
 
 @admin.register(QuarterReserve)
 class QuarterReserveAdmin(admin.ModelAdmin):
@@ -245,4 +304,54 @@ class QuarterReserveAdmin(admin.ModelAdmin):
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("code", "name")
-    search_fields = ("code", "name")
\ No newline at end of file
+    search_fields = ("code", "name")
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    """
+    Фоновый импорт работ (budget.imports) — для больших файлов вместо
+    «Импорт» в списке работ: задача выполняется вне запроса, страницу
+    задачи можно обновлять и смотреть ход, ошибки и изменения.
+    """
+    list_display = ("__str__", "user", "dry_run", "status", "processed", "total",
+                    "created", "updated", "invalid", "created_at")
+    list_filter = ("status", "dry_run")
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return ()
+        return [f.name for f in ImportJob._meta.fields]
+
+    def get_fields(self, request, obj=None):
+        if obj is None:
+            return ("file", "dry_run")
+        return [f.name for f in ImportJob._meta.fields if f.name != "id"]
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.user = request.user
+        super().save_model(request, obj, form, change)
+        if not change:
+            imports.start(obj)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Фоновые задачи (budget.jobs): только просмотр и повтор упавших."""
+    list_display = ("__str__", "kind", "user", "status", "attempts", "progress", "worker",
+                    "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    actions = ("retry",)
+
+    def get_readonly_fields(self, request, obj=None):
+        return [f.name for f in Job._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Повторить упавшие задачи")
+    def retry(self, request, queryset):
+        count = queryset.filter(status="failed").update(
+            status="pending", attempts=0, run_after=timezone.now(), error="", finished_at=None,
+        )
+        self.message_user(request, f"Поставлено в очередь: {count}")
@@ -0,0 +1,90 @@
+"""
+Общий для всех gunicorn-воркеров кэш отрендеренных ответов списков.
+
+Ключ строится из ETag (путь, параметры, счётчики Revision), поэтому любая
+запись в отслеживаемые таблицы сдвигает ревизию, и устаревшие ответы
+больше не находятся; с диска их вытесняют TIMEOUT и MAX_ENTRIES.
+Бэкенд задаётся в settings.CACHES["responses"] (по умолчанию файловый).
+
+Счётчики попаданий и промахов (manage.py warm_cache --stats) копятся в
+памяти процесса и раз в STATS_FLUSH_SECONDS прибавляются к общим ключам
+stats:* через add + incr — запрос не платит за них записью на диск.
+Счётчики приблизительные: у файлового кэша incr — это get + set, и
+одновременный сброс двух воркеров может потерять приращение, вытеснение
+по MAX_ENTRIES — обнулить ключ, а перезапуск воркера — несброшенный остаток.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+CACHE_ALIAS = "responses"
+STATS_EVENTS = ("hit", "miss")
+STATS_FLUSH_SECONDS = 10
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def enabled():
+    return getattr(settings, "RESPONSE_CACHE_ENABLED", False) and CACHE_ALIAS in settings.CACHES
+
+
+def make_key(*parts):
+    raw = "|".join(str(p) for p in parts)
+    return "list:" + hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+
+
+def get(key):
+    content = caches[CACHE_ALIAS].get(key)
+    count("miss" if content is None else "hit")
+    return content
+
+
+def set(key, content):
+    caches[CACHE_ALIAS].set(key, content)
+
+
+
+def count(event):
+    with _counts_lock:
+        _counts[event] += 1
+        due = time.monotonic() - _flushed_at >= STATS_FLUSH_SECONDS
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    """Прибавить накопленные в процессе счётчики к общим."""
+    global _flushed_at
+    with _counts_lock:
+        pending = dict(_counts)
+        _counts.clear()
+        _flushed_at = time.monotonic()
+    cache = caches[CACHE_ALIAS]
+    for event, value in pending.items():
+        key = f"stats:{event}"
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            # ключ вытеснили между add и incr
+            cache.set(key, value, timeout=None)
+
+
+def stats():
+    flush_stats()
+    cache = caches[CACHE_ALIAS]
+    return {event: cache.get(f"stats:{event}", 0) for event in STATS_EVENTS}
+
+
+def reset_stats():
+    with _counts_lock:
+        _counts.clear()
+    cache = caches[CACHE_ALIAS]
+    for event in STATS_EVENTS:
+        cache.set(f"stats:{event}", 0, timeout=None)
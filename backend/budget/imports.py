@@ -0,0 +1,227 @@
+"""
+Фоновый импорт работ (WorkResource) из CSV и XLSX.
+
+Импорт через import_export в админке держит весь файл в памяти и сохраняет
+каждую строку отдельным save() внутри одного запроса. Здесь задача
+ImportJob выполняется вне запроса:
+- файл читается потоком: CSV через csv.reader, XLSX — openpyxl в режиме
+  read_only;
+- строки идут пачками по CHUNK_SIZE;
+- каждая пачка — одна транзакция: новые работы создаются bulk_create,
+  изменённые сохраняются bulk_update, плюс WorkMonthAmount.sync и журнал;
+- колонки и их разбор — те же, что у WorkResource (before_import_row,
+  виджеты), так что файл выгрузки загружается обратно.
+
+Строки с ошибками пропускаются и попадают в errors. Если сломалась вся
+пачка, ошибку получает каждая её строка. С dry_run ничего не пишется, а
+diff показывает, что импорт изменил бы. Задачу выполняет фоновый воркер
+(budget.jobs, задача import_works). После каждой пачки сохраняется
+processed: повтор прерванного импорта продолжает со следующей пачки.
+"""
+import csv
+import logging
+from itertools import islice
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import jobs
+from .models import ImportJob, Work, WorkMonthAmount
+from .signals import batch_changes, log_changes
+
+CHUNK_SIZE = 500
+# сколько ошибок строк и изменений хранить в задаче
+MAX_REPORTED = 200
+FORMATS = (".csv", ".xlsx")
+CLEAN_EXCLUDE = ["item", "responsible", *WorkMonthAmount.SOURCE_FIELDS]
+
+logger = logging.getLogger(__name__)
+
+
+def _resource():
+    from .admin import WorkResource  # admin импортирует модели и import_export
+
+    return WorkResource()
+
+
+def _csv_rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        yield from csv.reader(handle)
+
+
+def _xlsx_rows(path):
+    book = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in book.active.iter_rows(values_only=True):
+            yield ["" if value is None else value for value in row]
+    finally:
+        book.close()
+
+
+def read_rows(path):
+    """(номер строки в файле, dict колонка -> значение) для строк после заголовка."""
+    reader = _xlsx_rows(path) if Path(path).suffix.lower() == ".xlsx" else _csv_rows(path)
+    header = [str(name).strip() for name in next(reader, [])]
+    for line, values in enumerate(reader, start=2):
+        if not any(value not in ("", None) for value in values):
+            continue
+        yield line, dict(zip(header, values))
+
+
+def count_rows(path):
+    """Число строк с данными: для XLSX — по размеру листа, для CSV — отдельным проходом."""
+    if Path(path).suffix.lower() == ".xlsx":
+        book = load_workbook(path, read_only=True)
+        try:
+            max_row = book.active.max_row
+        finally:
+            book.close()
+        if max_row:
+            return max(0, max_row - 1)
+    return sum(1 for _ in read_rows(path))
+
+
+def _report(items, entries):
+    items.extend(entries[:max(0, MAX_REPORTED - len(items))])
+
+
+def _values(instance, names):
+    return {name: Work._meta.get_field(name).value_from_object(instance) for name in names}
+
+
+def _import_chunk(job, resource, chunk):
+    """Обработать пачку строк; возвращает (ошибки, изменения) для отчёта."""
+    names = list(dict.fromkeys(f.attribute for f in resource.get_import_fields() if f.attribute))
+    ids = set()
+    for _, row in chunk:
+        try:
+            ids.add(int(float(row.get("id") or 0)))
+        except (TypeError, ValueError):
+            pass
+    existing = Work.objects.in_bulk(ids - {0})
+
+    errors, diff, to_create, to_update, changed_fields = [], [], [], [], set()
+    for line, row in chunk:
+        row = dict(row)
+        resource.before_import_row(row)
+        try:
+            pk = int(float(row.get("id") or 0)) or None
+        except (TypeError, ValueError):
+            errors.append({"row": line, "errors": {"id": ["Ожидается число"]}})
+            continue
+        instance = existing.get(pk)
+        new = instance is None
+        if new:
+            instance = Work()
+        before = _values(instance, names)
+        try:
+            resource.import_instance(instance, row)
+            if instance.item_id is None:
+                raise ValidationError({"item": "Статья не указана"})
+            # внешние ключи уже проверил виджет (лишний запрос на строку не нужен),
+            # карты собирает before_import_row, и пустая {} для них допустима
+            instance.full_clean(exclude=CLEAN_EXCLUDE, validate_unique=False,
+                                validate_constraints=False)
+        except ValidationError as exc:
+            errors.append({"row": line, "id": pk, "errors": exc.message_dict})
+            if not new:
+                # тот же объект может встретиться в файле ещё раз
+                existing[pk] = Work.objects.get(pk=pk)
+            continue
+        after = _values(instance, names)
+        if new:
+            to_create.append(instance)
+            diff.append({"row": line, "id": pk, "action": "create",
+                         "values": {k: v for k, v in after.items() if v not in (None, "", {})}})
+            continue
+        changed = [name for name in names if before[name] != after[name]]
+        if not changed:
+            job.unchanged += 1
+            continue
+        changed_fields.update(changed)
+        if instance not in to_update:
+            to_update.append(instance)
+        diff.append({"row": line, "id": pk, "action": "update",
+                     "changes": {name: [before[name], after[name]] for name in changed}})
+
+    if not job.dry_run and (to_create or to_update):
+        now = timezone.now()
+        try:
+            with transaction.atomic(), batch_changes():
+                for work in to_create + to_update:
+                    work.updated_at = now
+                created = Work.objects.bulk_create(to_create)
+                if to_update:
+                    Work.objects.bulk_update(to_update, sorted(changed_fields) + ["updated_at"])
+                synced = created + (to_update if changed_fields & WorkMonthAmount.WORK_FIELDS else [])
+                WorkMonthAmount.sync(synced)
+                log_changes(created + to_update)
+        except DatabaseError as exc:
+            # записи пачки откатились (точка сохранения): ошибку получает каждая её строка
+            failed = {entry["row"] for entry in diff}
+            errors.extend({"row": line, "errors": {"__all__": [str(exc)]}}
+                          for line, _ in chunk if line in failed)
+            return errors, []
+        for entry, work in zip((e for e in diff if e["action"] == "create"), created):
+            entry["id"] = work.pk
+    job.created += len(to_create)
+    job.updated += len(to_update)
+    return errors, diff
+
+
+def _save(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=[
+        "status", "total", "processed", "created", "updated", "unchanged", "invalid",
+        "errors", "diff", "message", "started_at", "finished_at", "updated_at",
+    ])
+
+
+def run(job, progress=None):
+    """
+    Выполнить задачу импорта в текущем потоке. Задачу, которую уже
+    выполняет кто-то другой, не трогает. progress(доля) вызывается после
+    каждой пачки. Возвращает задачу.
+    """
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(pk=job.pk, status="pending").update(
+        status="running", started_at=now, updated_at=now,
+    )
+    job.refresh_from_db()
+    if not claimed:
+        return job
+    try:
+        path = job.file.path
+        if job.total is None:
+            _save(job, total=count_rows(path))
+        resource = _resource()
+        # продолжение прерванной задачи: обработанные пачки уже зафиксированы
+        rows = islice(read_rows(path), job.processed, None)
+        while chunk := list(islice(rows, CHUNK_SIZE)):
+            # записи пачки и processed фиксируются вместе: после сбоя пачка
+            # либо учтена целиком, либо будет выполнена заново с нуля
+            with transaction.atomic():
+                errors, diff = _import_chunk(job, resource, chunk)
+                job.invalid += len(errors)
+                _report(job.errors, errors)
+                _report(job.diff, diff)
+                _save(job, processed=job.processed + len(chunk))
+            if progress is not None and job.progress is not None:
+                progress(job.progress)
+    except Exception as exc:
+        logger.exception("Импорт %s не выполнен", job.pk)
+        # счётчики недоделанной пачки откатились вместе с её записями
+        job.refresh_from_db()
+        _save(job, status="failed", message=str(exc), finished_at=timezone.now())
+    else:
+        _save(job, status="done", total=job.processed, finished_at=timezone.now())
+    return job
+
+
+def start(job):
+    """Поставить импорт в очередь фоновых задач; выполнится после фиксации транзакции."""
+    return jobs.enqueue("import_works", user=job.user, import_id=job.pk)
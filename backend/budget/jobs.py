@@ -0,0 +1,268 @@
+"""
+Фоновые задачи без внешнего брокера: очередь — таблица Job.
+
+Тяжёлая работа (выгрузки, импорт, сводные отчёты, пересчёт итогов) не
+занимает воркер gunicorn на всё время выполнения. Запрос только ставит
+задачу (enqueue) и отвечает 202, а выполняет её manage.py run_workers —
+пул потоков или процессов рядом с веб-сервером:
+- claim забирает задачу условным UPDATE pending -> running, так что два
+  воркера одну задачу не получат;
+- пока обработчик работает, задача обновляет heartbeat_at; задачу без
+  пульса дольше JOB_STALE_SECONDS (процесс убит) requeue_stale возвращает
+  в очередь;
+- упавшая задача повторяется до max_attempts раз через
+  JOB_RETRY_DELAY·2^(попытка-1) секунд, потом остаётся failed с текстом ошибки;
+- результат — JSON в result и/или файл result_file; их отдаёт
+  GET /api/jobs/<id>/result/.
+
+Обработчик регистрируется декоратором register(kind) и получает задачу:
+параметры — job.params, прогресс — set_progress, файл результата
+сохраняется в job.result_file (save=False), возвращаемое значение
+становится job.result. С JOBS_IN_PROCESS задача сразу выполняется в
+потоке веб-процесса (runserver без отдельного воркера), повторы тогда
+забирает run_workers.
+"""
+import logging
+import os
+import socket
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import exports
+from .models import ImportJob, ItemQuarterRollup, Job, Work
+from .reports import build_summary
+from .snapshot import use_snapshot
+
+logger = logging.getLogger(__name__)
+
+# как часто обновлять progress при выгрузке (строк)
+PROGRESS_EVERY = 1000
+
+
+@dataclass(frozen=True)
+class Handler:
+    func: Callable
+    # право, нужное для постановки задачи через API
+    permission: str | None = None
+    # можно ли ставить задачу через POST /api/jobs/
+    api: bool = False
+    # проверка и приведение параметров из API; ValueError — ошибка запроса
+    clean: Callable | None = None
+    max_attempts: int | None = None
+
+
+HANDLERS = {}
+
+
+def register(kind, permission=None, api=False, clean=None, max_attempts=None):
+    def decorator(func):
+        HANDLERS[kind] = Handler(func, permission, api, clean, max_attempts)
+        return func
+
+    return decorator
+
+
+def worker_name(suffix=""):
+    return f"{socket.gethostname()}:{os.getpid()}{suffix}"
+
+
+def enqueue(kind, user=None, **params):
+    """Поставить задачу в очередь. Возвращает Job (status=pending)."""
+    handler = HANDLERS[kind]
+    job = Job.objects.create(
+        kind=kind, user=user, params=params,
+        max_attempts=handler.max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+    if settings.JOBS_IN_PROCESS:
+        transaction.on_commit(lambda: threading.Thread(
+            target=_run_inline, args=(job.pk,), name=f"job-{job.pk}", daemon=True,
+        ).start())
+    return job
+
+
+def claim(worker, pk=None):
+    """Забрать готовую к выполнению задачу (или задачу pk). None — забирать нечего."""
+    now = timezone.now()
+    ready = Job.objects.filter(status="pending", run_after__lte=now)
+    if pk is not None:
+        ready = ready.filter(pk=pk)
+    for candidate in ready.order_by("run_after", "pk").values_list("pk", flat=True)[:10]:
+        # условное обновление: задачу, которую успел забрать другой воркер, пропускаем
+        claimed = Job.objects.filter(pk=candidate, status="pending").update(
+            status="running", worker=worker, attempts=F("attempts") + 1,
+            started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=candidate)
+    return None
+
+
+def _heartbeat(job, stop):
+    try:
+        while not stop.wait(settings.JOB_HEARTBEAT_SECONDS):
+            Job.objects.filter(pk=job.pk, worker=job.worker, status="running").update(
+                heartbeat_at=timezone.now(),
+            )
+    finally:
+        connections.close_all()
+
+
+def set_progress(job, value):
+    job.progress = round(min(max(value, 0.0), 1.0), 4)
+    Job.objects.filter(pk=job.pk).update(progress=job.progress, heartbeat_at=timezone.now())
+
+
+def execute(job):
+    """Выполнить забранную задачу в текущем потоке. Возвращает задачу с итоговым статусом."""
+    handler = HANDLERS.get(job.kind)
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(job, stop), name=f"job-{job.pk}-heartbeat", daemon=True)
+    beat.start()
+    now = timezone.now
+    try:
+        if handler is None:
+            raise LookupError(f"Неизвестный вид задачи: {job.kind}")
+        result = handler.func(job)
+    except Exception as exc:
+        logger.exception("Задача %s (%s), попытка %s, не выполнена", job.pk, job.kind, job.attempts)
+        fields = {"error": str(exc) or type(exc).__name__, "worker": ""}
+        if handler is not None and job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            fields.update(status="pending", run_after=now() + timedelta(seconds=delay))
+        else:
+            fields.update(status="failed", finished_at=now())
+    else:
+        fields = {"status": "done", "result": result, "result_file": job.result_file.name or "",
+                  "progress": 1.0, "error": "", "finished_at": now()}
+    finally:
+        stop.set()
+        beat.join()
+    # задачу, которую сочли брошенной и отдали другому воркеру, не перезаписываем
+    updated = Job.objects.filter(pk=job.pk, worker=job.worker, attempts=job.attempts).update(**fields)
+    if not updated:
+        logger.warning("Задача %s уже выполняется другим воркером, результат отброшен", job.pk)
+        if job.result_file:
+            job.result_file.delete(save=False)
+    job.refresh_from_db()
+    return job
+
+
+def execute_pk(pk):
+    """execute для пула воркеров: принимает pk, отдаёт статус (годится и для процессов)."""
+    try:
+        return execute(Job.objects.get(pk=pk)).status
+    finally:
+        # у потока свои соединения с БД — закрываем их вместе с ним
+        connections.close_all()
+
+
+def _run_inline(pk):
+    try:
+        job = claim(worker_name(":inline"), pk=pk)
+        if job is not None:
+            execute(job)
+    finally:
+        connections.close_all()
+
+
+def requeue_stale():
+    """
+    Вернуть в очередь задачи, чей воркер перестал отвечать; исчерпавшие
+    попытки помечаются failed. Возвращает число таких задач.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status="running",
+                               heartbeat_at__lt=now - timedelta(seconds=settings.JOB_STALE_SECONDS))
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status="failed", worker="", error="Воркер перестал отвечать", finished_at=now,
+    )
+    return failed + stale.update(status="pending", worker="", run_after=now)
+
+
+# --- обработчики ---
+
+def _int(value, name, required=True):
+    if value in (None, "") and not required:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name}: ожидается целое число")
+
+
+@register("import_works")
+def import_works(job):
+    from .imports import run
+
+    imported = ImportJob.objects.get(pk=job.params["import_id"])
+    # повтор после сбоя продолжает импорт со следующей пачки строк
+    ImportJob.objects.filter(pk=imported.pk, status__in=("running", "failed")).update(status="pending")
+    imported.refresh_from_db()
+    imported = run(imported, progress=lambda value: set_progress(job, value))
+    if imported.status == "failed":
+        raise RuntimeError(imported.message)
+    return {"import_id": imported.pk, "created": imported.created, "updated": imported.updated,
+            "invalid": imported.invalid}
+
+
+def _clean_export(params):
+    file_format = params.get("format", "xlsx")
+    if file_format not in exports.STREAMED_FORMATS:
+        raise ValueError(f"format: один из {', '.join(exports.STREAMED_FORMATS)}")
+    fields = params.get("fields")
+    if fields is not None and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+        raise ValueError("fields: ожидается список имён колонок")
+    return {"year": _int(params.get("year"), "year"), "format": file_format, "fields": fields}
+
+
+def _tracked(job, rows_iter, total):
+    for index, row in enumerate(rows_iter):
+        if index and total and index % PROGRESS_EVERY == 0:
+            set_progress(job, index / total)
+        yield row
+
+
+@register("export_works", api=True, clean=_clean_export)
+def export_works(job):
+    from .admin import WorkResource  # admin импортирует модели и import_export
+
+    params = _clean_export(job.params)
+    with use_snapshot(), tempfile.TemporaryFile() as handle:
+        queryset = Work.objects.filter(year=params["year"]).order_by("pk")
+        total = queryset.count()
+        rows = _tracked(job, exports.rows(WorkResource(), queryset, params["fields"],
+                                          force_native_type=params["format"] == "xlsx"), total)
+        if params["format"] == "csv":
+            handle.writelines(exports.csv_lines(rows))
+            handle.seek(0)
+        else:
+            exports.write_xlsx(rows, handle)
+        filename = f"works-{params['year']}.{params['format']}"
+        job.result_file.save(filename, File(handle, filename), save=False)
+    return {"rows": total}
+
+
+def _clean_summary(params):
+    return {"year": _int(params.get("year"), "year"), "group": _int(params.get("group"), "group", required=False)}
+
+
+@register("summary_report", api=True, clean=_clean_summary)
+def summary_report(job):
+    params = _clean_summary(job.params)
+    with use_snapshot():
+        return build_summary(params["year"], params["group"])
+
+
+@register("rebuild_rollups", permission="budget.change_any_work", api=True, max_attempts=1)
+def rebuild_rollups(job):
+    with transaction.atomic():
+        return {"rows": ItemQuarterRollup.rebuild()}
@@ -0,0 +1,184 @@
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from budget import seeding
+from budget.admin import WorkResource
+from budget.models import QuarterReserve, Work
+
+
+class Command(BaseCommand):
+    help = (
+        "Замерить время основных запросов API на синтетических данных нескольких "
+        "масштабов и записать результаты в JSON. Каждый масштаб наполняется "
+        "seed_budget в отдельной временной базе SQLite. С --existing мерится текущая "
+        "база, и только запросы на чтение: она не меняется."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", nargs="+", default=["S", "M"], choices=sorted(seeding.SCALES),
+                            help="Масштабы из budget.seeding.SCALES.")
+        parser.add_argument("--seed", type=int, default=0, help="Зерно генератора данных.")
+        parser.add_argument("--repeat", type=int, default=5, help="Замеров на каждый запрос.")
+        parser.add_argument("--output", default=None, help="Файл для JSON (по умолчанию stdout).")
+        parser.add_argument("--existing", action="store_true",
+                            help="Не генерировать данные, а мерить текущую базу (масштаб «existing»); "
+                                 "запросы на запись пропускаются.")
+
+    def handle(self, *args, scales, seed, repeat, output, existing, **options):
+        if repeat < 1:
+            raise CommandError("--repeat должен быть не меньше 1")
+        results = []
+        # кэш ответов выключен: меряем построение ответа, а не чтение с диска;
+        # DEBUG выключен, чтобы журнал запросов не входил в замер
+        with override_settings(RESPONSE_CACHE_ENABLED=False, DEBUG=False, ALLOWED_HOSTS=["testserver"]):
+            if existing:
+                results.append(self.run_scale("existing", None, repeat, read_only=True))
+            else:
+                for scale in scales:
+                    results.append(self.run_seeded(scale, seed, repeat))
+
+        report = {"meta": self.meta(seed, repeat), "results": results}
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if output:
+            Path(output).write_text(text + "\n", encoding="utf-8")
+            for result in results:
+                for name, timing in result["endpoints"].items():
+                    self.stdout.write(
+                        f"{result['scale']:>8} {name:<16} median {timing['median_ms']:>9.2f} ms "
+                        f"queries {timing['queries']:>4} bytes {timing['bytes']}"
+                    )
+            self.stdout.write(self.style.SUCCESS(f"Результаты записаны в {output}"))
+        else:
+            self.stdout.write(text)
+
+    def run_seeded(self, scale, seed, repeat):
+        params = seeding.SCALES[scale]
+        with tempfile.TemporaryDirectory(prefix="budget-bench-") as tmp:
+            # отдельный файл базы на каждый масштаб: одинаковые стартовые условия
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = str(Path(tmp) / "bench.sqlite3")
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                started = time.perf_counter()
+                counts = seeding.generate(
+                    seed, start_year=timezone.now().year - params["years"] + 1, **params,
+                )
+                seed_seconds = round(time.perf_counter() - started, 3)
+                result = self.run_scale(scale, counts, repeat)
+                result["params"] = params
+                result["seed_seconds"] = seed_seconds
+                return result
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_scale(self, scale, counts, repeat, read_only=False):
+        User = get_user_model()
+        if read_only:
+            # несохранённый суперпользователь: в рабочей базе не появляется учётная запись
+            user = User(username="bench", is_superuser=True, is_staff=True, is_active=True)
+        else:
+            user = User.objects.create_superuser("bench", password=None)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        work = Work.objects.order_by("-year", "id").first()
+        reserve = QuarterReserve.objects.order_by("-year", "id").first()
+        if work is None or reserve is None:
+            raise CommandError("В базе нет работ или резервов — нечего мерить")
+        year = work.year
+        amounts = iter(range(1, 10 ** 6))
+
+        endpoints = {
+            "items": lambda: client.get(f"/api/items/?year={year}", HTTP_ACCEPT="application/json"),
+            "items_sparse": lambda: client.get(
+                f"/api/items/?year={year}&fields=id,name,works.name,works.accruals,works.payments&expand=",
+                HTTP_ACCEPT="application/json",
+            ),
+            "works_list": lambda: client.get("/api/works/", HTTP_ACCEPT="application/json"),
+            "works_retrieve": lambda: client.get(f"/api/works/{work.id}/", HTTP_ACCEPT="application/json"),
+            "works_update": lambda: client.patch(
+                f"/api/works/{work.id}/", {"payments": {"Дек": next(amounts)}}, format="json",
+            ),
+            "write_off": lambda: client.post(
+                f"/api/reserves/{reserve.id}/write_off/", {"acc": "0.01", "pay": "0.01"}, format="json",
+            ),
+            "admin_export": self.export_works,
+        }
+        if read_only:
+            del endpoints["works_update"], endpoints["write_off"]
+        return {
+            "scale": scale,
+            "counts": counts,
+            "endpoints": {name: self.measure(name, call, repeat) for name, call in endpoints.items()},
+        }
+
+    @staticmethod
+    def export_works():
+        """Экспорт работ в xlsx, как кнопка «Экспорт» в админке."""
+        return WorkResource().export(queryset=Work.objects.all()).export("xlsx")
+
+    def measure(self, name, call, repeat):
+        # первый вызов прогревает кэши и заодно считает запросы
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            size = self.consume(name, call())
+        # captured_queries читается из журнала, который следующий запрос очистит
+        queries = len(ctx.captured_queries)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self.consume(name, call())
+            timings.append((time.perf_counter() - started) * 1000)
+        return {
+            "min_ms": round(min(timings), 2),
+            "median_ms": round(statistics.median(timings), 2),
+            "mean_ms": round(statistics.fmean(timings), 2),
+            "max_ms": round(max(timings), 2),
+            "queries": queries,
+            "bytes": size,
+        }
+
+    @staticmethod
+    def consume(name, response):
+        """Дочитать ответ (в том числе потоковый) и вернуть его размер."""
+        if isinstance(response, bytes):
+            return len(response)
+        if response.status_code >= 300:
+            raise CommandError(f"{name}: HTTP {response.status_code} {response.content[:200]!r}")
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+
+    @staticmethod
+    def meta(seed, repeat):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                cwd=Path(__file__).resolve().parent, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            "created_at": timezone.now().isoformat(),
+            "commit": commit,
+            "seed": seed,
+            "repeat": repeat,
+            "python": sys.version.split()[0],
+            "django": django.get_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        }
@@ -0,0 +1,174 @@
+import json
+import multiprocessing
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from budget import seeding
+from budget.models import Work
+
+# профили соединения: «default» — как было до настройки (журнал отката,
+# отложенные транзакции, новое соединение на запрос), «tuned» — из settings
+PROFILES = {
+    "default": {"journal_mode": "DELETE", "OPTIONS": {}, "CONN_MAX_AGE": 0},
+    "tuned": {"journal_mode": "WAL", "OPTIONS": None, "CONN_MAX_AGE": None},
+}
+
+
+def _percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * share))], 2)
+
+
+def _worker(seconds, write_ratio, seed, work_ids, year, user_id, results):
+    """Процесс-воркер: смесь чтений items/ и записей PATCH works/ до истечения времени."""
+    connections.close_all()
+    rng = random.Random(seed)
+    user = get_user_model().objects.get(pk=user_id)
+    client = APIClient()
+    client.force_authenticate(user)
+    stats = {"read": [], "write": [], "locked": 0, "errors": 0}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        kind = "write" if rng.random() < write_ratio else "read"
+        started = time.perf_counter()
+        try:
+            if kind == "write":
+                response = client.patch(
+                    f"/api/works/{rng.choice(work_ids)}/",
+                    {"payments": {"Дек": rng.randrange(1, 10 ** 6)}}, format="json",
+                )
+            else:
+                response = client.get(f"/api/items/?year={year}", HTTP_ACCEPT="application/json")
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            if response.status_code >= 300:
+                stats["errors"] += 1
+                continue
+            stats[kind].append((time.perf_counter() - started) * 1000)
+        except OperationalError as exc:
+            if "locked" not in str(exc):
+                raise
+            stats["locked"] += 1
+        finally:
+            # как после ответа в gunicorn: закрыть соединение, если CONN_MAX_AGE истёк
+            close_old_connections()
+    connections.close_all()
+    results.put(stats)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пропускная способность чтения/записи при нескольких процессах на одной "
+        "базе SQLite: профиль по умолчанию против настроенного (WAL, pragmas, "
+        "BEGIN IMMEDIATE, постоянные соединения). Данные — seed_budget во "
+        "временной базе; рабочая база не меняется."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=5, help="Число процессов (как gunicorn --workers).")
+        parser.add_argument("--seconds", type=float, default=5, help="Длительность замера на профиль.")
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="Доля запросов на запись.")
+        parser.add_argument("--scale", default="S", choices=sorted(seeding.SCALES), help="Масштаб данных.")
+        parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default=None, help="Файл для JSON (по умолчанию stdout).")
+
+    def handle(self, *args, workers, seconds, write_ratio, scale, profiles, seed, output, **options):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("Нужен start method fork (Linux)")
+        report = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "workers": workers, "seconds": seconds, "write_ratio": write_ratio,
+                "scale": scale, "seed": seed,
+            },
+            "results": {},
+        }
+        with override_settings(RESPONSE_CACHE_ENABLED=False, SERVER_TIMING=False,
+                               DEBUG=False, ALLOWED_HOSTS=["testserver"]):
+            for name in profiles:
+                report["results"][name] = self.run_profile(name, workers, seconds, write_ratio, scale, seed)
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if output:
+            Path(output).write_text(text + "\n", encoding="utf-8")
+            self.stdout.write(self.style.SUCCESS(f"Результаты записаны в {output}"))
+        for name, result in report["results"].items():
+            self.stdout.write(
+                f"{name:>8}: чтений {result['reads_per_s']:.1f}/с, записей {result['writes_per_s']:.1f}/с, "
+                f"locked {result['locked']}, ошибок {result['errors']}"
+            )
+        if not output:
+            self.stdout.write(text)
+
+    def run_profile(self, name, workers, seconds, write_ratio, scale, seed):
+        profile = PROFILES[name]
+        db = connection.settings_dict
+        saved = {key: db[key] for key in ("OPTIONS", "CONN_MAX_AGE")}
+        with tempfile.TemporaryDirectory(prefix="budget-bench-sqlite-") as tmp:
+            db.setdefault("TEST", {})["NAME"] = str(Path(tmp) / "bench.sqlite3")
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                params = seeding.SCALES[scale]
+                seeding.generate(seed, start_year=timezone.now().year - params["years"] + 1, **params)
+                user = get_user_model().objects.create_superuser("bench", password=None)
+                work_ids = list(Work.objects.values_list("id", flat=True))
+                year = Work.objects.order_by("-year").values_list("year", flat=True).first()
+                connection.close()
+
+                # профиль действует на все новые соединения, в том числе в воркерах
+                if profile["OPTIONS"] is not None:
+                    db["OPTIONS"] = profile["OPTIONS"]
+                if profile["CONN_MAX_AGE"] is not None:
+                    db["CONN_MAX_AGE"] = profile["CONN_MAX_AGE"]
+                with connection.cursor() as cursor:
+                    cursor.execute(f"PRAGMA journal_mode={profile['journal_mode']}")
+                connection.close()
+
+                ctx = multiprocessing.get_context("fork")
+                results = ctx.Queue()
+                procs = [
+                    ctx.Process(target=_worker, args=(seconds, write_ratio, seed + n,
+                                                      work_ids, year, user.pk, results))
+                    for n in range(workers)
+                ]
+                for proc in procs:
+                    proc.start()
+                collected = [results.get(timeout=seconds + 120) for _ in procs]
+                for proc in procs:
+                    proc.join()
+            finally:
+                db.update(saved)
+                connection.close()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        reads = [t for s in collected for t in s["read"]]
+        writes = [t for s in collected for t in s["write"]]
+        return {
+            "reads": len(reads),
+            "writes": len(writes),
+            "reads_per_s": round(len(reads) / seconds, 1),
+            "writes_per_s": round(len(writes) / seconds, 1),
+            "read_p50_ms": _percentile(reads, 0.5),
+            "read_p95_ms": _percentile(reads, 0.95),
+            "write_p50_ms": _percentile(writes, 0.5),
+            "write_p95_ms": _percentile(writes, 0.95),
+            "write_mean_ms": round(statistics.fmean(writes), 2) if writes else None,
+            "locked": sum(s["locked"] for s in collected),
+            "errors": sum(s["errors"] for s in collected),
+            "journal_mode": profile["journal_mode"],
+            "options": db["OPTIONS"] if profile["OPTIONS"] is None else profile["OPTIONS"],
+            "conn_max_age": db["CONN_MAX_AGE"] if profile["CONN_MAX_AGE"] is None else profile["CONN_MAX_AGE"],
+        }
@@ -0,0 +1,28 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from budget.storage import ContentAddressedStorage
+from budget.transfers import file_fields
+
+
+class Command(BaseCommand):
+    help = (
+        "Перенести файлы, сохранённые до хранилища по содержимому, в blobs/: "
+        "имена остаются прежними, одинаковые файлы остаются на диске в одном экземпляре."
+    )
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("Хранилище по умолчанию не budget.storage.ContentAddressedStorage")
+        adopted = freed = 0
+        for model, field in file_fields():
+            names = (model._default_manager.exclude(**{field: ""})
+                     .values_list(field, flat=True).distinct().iterator())
+            for name in names:
+                result = default_storage.adopt(name)
+                if result is not None:
+                    adopted += 1
+                    freed += result
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено файлов: {adopted}, освобождено {freed} байт на дубликатах"
+        ))
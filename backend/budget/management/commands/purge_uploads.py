@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from budget import uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Удалить брошенные сессии загрузки частями (без новых частей дольше "
+        "--hours часов) и файлы частей без сессии."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=None,
+                            help="Срок жизни сессии (по умолчанию settings.UPLOAD_SESSION_HOURS).")
+
+    def handle(self, *args, hours, **options):
+        sessions, files = uploads.purge(hours)
+        self.stdout.write(self.style.SUCCESS(f"Удалено сессий: {sessions}, файлов без сессии: {files}"))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from budget.models import ItemQuarterRollup
+
+
+class Command(BaseCommand):
+    help = "Пересчитать итоги ItemQuarterRollup с нуля или сверить их с исходными данными."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сверить текущие итоги с пересчётом, ничего не меняя.",
+        )
+
+    def handle(self, *args, verify=False, **options):
+        if verify:
+            self.verify()
+            return
+        with transaction.atomic():
+            count = ItemQuarterRollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Итоги пересчитаны: {count} строк"))
+
+    def verify(self):
+        expected = ItemQuarterRollup.compute()
+        fields = ItemQuarterRollup.AMOUNT_FIELDS + tuple(ItemQuarterRollup.RESERVE_FIELDS)
+        stored = {
+            (r.item_id, r.year, r.quarter, r.month): r
+            for r in ItemQuarterRollup.objects.all()
+        }
+        mismatches = []
+        for key in sorted(set(expected) | set(stored)):
+            want = expected.get(key, {})
+            row = stored.get(key)
+            for field in fields:
+                have = getattr(row, field) if row else 0
+                if (want.get(field) or 0) != (have or 0):
+                    mismatches.append(f"{key} {field}: ожидалось {want.get(field) or 0}, в таблице {have}")
+        for line in mismatches:
+            self.stdout.write(line)
+        if mismatches:
+            raise CommandError(f"Расхождений: {len(mismatches)}. Запустите rebuild_rollups без --verify.")
+        self.stdout.write(self.style.SUCCESS(f"Итоги сходятся: {len(stored)} строк"))
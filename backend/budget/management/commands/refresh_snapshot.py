@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from budget import snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновить снимок базы для отчётов (онлайн-бэкап SQLite) один раз "
+        "или в цикле с --interval — например, отдельным процессом рядом с gunicorn."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=None,
+                            help="Обновлять каждые N секунд, пока процесс не остановят.")
+        parser.add_argument("--age", action="store_true", help="Только показать возраст снимка.")
+
+    def handle(self, *args, interval, age, **options):
+        if not snapshot.enabled():
+            raise CommandError("Снимок для отчётов выключен (REPORTING_SNAPSHOT=0)")
+        if age:
+            current = snapshot.age()
+            self.stdout.write("снимка нет" if current is None else f"возраст {current:.0f} с")
+            return
+        while True:
+            started = time.perf_counter()
+            snapshot.refresh()
+            self.stdout.write(
+                f"{snapshot.snapshot_path()}: {snapshot.snapshot_path().stat().st_size} байт "
+                f"за {time.perf_counter() - started:.2f} с"
+            )
+            if interval is None:
+                break
+            close_old_connections()
+            time.sleep(interval)
+        self.stdout.write(self.style.SUCCESS("Снимок обновлён"))
@@ -0,0 +1,53 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from budget.models import Work
+from budget.rollover import rollover
+
+
+def _decimal(value):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(value)
+
+
+class Command(BaseCommand):
+    help = (
+        "Перенести бюджет на новый год: скопировать работы года с плановыми картами "
+        "и резервы их статей в целевой год. Факт, детали и материалы не копируются; "
+        "уже перенесённые работы и резервы пропускаются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source_year", type=int, help="Год, из которого копировать.")
+        parser.add_argument("target_year", type=int, help="Год, в который копировать.")
+        parser.add_argument("--item", type=int, action="append", dest="items",
+                            help="Только работы статьи (можно несколько раз).")
+        parser.add_argument("--group", type=int, action="append", dest="groups",
+                            help="Только работы статей группы (можно несколько раз).")
+        parser.add_argument("--shift", type=int, default=0,
+                            help="Сдвинуть плановые месяцы на N (отрицательное — раньше).")
+        parser.add_argument("--scale", type=_decimal, default=Decimal(1),
+                            help="Умножить плановые суммы и резервы, например 1.05.")
+        parser.add_argument("--no-reserves", action="store_true", help="Не копировать резервы.")
+
+    def handle(self, *args, source_year, target_year, items, groups, shift, scale, no_reserves, **options):
+        if source_year == target_year:
+            raise CommandError("Исходный и целевой год совпадают")
+        if not -11 <= shift <= 11:
+            raise CommandError("--shift: от -11 до 11 месяцев")
+        if scale < 0:
+            raise CommandError("--scale не может быть отрицательным")
+        works = Work.objects.filter(year=source_year)
+        if items:
+            works = works.filter(item_id__in=items)
+        if groups:
+            works = works.filter(item__group_id__in=groups)
+        result = rollover(works, target_year, shift=shift, scale=scale, reserves=not no_reserves)
+        self.stdout.write(self.style.SUCCESS(
+            f"{source_year} → {target_year}: работ скопировано {result.works} "
+            f"(уже были {result.skipped_works}), резервов {result.reserves} "
+            f"(уже были {result.skipped_reserves})"
+        ))
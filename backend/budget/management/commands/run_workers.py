@@ -0,0 +1,76 @@
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from budget import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполнять фоновые задачи (budget.jobs) пулом потоков или процессов, пока "
+        "процесс не остановят. По SIGTERM новые задачи не берутся, начатые доделываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Задач одновременно (по умолчанию JOB_WORKERS).")
+        parser.add_argument("--processes", action="store_true",
+                            help="Пул процессов вместо потоков: для задач, упирающихся в CPU.")
+        parser.add_argument("--poll", type=float, default=1.0,
+                            help="Пауза между проверками очереди, секунд.")
+        parser.add_argument("--once", action="store_true",
+                            help="Выполнить готовые задачи и выйти.")
+
+    def handle(self, *args, workers, processes, poll, once, **options):
+        workers = workers or settings.JOB_WORKERS
+        worker = jobs.worker_name()
+        if processes:
+            # spawn: дочерний процесс не наследует соединения с БД родителя
+            executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=django.setup)
+        else:
+            executor = ThreadPoolExecutor(workers, thread_name_prefix="job")
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.set())
+        self.stdout.write(f"Воркер {worker}: {workers} {'процессов' if processes else 'потоков'}")
+
+        running, checked_at = {}, 0.0
+        with executor:
+            while not stopping.is_set():
+                if time.monotonic() - checked_at >= settings.JOB_HEARTBEAT_SECONDS:
+                    checked_at = time.monotonic()
+                    requeued = jobs.requeue_stale()
+                    if requeued:
+                        self.stdout.write(f"Брошенных задач возвращено в очередь: {requeued}")
+                for future in [f for f in running if f.done()]:
+                    self.report(running.pop(future), future)
+                claimed = 0
+                while len(running) < workers and (job := jobs.claim(worker)) is not None:
+                    running[executor.submit(jobs.execute_pk, job.pk)] = job
+                    claimed += 1
+                if once and not running and not claimed:
+                    break
+                close_old_connections()
+                if not claimed:
+                    stopping.wait(poll)
+            if stopping.is_set():
+                self.stdout.write("Остановка: доделываются начатые задачи")
+            # выход из with ждёт начатые задачи
+        for future, job in running.items():
+            self.report(job, future)
+
+    def report(self, job, future):
+        try:
+            status = future.result()
+        except Exception as exc:
+            self.stderr.write(f"{job.kind} #{job.pk}: {exc}")
+        else:
+            self.stdout.write(f"{job.kind} #{job.pk}: {status}")
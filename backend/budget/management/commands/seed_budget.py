@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from budget import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполнить базу синтетическими данными для замеров: группы, статьи, работы "
+        "с помесячными картами, детали, резервы и заглушки материалов. "
+        "Одинаковые --seed и параметры дают одинаковую базу; прежние синтетические "
+        "данные (группы с кодом seed-*) удаляются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=sorted(seeding.SCALES),
+                            help="Готовый масштаб; отдельные параметры ниже его уточняют.")
+        parser.add_argument("--groups", type=int, help="Число групп.")
+        parser.add_argument("--items", type=int, help="Статей в группе.")
+        parser.add_argument("--works", type=int, help="Работ в статье на каждый год.")
+        parser.add_argument("--years", type=int, help="Число лет.")
+        parser.add_argument("--start-year", type=int, default=None,
+                            help="Первый год (по умолчанию так, чтобы последним был текущий).")
+        parser.add_argument("--users", type=int, default=10, help="Число ответственных.")
+        parser.add_argument("--detail-share", type=float, default=0.3,
+                            help="Доля фактических месяцев с деталями оплаты/начисления.")
+        parser.add_argument("--materials", type=int, default=1,
+                            help="Максимум материалов на работу и отчётов на статью.")
+        parser.add_argument("--seed", type=int, default=0, help="Зерно генератора.")
+        parser.add_argument("--clear", action="store_true",
+                            help="Только удалить синтетические данные.")
+
+    def handle(self, *args, scale, start_year, seed, clear, **options):
+        if clear:
+            seeding.clear()
+            self.stdout.write(self.style.SUCCESS("Синтетические данные удалены"))
+            return
+        params = dict(seeding.SCALES[scale or "S"])
+        for name in ("groups", "items", "works", "years"):
+            if options[name] is not None:
+                params[name] = options[name]
+        if start_year is None:
+            start_year = timezone.now().year - params["years"] + 1
+
+        counts = seeding.generate(
+            seed, start_year=start_year, users=options["users"],
+            detail_share=options["detail_share"], materials=options["materials"], **params,
+        )
+        self.stdout.write(", ".join(f"{name}={count}" for name, count in counts.items()))
+        self.stdout.write(self.style.SUCCESS("Данные созданы"))
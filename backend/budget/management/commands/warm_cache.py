@@ -0,0 +1,69 @@
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from budget import cache as response_cache
+from budget.views import BudgetItemViewSet, ReserveViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогреть общий кэш ответов items/ и reserves/ после деплоя "
+        "или вывести счётчики попаданий/промахов."
+    )
+
+    def add_arguments(self, parser):
+        year = timezone.now().year
+        parser.add_argument(
+            "--years", nargs="+", type=int, default=[year - 1, year],
+            help="Годы для прогрева (по умолчанию прошлый и текущий).",
+        )
+        parser.add_argument(
+            "--base-url", default=None,
+            help="Адрес сайта, как его видят клиенты (ссылки на файлы в ответе зависят от хоста).",
+        )
+        parser.add_argument("--stats", action="store_true", help="Только показать счётчики.")
+        parser.add_argument("--reset-stats", action="store_true", help="Обнулить счётчики.")
+
+    def handle(self, *args, years, base_url, stats, reset_stats, **options):
+        if not response_cache.enabled():
+            raise CommandError("Кэш ответов выключен (RESPONSE_CACHE=0 или нет CACHES['responses'])")
+        if reset_stats:
+            response_cache.reset_stats()
+        if stats or reset_stats:
+            self.stdout.write(", ".join(f"{k}={v}" for k, v in response_cache.stats().items()))
+            return
+
+        user = get_user_model().objects.filter(is_superuser=True, is_active=True).first()
+        if user is None:
+            raise CommandError("Нужен активный суперпользователь, от имени которого строятся ответы")
+
+        if base_url is None:
+            host = next((h for h in settings.ALLOWED_HOSTS if h and "*" not in h), "localhost")
+            base_url = f"{'http' if settings.DEBUG else 'https'}://{host.lstrip('.')}"
+        parts = urlsplit(base_url)
+        factory = APIRequestFactory(
+            HTTP_HOST=parts.netloc,
+            SERVER_PORT="443" if parts.scheme == "https" else "80",
+            **({"wsgi.url_scheme": "https"} if parts.scheme == "https" else {}),
+        )
+
+        targets = [(BudgetItemViewSet, "/api/items/"), (ReserveViewSet, "/api/reserves/")]
+        for viewset, path in targets:
+            view = viewset.as_view({"get": "list"})
+            for params in [{}] + [{"year": y} for y in years]:
+                request = factory.get(path, params, secure=parts.scheme == "https")
+                force_authenticate(request, user=user)
+                response = view(request)
+                if response.streaming:
+                    # потоковый ответ попадает в кэш, только когда прочитан целиком
+                    for _ in response.streaming_content:
+                        pass
+                self.stdout.write(
+                    f"{path} {params or ''}: {response.status_code} {response.get('X-Cache', '-')}"
+                )
+        self.stdout.write(self.style.SUCCESS("Кэш прогрет"))
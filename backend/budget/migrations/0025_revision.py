@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0024_changelog_work_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Revision',
+            fields=[
+                ('scope', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Область')),
+                ('value', models.PositiveBigIntegerField(default=0, verbose_name='Ревизия')),
+            ],
+            options={
+                'verbose_name': 'Ревизия',
+                'verbose_name_plural': 'Ревизии',
+            },
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:57
+
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+MONTHS = ["Янв", "Фев", "Мар", "Апр", "Май", "Июн",
+          "Июл", "Авг", "Сен", "Окт", "Ноя", "Дек"]
+SOURCE_FIELDS = {
+    "accruals": "plan_acc",
+    "payments": "plan_pay",
+    "actual_accruals": "fact_acc",
+    "actual_payments": "fact_pay",
+}
+
+
+def parse_value(value):
+    status = ""
+    if isinstance(value, dict):
+        status = value.get("status") or ""
+        value = value.get("amount")
+    try:
+        amount = Decimal(str(value)) if value not in (None, "") else Decimal(0)
+    except InvalidOperation:
+        amount = Decimal(0)
+    if not amount.is_finite():
+        amount = Decimal(0)
+    return amount, str(status)[:20]
+
+
+def fill_month_amounts(apps, schema_editor):
+    Work = apps.get_model("budget", "Work")
+    WorkMonthAmount = apps.get_model("budget", "WorkMonthAmount")
+    batch = []
+    works = Work.objects.values_list("id", "year", *SOURCE_FIELDS).iterator(chunk_size=500)
+    for work_id, year, *maps in works:
+        for kind, data in zip(SOURCE_FIELDS.values(), maps):
+            if not isinstance(data, dict):
+                continue
+            for month, value in data.items():
+                if month not in MONTHS:
+                    continue
+                amount, status = parse_value(value)
+                batch.append(WorkMonthAmount(
+                    work_id=work_id, year=year, month=MONTHS.index(month) + 1,
+                    kind=kind, amount=amount, status=status,
+                ))
+        if len(batch) >= 1000:
+            WorkMonthAmount.objects.bulk_create(batch)
+            batch = []
+    WorkMonthAmount.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0025_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkMonthAmount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Месяц')),
+                ('kind', models.CharField(choices=[('plan_acc', 'План Н'), ('plan_pay', 'План О'), ('fact_acc', 'Факт Н'), ('fact_pay', 'Факт О')], max_length=8, verbose_name='Вид')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма')),
+                ('status', models.CharField(blank=True, max_length=20, verbose_name='Статус')),
+                ('work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_amounts', to='budget.work', verbose_name='Работа')),
+            ],
+            options={
+                'verbose_name': 'Сумма работы за месяц',
+                'verbose_name_plural': 'Суммы работ по месяцам',
+                'indexes': [models.Index(fields=['year', 'kind', 'month'], name='budget_work_year_cceeec_idx')],
+                'unique_together': {('work', 'kind', 'month')},
+            },
+        ),
+        migrations.RunPython(fill_month_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+
+RESERVE_FIELDS = {
+    "reserve_acc": "accrual_sum",
+    "reserve_pay": "payment_sum",
+    "reserve_used_acc": "used_acc",
+    "reserve_used_pay": "used_pay",
+}
+
+
+def fill_month_amount_items(apps, schema_editor):
+    Work = apps.get_model("budget", "Work")
+    WorkMonthAmount = apps.get_model("budget", "WorkMonthAmount")
+    WorkMonthAmount.objects.update(
+        item_id=Subquery(Work.objects.filter(pk=OuterRef("work_id")).values("item_id")[:1])
+    )
+
+
+def fill_rollups(apps, schema_editor):
+    WorkMonthAmount = apps.get_model("budget", "WorkMonthAmount")
+    QuarterReserve = apps.get_model("budget", "QuarterReserve")
+    ItemQuarterRollup = apps.get_model("budget", "ItemQuarterRollup")
+    rows = {}
+    amounts = (
+        WorkMonthAmount.objects.exclude(status="перенос")
+        .values("item_id", "year", "month", "kind")
+        .annotate(total=Sum("amount"))
+        .values_list("item_id", "year", "month", "kind", "total")
+        .order_by()
+    )
+    for item_id, year, month, kind, total in amounts:
+        if total:
+            key = (item_id, year, (month - 1) // 3 + 1, month)
+            rows.setdefault(key, {})[kind] = total
+    for reserve in QuarterReserve.objects.all():
+        rows[(reserve.item_id, reserve.year, reserve.quarter, 0)] = {
+            f: getattr(reserve, src) for f, src in RESERVE_FIELDS.items()
+        }
+    ItemQuarterRollup.objects.bulk_create(
+        [
+            ItemQuarterRollup(item_id=item_id, year=year, quarter=quarter, month=month, **fields)
+            for (item_id, year, quarter, month), fields in rows.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0026_workmonthamount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workmonthamount',
+            name='item',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='budget.budgetitem', verbose_name='Статья бюджета'),
+        ),
+        migrations.RunPython(fill_month_amount_items, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='workmonthamount',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='budget.budgetitem', verbose_name='Статья бюджета'),
+        ),
+        migrations.CreateModel(
+            name='ItemQuarterRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('quarter', models.PositiveSmallIntegerField(verbose_name='Квартал')),
+                ('month', models.PositiveSmallIntegerField(help_text='0 — строка резерва квартала', verbose_name='Месяц')),
+                ('plan_acc', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='План Н')),
+                ('plan_pay', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='План О')),
+                ('fact_acc', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Факт Н')),
+                ('fact_pay', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Факт О')),
+                ('reserve_acc', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Резерв Н')),
+                ('reserve_pay', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Резерв О')),
+                ('reserve_used_acc', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Освоено резерва Н')),
+                ('reserve_used_pay', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Освоено резерва О')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='budget.budgetitem', verbose_name='Статья бюджета')),
+            ],
+            options={
+                'verbose_name': 'Итог статьи за период',
+                'verbose_name_plural': 'Итоги статей по периодам',
+                'indexes': [models.Index(fields=['year', 'quarter'], name='budget_item_year_cfcb6a_idx')],
+                'unique_together': {('item', 'year', 'quarter', 'month')},
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,41 @@
+import uuid
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import Round
+from django.db.models.lookups import LessThanOrEqual
 from django.utils import timezone
 from django.conf import settings
 
+# Ключи помесячных JSON-карт (accruals, payments, ...) в порядке года
+MONTHS = ["Янв", "Фев", "Мар", "Апр", "Май", "Июн",
+          "Июл", "Авг", "Сен", "Окт", "Ноя", "Дек"]
+
+
+def month_quarter(month):
+    """Номер квартала (1–4) для ключа месяца из MONTHS."""
+    return MONTHS.index(month) // 3 + 1
+
+
+def parse_month_value(value):
+    """
+    Значение месяца из JSON-карты -> (сумма, статус).
+    Поддерживаются оба формата: 1200 и {"amount": 1200, "status": "действ"}.
+    """
+    status = ""
+    if isinstance(value, dict):
+        status = value.get("status") or ""
+        value = value.get("amount")
+    try:
+        amount = Decimal(str(value)) if value not in (None, "") else Decimal(0)
+    except InvalidOperation:
+        amount = Decimal(0)
+    if not amount.is_finite():
+        amount = Decimal(0)
+    return amount, str(status)
+
 class WorkQuerySet(models.QuerySet):
     """QuerySet for Work model to prefetch related detail records."""
     def with_details(self):
@@ -10,6 +44,59 @@ class WorkQuerySet(models.QuerySet):
             'accrual_details',
         )
 
+def _cents(expression):
+    # в SQLite DecimalField — REAL: 0.1 + 0.2 > 0.3, поэтому остаток
+    # сравнивается в целых копейках
+    return Round(expression * 100)
+
+
+def _fits(used, total, amount):
+    """Условие «used + amount <= total» в копейках."""
+    cents = int((Decimal(amount) * 100).to_integral_value())
+    return LessThanOrEqual(_cents(models.F(used)) + cents, _cents(models.F(total)))
+
+
+class QuarterReserveQuerySet(models.QuerySet):
+    """QuerySet for QuarterReserve with race-free write-offs."""
+    def write_off(self, acc, pay):
+        """
+        Списать суммы одним условным UPDATE (used + x <= sum).
+        Строки, где остатка не хватает, не меняются; возвращает число списанных.
+        """
+        return self.filter(
+            _fits("used_acc", "accrual_sum", acc),
+            _fits("used_pay", "payment_sum", pay),
+        ).update(
+            used_acc=Round(models.F("used_acc") + acc, 2),
+            used_pay=Round(models.F("used_pay") + pay, 2),
+            updated_at=timezone.now(),
+        )
+
+    def write_off_many(self, amounts):
+        """
+        amounts: {(item_id, year, quarter): (acc, pay)}.
+        Списать по всем кварталам одним условным UPDATE; возвращает число
+        списанных строк — меньше len(amounts), если где-то не хватило остатка.
+        """
+        if not amounts:
+            return 0
+        match = models.Q()
+        used_acc, used_pay = [], []
+        for (item_id, year, quarter), (acc, pay) in amounts.items():
+            key = models.Q(item_id=item_id, year=year, quarter=quarter)
+            match |= key & models.Q(
+                _fits("used_acc", "accrual_sum", acc),
+                _fits("used_pay", "payment_sum", pay),
+            )
+            used_acc.append(models.When(key, then=Round(models.F("used_acc") + acc, 2)))
+            used_pay.append(models.When(key, then=Round(models.F("used_pay") + pay, 2)))
+        field = self.model._meta.get_field
+        return self.filter(match).update(
+            used_acc=models.Case(*used_acc, default=models.F("used_acc"), output_field=field("used_acc")),
+            used_pay=models.Case(*used_pay, default=models.F("used_pay"), output_field=field("used_pay")),
+            updated_at=timezone.now(),
+        )
+
 class Group(models.Model):
     """Справочник групп статей бюджета."""
     code = models.CharField("Код группы", max_length=50, unique=True)
@@ -203,6 +290,7 @@ class Work(models.Model):
         choices=FEASIBILITY_CHOICES,
         default='green',
     )
+    updated_at = models.DateTimeField("Изменено", auto_now=True)
 
     class Meta:
         permissions = [
@@ -214,6 +302,14 @@ class Work(models.Model):
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # год на момент загрузки: при переносе работы в другой год
+        # журнал и ревизии должны затронуть оба года
+        instance._loaded_year = instance.__dict__.get("year")
+        return instance
 # --- PaymentDetail model ---
 class PaymentDetail(models.Model):
     """Дополнительные детали фактических оплат для работы"""
@@ -301,6 +397,7 @@ class PaymentDetail(models.Model):
         "Корректировка",
         default=False
     )
+    updated_at = models.DateTimeField("Изменено", auto_now=True)
 
     class Meta:
         verbose_name = "Деталь оплаты"
@@ -362,6 +459,7 @@ class AccrualDetail(models.Model):
         "Корректировка",
         default=False
     )
+    updated_at = models.DateTimeField("Изменено", auto_now=True)
 
     class Meta:
         verbose_name = "Деталь начисления"
@@ -374,6 +472,278 @@ class AccrualDetail(models.Model):
     def __str__(self):
         return f"{self.work} [{self.month}] {self.amount}"
 
+class WorkMonthAmount(models.Model):
+    """
+    Помесячные суммы работы в нормализованном виде — по строке на
+    (работа, вид, месяц). Зеркало JSON-карт Work: API по-прежнему отдаёт
+    карты, а таблица нужна для индексируемых фильтров и агрегатов.
+    Синхронизируется в WorkMonthAmount.sync() при каждом сохранении работы.
+    """
+    PLAN_ACC = "plan_acc"
+    PLAN_PAY = "plan_pay"
+    FACT_ACC = "fact_acc"
+    FACT_PAY = "fact_pay"
+    KIND_CHOICES = [
+        (PLAN_ACC, "План Н"),
+        (PLAN_PAY, "План О"),
+        (FACT_ACC, "Факт Н"),
+        (FACT_PAY, "Факт О"),
+    ]
+    # JSON-поле Work -> вид суммы
+    SOURCE_FIELDS = {
+        "accruals": PLAN_ACC,
+        "payments": PLAN_PAY,
+        "actual_accruals": FACT_ACC,
+        "actual_payments": FACT_PAY,
+    }
+    # поля Work, при изменении которых строки надо пересобрать
+    WORK_FIELDS = frozenset(SOURCE_FIELDS) | {"year", "item"}
+    # месяцы с этим статусом в итоги не попадают (как и на фронте)
+    EXCLUDED_STATUSES = ("перенос",)
+
+    work = models.ForeignKey(
+        Work,
+        related_name="month_amounts",
+        on_delete=models.CASCADE,
+        verbose_name="Работа"
+    )
+    # статья работы на момент записи — чтобы вычитать старые суммы при переносе
+    item = models.ForeignKey(
+        BudgetItem,
+        related_name="+",
+        on_delete=models.CASCADE,
+        verbose_name="Статья бюджета"
+    )
+    year = models.PositiveSmallIntegerField("Год")
+    month = models.PositiveSmallIntegerField("Месяц")  # 1–12
+    kind = models.CharField("Вид", max_length=8, choices=KIND_CHOICES)
+    amount = models.DecimalField("Сумма", max_digits=14, decimal_places=2, default=0)
+    status = models.CharField("Статус", max_length=20, blank=True)
+
+    class Meta:
+        verbose_name = "Сумма работы за месяц"
+        verbose_name_plural = "Суммы работ по месяцам"
+        unique_together = ("work", "kind", "month")
+        indexes = [
+            models.Index(fields=["year", "kind", "month"]),
+        ]
+
+    @classmethod
+    def rows_for(cls, work):
+        rows = []
+        for field, kind in cls.SOURCE_FIELDS.items():
+            data = getattr(work, field)
+            # JSONField примет и список, и строку — в зеркало идут только карты
+            if not isinstance(data, dict):
+                continue
+            for month, value in data.items():
+                if month not in MONTHS:
+                    continue
+                amount, status = parse_month_value(value)
+                rows.append(cls(
+                    work_id=work.pk, item_id=work.item_id, year=work.year,
+                    month=MONTHS.index(month) + 1,
+                    kind=kind, amount=amount, status=status[:20],
+                ))
+        return rows
+
+    @classmethod
+    def sync(cls, works, deleted=False):
+        """
+        Пересобрать строки для набора работ (одно удаление и одна вставка)
+        и перенести разницу в ItemQuarterRollup.
+        deleted=True — работы удаляются: строки уйдут каскадом, только вычитаем.
+        """
+        works = list(works)
+        if not works:
+            return
+        deltas = {}
+
+        def add(item_id, year, month, kind, amount, status, sign):
+            if status in cls.EXCLUDED_STATUSES or not amount:
+                return
+            fields = deltas.setdefault((item_id, year, month), {})
+            fields[kind] = fields.get(kind, 0) + sign * amount
+
+        current = cls.objects.filter(work_id__in=[w.pk for w in works])
+        for row in current.values_list("item_id", "year", "month", "kind", "amount", "status"):
+            add(*row, sign=-1)
+        if not deleted:
+            current.delete()
+            rows = [row for work in works for row in cls.rows_for(work)]
+            cls.objects.bulk_create(rows, batch_size=500)
+            for r in rows:
+                add(r.item_id, r.year, r.month, r.kind, r.amount, r.status, sign=1)
+        ItemQuarterRollup.apply_deltas(deltas)
+
+
+class ItemQuarterRollup(models.Model):
+    """
+    Итоги статьи по году/кварталу/месяцу, поддерживаемые инкрементально.
+    Строки с month 1–12 — суммы план/факт за месяц (из WorkMonthAmount),
+    строка с month=0 — квартальные показатели резерва (из QuarterReserve).
+    Сумма всех строк квартала даёт итог квартала.
+    Пересчёт с нуля и сверка: manage.py rebuild_rollups [--verify].
+    """
+    AMOUNT_FIELDS = tuple(kind for kind, _ in WorkMonthAmount.KIND_CHOICES)
+    # поле итога -> поле QuarterReserve
+    RESERVE_FIELDS = {
+        "reserve_acc": "accrual_sum",
+        "reserve_pay": "payment_sum",
+        "reserve_used_acc": "used_acc",
+        "reserve_used_pay": "used_pay",
+    }
+
+    item = models.ForeignKey(
+        BudgetItem,
+        related_name="rollups",
+        on_delete=models.CASCADE,
+        verbose_name="Статья бюджета"
+    )
+    year = models.PositiveSmallIntegerField("Год")
+    quarter = models.PositiveSmallIntegerField("Квартал")
+    month = models.PositiveSmallIntegerField("Месяц", help_text="0 — строка резерва квартала")
+    plan_acc = models.DecimalField("План Н", max_digits=14, decimal_places=2, default=0)
+    plan_pay = models.DecimalField("План О", max_digits=14, decimal_places=2, default=0)
+    fact_acc = models.DecimalField("Факт Н", max_digits=14, decimal_places=2, default=0)
+    fact_pay = models.DecimalField("Факт О", max_digits=14, decimal_places=2, default=0)
+    reserve_acc = models.DecimalField("Резерв Н", max_digits=14, decimal_places=2, default=0)
+    reserve_pay = models.DecimalField("Резерв О", max_digits=14, decimal_places=2, default=0)
+    reserve_used_acc = models.DecimalField("Освоено резерва Н", max_digits=14, decimal_places=2, default=0)
+    reserve_used_pay = models.DecimalField("Освоено резерва О", max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Итог статьи за период"
+        verbose_name_plural = "Итоги статей по периодам"
+        unique_together = ("item", "year", "quarter", "month")
+        indexes = [
+            models.Index(fields=["year", "quarter"]),
+        ]
+
+    # строк итогов в одном UPDATE ... CASE
+    WRITE_BATCH_SIZE = 200
+
+    @classmethod
+    def _write(cls, rows, increment):
+        """
+        rows: {(item_id, year, quarter, month): {поле: значение}}.
+        Существующие строки обновляются одним UPDATE с CASE на пачку,
+        недостающие создаются одним bulk_create — число запросов не зависит
+        от числа ключей. increment=True прибавляет значения (F() + x).
+        """
+        rows = {key: fields for key, fields in rows.items() if fields}
+        if not rows:
+            return
+        existing = {}
+        candidates = cls.objects.filter(
+            item_id__in={key[0] for key in rows}, year__in={key[1] for key in rows},
+        ).values_list("pk", "item_id", "year", "quarter", "month")
+        for pk, *key in candidates:
+            if tuple(key) in rows:
+                existing[tuple(key)] = pk
+
+        keys = list(existing)
+        for start in range(0, len(keys), cls.WRITE_BATCH_SIZE):
+            batch = keys[start:start + cls.WRITE_BATCH_SIZE]
+            updates = {}
+            for name in sorted({name for key in batch for name in rows[key]}):
+                whens = [
+                    models.When(
+                        pk=existing[key],
+                        then=models.F(name) + rows[key][name] if increment else models.Value(rows[key][name]),
+                    )
+                    for key in batch if name in rows[key]
+                ]
+                updates[name] = models.Case(*whens, default=models.F(name),
+                                            output_field=cls._meta.get_field(name))
+            cls.objects.filter(pk__in=[existing[key] for key in batch]).update(**updates)
+
+        cls.objects.bulk_create(
+            [
+                cls(**dict(zip(("item_id", "year", "quarter", "month"), key)), **fields)
+                for key, fields in rows.items() if key not in existing
+            ],
+            batch_size=500,
+        )
+
+    @classmethod
+    def apply_deltas(cls, deltas):
+        """deltas: {(item_id, year, month): {поле: приращение}}"""
+        rows = {}
+        for (item_id, year, month), fields in deltas.items():
+            fields = {f: v for f, v in fields.items() if v}
+            if fields:
+                rows[(item_id, year, (month - 1) // 3 + 1, month)] = fields
+        cls._write(rows, increment=True)
+
+    @classmethod
+    def set_reserves(cls, reserves, deleted=False):
+        if deleted:
+            # строка month=0 хранит только резерв: удаляем её, а не обнуляем —
+            # иначе при каскадном удалении статьи она создалась бы заново
+            lookup = models.Q()
+            for reserve in reserves:
+                lookup |= models.Q(item_id=reserve.item_id, year=reserve.year, quarter=reserve.quarter)
+            cls.objects.filter(lookup, month=0).delete()
+            return
+        moved = models.Q()
+        for reserve in reserves:
+            loaded = getattr(reserve, "_loaded_key", None)
+            key = (reserve.item_id, reserve.year, reserve.quarter)
+            if loaded is not None and loaded != key:
+                moved |= models.Q(item_id=loaded[0], year=loaded[1], quarter=loaded[2])
+            reserve._loaded_key = key
+        if moved:
+            # резерв перенесён в другой квартал, год или статью
+            cls.objects.filter(moved, month=0).delete()
+        cls._write(
+            {
+                (reserve.item_id, reserve.year, reserve.quarter, 0): {
+                    f: getattr(reserve, src)
+                    for f, src in cls.RESERVE_FIELDS.items()
+                }
+                for reserve in reserves
+            },
+            increment=False,
+        )
+
+    @classmethod
+    def compute(cls):
+        """Ожидаемые итоги с нуля: {(item_id, year, quarter, month): {поле: сумма}}."""
+        expected = {}
+        amounts = (
+            WorkMonthAmount.objects
+            .exclude(status__in=WorkMonthAmount.EXCLUDED_STATUSES)
+            .values("item_id", "year", "month", "kind")
+            .annotate(total=models.Sum("amount"))
+            .values_list("item_id", "year", "month", "kind", "total")
+            .order_by()
+        )
+        for item_id, year, month, kind, total in amounts:
+            if total:
+                key = (item_id, year, (month - 1) // 3 + 1, month)
+                expected.setdefault(key, {})[kind] = total
+        for reserve in QuarterReserve.objects.all():
+            key = (reserve.item_id, reserve.year, reserve.quarter, 0)
+            expected[key] = {
+                f: getattr(reserve, src) for f, src in cls.RESERVE_FIELDS.items()
+            }
+        return expected
+
+    @classmethod
+    def rebuild(cls):
+        expected = cls.compute()
+        cls.objects.all().delete()
+        cls.objects.bulk_create(
+            [
+                cls(item_id=item_id, year=year, quarter=quarter, month=month, **fields)
+                for (item_id, year, quarter, month), fields in expected.items()
+            ],
+            batch_size=500,
+        )
+        return len(expected)
+
+
 class Material(models.Model):
     work = models.ForeignKey(
         Work,
@@ -395,6 +765,7 @@ class Material(models.Model):
 
 # budget/models.py
 class QuarterReserve(models.Model):
+    objects = QuarterReserveQuerySet.as_manager()
     QUARTERS = (
         (1, "I"), (2, "II"), (3, "III"), (4, "IV")
     )
@@ -407,10 +778,21 @@ class QuarterReserve(models.Model):
     payment_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     used_acc    = models.DecimalField(max_digits=12, decimal_places=2, default=0)   # освоено
     used_pay    = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at  = models.DateTimeField("Изменено", auto_now=True)
 
     class Meta:
         unique_together = ("item", "year", "quarter")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # статья, год и квартал на момент загрузки: при переносе резерва
+        # строку итогов прежнего квартала надо убрать, а журнал и ревизии
+        # должны затронуть и прежний год
+        instance._loaded_year = instance.__dict__.get("year")
+        instance._loaded_key = tuple(instance.__dict__.get(f) for f in ("item_id", "year", "quarter"))
+        return instance
+
 
 # Файлы-отчеты, прикрепленные к статье бюджета.
 class ArticleReport(models.Model):
@@ -437,4 +819,224 @@ class ArticleReport(models.Model):
         verbose_name_plural = "Отчеты по статьям бюджета"
 
     def __str__(self):
-        return f"{self.item.name} - {self.file.name.split('/')[-1]}"
\ No newline at end of file
+        return f"{self.item.name} - {self.file.name.split('/')[-1]}"
+
+
+class ChangeLog(models.Model):
+    """
+    Журнал изменений для инкрементальной синхронизации клиентов.
+    id записи — монотонно растущий курсор; deleted=True — «надгробие».
+    """
+    model = models.CharField("Модель", max_length=50)
+    object_id = models.BigIntegerField("ID объекта")
+    # год затронутой работы/резерва; NULL — неизвестен (касается любого года)
+    year = models.PositiveSmallIntegerField("Год", null=True, blank=True)
+    deleted = models.BooleanField("Удалён", default=False)
+    created_at = models.DateTimeField("Время изменения", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Запись журнала изменений"
+        verbose_name_plural = "Журнал изменений"
+        indexes = [
+            models.Index(fields=["model", "object_id"]),
+        ]
+
+    def __str__(self):
+        action = "удалён" if self.deleted else "изменён"
+        return f"#{self.pk} {self.model}:{self.object_id} {action}"
+
+
+class Revision(models.Model):
+    """
+    Счётчики ревизий таблиц для дешёвых ETag.
+    scope: "<модель>" — любые изменения, "<модель>:<год>" — изменения года,
+    "<модель>:?" — изменения, год которых неизвестен (касаются всех лет).
+    """
+    scope = models.CharField("Область", max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField("Ревизия", default=0)
+
+    class Meta:
+        verbose_name = "Ревизия"
+        verbose_name_plural = "Ревизии"
+
+    def __str__(self):
+        return f"{self.scope}={self.value}"
+
+    @staticmethod
+    def scopes(table, year=None):
+        """Счётчики, от которых зависит выборка таблицы за год (или за все годы)."""
+        if year is None:
+            return [table]
+        return [f"{table}:{year}", f"{table}:?"]
+
+    @classmethod
+    def bump(cls, table, years):
+        scopes = {table}
+        scopes.update(f"{table}:{'?' if y is None else y}" for y in years)
+        updated = cls.objects.filter(scope__in=scopes).update(value=models.F("value") + 1)
+        if updated < len(scopes):
+            existing = set(cls.objects.filter(scope__in=scopes).values_list("scope", flat=True))
+            cls.objects.bulk_create(
+                [cls(scope=s, value=1) for s in scopes - existing],
+                ignore_conflicts=True,
+            )
+
+    @classmethod
+    def current(cls, tables, year=None):
+        """Текущие значения счётчиков для набора таблиц, в стабильном порядке."""
+        scopes = [s for table in tables for s in cls.scopes(table, year)]
+        values = dict(cls.objects.filter(scope__in=scopes).values_list("scope", "value"))
+        return [(s, values.get(s, 0)) for s in scopes]
+
+
+class Upload(models.Model):
+    """
+    Сессия загрузки файла частями (budget.uploads). Части дописываются в
+    файл part_path строго по порядку: смещение следующей — received.
+    После finalize файл прикрепляется к цели и сессия удаляется.
+    """
+    TARGETS = (
+        ("material", "Материал работы или статьи"),
+        ("report", "Отчёт по статье"),
+        ("payment_detail", "Файл комментария оплаты"),
+        ("accrual_detail", "Файл комментария начисления"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                             related_name="uploads", verbose_name="Пользователь")
+    filename = models.CharField("Имя файла", max_length=255)
+    size = models.PositiveBigIntegerField("Размер")
+    received = models.PositiveBigIntegerField("Получено байт", default=0)
+    target = models.CharField("Цель", max_length=20, choices=TARGETS)
+    work = models.ForeignKey(Work, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name="+", verbose_name="Работа")
+    item = models.ForeignKey(BudgetItem, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name="+", verbose_name="Статья бюджета")
+    detail_id = models.PositiveBigIntegerField("ID детали", null=True, blank=True)
+    sha256 = models.CharField("SHA-256", max_length=64, blank=True, default="")
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    updated_at = models.DateTimeField("Изменено", auto_now=True)
+
+    class Meta:
+        verbose_name = "Загрузка частями"
+        verbose_name_plural = "Загрузки частями"
+
+    def __str__(self):
+        return f"{self.filename}: {self.received}/{self.size}"
+
+    @property
+    def part_path(self):
+        return Path(settings.UPLOAD_SESSION_DIR) / f"{self.pk}.part"
+
+
+class Blob(models.Model):
+    """
+    Содержимое файла в хранилище budget.storage.ContentAddressedStorage:
+    лежит один раз под своим sha256, refs — сколько имён FileField на него
+    ссылается. Когда refs доходит до нуля, файл удаляется.
+    """
+    digest = models.CharField("SHA-256", max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField("Размер")
+    refs = models.PositiveIntegerField("Ссылок", default=0)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Содержимое файла"
+        verbose_name_plural = "Содержимое файлов"
+
+    def __str__(self):
+        return f"{self.digest[:12]}… ×{self.refs}"
+
+
+class ImportJob(models.Model):
+    """
+    Фоновый импорт работ из CSV/XLSX (budget.imports). Строки обрабатываются
+    пачками, после каждой обновляются processed и счётчики. errors — ошибки
+    строк, diff — что импорт изменит (dry_run) или изменил; оба списка
+    усечены до imports.MAX_REPORTED записей.
+    """
+    STATUSES = (
+        ("pending", "В очереди"),
+        ("running", "Выполняется"),
+        ("done", "Готово"),
+        ("failed", "Ошибка"),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                             related_name="import_jobs", verbose_name="Пользователь")
+    file = models.FileField("Файл", upload_to="imports/%Y/%m/")
+    dry_run = models.BooleanField("Пробный прогон", default=False)
+    status = models.CharField("Статус", max_length=10, choices=STATUSES, default="pending")
+    total = models.PositiveIntegerField("Строк в файле", null=True, blank=True)
+    processed = models.PositiveIntegerField("Обработано строк", default=0)
+    created = models.PositiveIntegerField("Создано", default=0)
+    updated = models.PositiveIntegerField("Изменено", default=0)
+    unchanged = models.PositiveIntegerField("Без изменений", default=0)
+    invalid = models.PositiveIntegerField("С ошибками", default=0)
+    errors = models.JSONField("Ошибки строк", default=list, blank=True, encoder=DjangoJSONEncoder)
+    diff = models.JSONField("Изменения", default=list, blank=True, encoder=DjangoJSONEncoder)
+    message = models.TextField("Сообщение", blank=True)
+    created_at = models.DateTimeField("Создан", auto_now_add=True)
+    started_at = models.DateTimeField("Начат", null=True, blank=True)
+    finished_at = models.DateTimeField("Завершён", null=True, blank=True)
+    updated_at = models.DateTimeField("Обновлён", auto_now=True)
+
+    class Meta:
+        verbose_name = "Импорт работ"
+        verbose_name_plural = "Импорт работ"
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{Path(self.file.name).name}: {self.get_status_display()}"
+
+    @property
+    def progress(self):
+        """Доля обработанных строк (0–1) или None, пока число строк неизвестно."""
+        if not self.total:
+            return 1.0 if self.status == "done" else None
+        return min(1.0, self.processed / self.total)
+
+
+class Job(models.Model):
+    """
+    Фоновая задача (budget.jobs): kind — имя обработчика, params — его
+    аргументы. Воркер (manage.py run_workers) забирает задачу условным
+    UPDATE, пока она выполняется, обновляет heartbeat_at; упавшая задача
+    повторяется до max_attempts раз с растущей паузой (run_after).
+    Результат — JSON в result и/или файл result_file.
+    """
+    STATUSES = (
+        ("pending", "В очереди"),
+        ("running", "Выполняется"),
+        ("done", "Готово"),
+        ("failed", "Ошибка"),
+    )
+
+    kind = models.CharField("Вид", max_length=50)
+    params = models.JSONField("Параметры", default=dict, blank=True, encoder=DjangoJSONEncoder)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name="jobs", verbose_name="Пользователь")
+    status = models.CharField("Статус", max_length=10, choices=STATUSES, default="pending")
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Попыток не больше", default=3)
+    run_after = models.DateTimeField("Не раньше", default=timezone.now)
+    worker = models.CharField("Воркер", max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField("Пульс", null=True, blank=True)
+    progress = models.FloatField("Выполнено", null=True, blank=True)
+    result = models.JSONField("Результат", null=True, blank=True, encoder=DjangoJSONEncoder)
+    result_file = models.FileField("Файл результата", upload_to="job_results/%Y/%m/", blank=True)
+    error = models.TextField("Ошибка", blank=True)
+    created_at = models.DateTimeField("Создана", auto_now_add=True)
+    started_at = models.DateTimeField("Начата", null=True, blank=True)
+    finished_at = models.DateTimeField("Завершена", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ("-created_at",)
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}: {self.get_status_display()}"
+
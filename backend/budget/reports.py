@@ -0,0 +1,73 @@
+"""
+Сводные отчёты план/факт.
+
+Суммы читаются из инкрементально поддерживаемых итогов ItemQuarterRollup —
+O(статьи × месяцы) строк вместо обхода всех работ.
+"""
+from .models import MONTHS, BudgetItem, ItemQuarterRollup, month_quarter
+
+KINDS = list(ItemQuarterRollup.AMOUNT_FIELDS)
+
+
+def empty_totals():
+    return {kind: 0.0 for kind in KINDS}
+
+
+def _add(target, source):
+    for key, value in source.items():
+        target[key] = round(target[key] + value, 2)
+
+
+def month_amount_rows(year, group=None):
+    """
+    (item_id, месяц, вид суммы, сумма) по всем работам года.
+    Месяцы со статусом «перенос» в итоги не попадают (как и на фронте).
+    """
+    qs = ItemQuarterRollup.objects.filter(year=year, month__gt=0)
+    if group is not None:
+        qs = qs.filter(item__group_id=group)
+    for item_id, month, *totals in qs.values_list("item_id", "month", *KINDS):
+        for kind, total in zip(KINDS, totals):
+            yield item_id, MONTHS[month - 1], kind, float(total or 0)
+
+
+def build_summary(year, group=None):
+    """
+    Итоги года: группа → статья → квартал/месяц.
+    """
+    items = BudgetItem.objects.select_related("group").order_by("group__code", "position", "id")
+    if group is not None:
+        items = items.filter(group_id=group)
+
+    groups = {}
+    item_nodes = {}
+    for item in items:
+        g = item.group
+        if g.id not in groups:
+            groups[g.id] = {
+                "id": g.id, "code": g.code, "name": g.name,
+                "totals": empty_totals(), "items": [],
+            }
+        node = {
+            "id": item.id,
+            "name": item.name,
+            "totals": empty_totals(),
+            "quarters": {q: empty_totals() for q in range(1, 5)},
+            "months": {m: empty_totals() for m in MONTHS},
+        }
+        groups[g.id]["items"].append(node)
+        item_nodes[item.id] = (node, groups[g.id])
+
+    totals = empty_totals()
+    for item_id, month, key, amount in month_amount_rows(year, group):
+        if month not in MONTHS or item_id not in item_nodes or not amount:
+            continue
+        node, group_node = item_nodes[item_id]
+        delta = {key: amount}
+        _add(node["months"][month], delta)
+        _add(node["quarters"][month_quarter(month)], delta)
+        _add(node["totals"], delta)
+        _add(group_node["totals"], delta)
+        _add(totals, delta)
+
+    return {"year": year, "totals": totals, "groups": list(groups.values())}
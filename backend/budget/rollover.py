@@ -0,0 +1,131 @@
+"""
+Перенос бюджета на новый год.
+
+Работы копируются в целевой год с плановыми картами (accruals, payments).
+Карты можно сдвинуть на shift месяцев и умножить на scale. Факт, детали и
+материалы не копируются: это история прошлого года. Месяцы со статусом
+«перенос» тоже не копируются, потому что в план года они не входили.
+Резервы статей копируются по тем же кварталам: суммы умножаются на scale,
+освоенное обнуляется.
+
+Всё пишется bulk_create пачками в одной транзакции. Затем зеркало
+WorkMonthAmount, итоги ItemQuarterRollup и журнал обновляются так же, как
+при массовом сохранении (batch_changes). Повторный запуск не создаёт
+дубликатов: работа с той же статьёй и названием уже есть в целевом году —
+пропускается, существующий резерв квартала не меняется.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import MONTHS, QuarterReserve, Work, WorkMonthAmount, parse_month_value
+from .signals import batch_changes, log_changes
+
+BATCH_SIZE = 500
+PLAN_FIELDS = ("accruals", "payments")
+# поля, которые у копии свои, а не как у исходной работы
+OWN_FIELDS = {"id", "year", "updated_at", *WorkMonthAmount.SOURCE_FIELDS}
+
+
+@dataclass
+class Result:
+    works: int = 0
+    skipped_works: int = 0
+    reserves: int = 0
+    skipped_reserves: int = 0
+
+
+def _scaled(amount, scale):
+    value = (amount * scale).quantize(Decimal("0.01"))
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def shift_plan(plan, shift=0, scale=Decimal(1)):
+    """
+    Плановая карта, сдвинутая на shift месяцев и умноженная на scale.
+    Месяцы, ушедшие за пределы года, отбрасываются; формат значения
+    (число или {"amount", "status"}) сохраняется. Не карта — пустой план.
+    """
+    result = {}
+    if not isinstance(plan, dict):
+        return result
+    for month, value in plan.items():
+        if month not in MONTHS:
+            continue
+        amount, status = parse_month_value(value)
+        if status in WorkMonthAmount.EXCLUDED_STATUSES:
+            continue
+        index = MONTHS.index(month) + shift
+        if not 0 <= index < len(MONTHS):
+            continue
+        if scale != 1:
+            scaled = _scaled(amount, scale)
+            value = {**value, "amount": scaled} if isinstance(value, dict) else scaled
+        result[MONTHS[index]] = value
+    return result
+
+
+def _copy_fields():
+    return [f.attname for f in Work._meta.concrete_fields if f.name not in OWN_FIELDS]
+
+
+def _clone_works(works, target_year, shift, scale):
+    existing = set(Work.objects.filter(year=target_year).values_list("item_id", "name"))
+    fields = _copy_fields()
+    clones = []
+    for work in works:
+        key = (work.item_id, work.name)
+        if key in existing:
+            continue
+        existing.add(key)
+        clone = Work(year=target_year, **{name: getattr(work, name) for name in fields})
+        for name in PLAN_FIELDS:
+            setattr(clone, name, shift_plan(getattr(work, name), shift, scale))
+        clones.append(clone)
+    return clones
+
+
+def _clone_reserves(works, target_year, scale):
+    """(новые резервы, число пропущенных)."""
+    items = {work.item_id for work in works}
+    taken = set(QuarterReserve.objects.filter(year=target_year, item_id__in=items)
+                .values_list("item_id", "quarter"))
+    source = (QuarterReserve.objects
+              .filter(item_id__in=items, year__in={work.year for work in works})
+              .order_by("item_id", "quarter", "-year"))
+    clones, skipped = [], 0
+    for reserve in source:
+        # уже есть в целевом году (или работы из нескольких лет — берётся последний)
+        if (reserve.item_id, reserve.quarter) in taken:
+            skipped += 1
+            continue
+        taken.add((reserve.item_id, reserve.quarter))
+        clones.append(QuarterReserve(
+            item_id=reserve.item_id, year=target_year, quarter=reserve.quarter,
+            accrual_sum=(reserve.accrual_sum * scale).quantize(Decimal("0.01")),
+            payment_sum=(reserve.payment_sum * scale).quantize(Decimal("0.01")),
+        ))
+    return clones, skipped
+
+
+def rollover(works, target_year, shift=0, scale=Decimal(1), reserves=True):
+    """
+    Скопировать работы works (QuerySet) в target_year, а с reserves — и
+    резервы их статей за исходные годы. Возвращает Result.
+    """
+    scale = Decimal(str(scale))
+    # чтение и запись — в одной транзакции: параллельный перенос не задвоит работы
+    with transaction.atomic(), batch_changes():
+        works = list(works.order_by("pk"))
+        clones = _clone_works(works, target_year, shift, scale)
+        reserve_clones, skipped_reserves = _clone_reserves(works, target_year, scale) if reserves else ([], 0)
+        created = Work.objects.bulk_create(clones, batch_size=BATCH_SIZE)
+        WorkMonthAmount.sync(created)
+        log_changes(created)
+        created_reserves = QuarterReserve.objects.bulk_create(reserve_clones, batch_size=BATCH_SIZE)
+        log_changes(created_reserves)
+    return Result(
+        works=len(created), skipped_works=len(works) - len(created),
+        reserves=len(created_reserves), skipped_reserves=skipped_reserves,
+    )
@@ -0,0 +1,180 @@
+"""
+Синтетические данные для замеров производительности.
+
+Группы, статьи, работы с помесячными картами, детали оплат/начислений,
+резервы по кварталам и заглушки материалов (строки без файлов на диске).
+Все случайные значения берутся из random.Random(seed): один seed и одни
+параметры дают одну и ту же базу. Пишется всё bulk_create, поэтому
+зеркало WorkMonthAmount и итоги ItemQuarterRollup строятся в конце целиком,
+а журнал ChangeLog не ведётся — клиенты перечитывают данные по новому ETag.
+"""
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .models import (
+    MONTHS, AccrualDetail, BudgetItem, Group, ItemQuarterRollup, Material,
+    PaymentDetail, QuarterReserve, Revision, Work, WorkMonthAmount,
+)
+from .signals import REVISION_MODELS, suspended
+
+# код группы и логин пользователя синтетических данных начинаются так
+SEED_PREFIX = "seed-"
+
+# готовые масштабы: groups × items × works × years работ
+SCALES = {
+    "S": {"groups": 3, "items": 5, "works": 4, "years": 2},
+    "M": {"groups": 5, "items": 10, "works": 8, "years": 2},
+    "L": {"groups": 10, "items": 20, "works": 10, "years": 3},
+    "XL": {"groups": 20, "items": 25, "works": 20, "years": 3},
+}
+
+STATUSES = ("действ", "отмена", "перенос")
+BATCH_SIZE = 500
+
+
+def _amount(rng):
+    return rng.randrange(1, 500) * 1000
+
+
+def _month_map(rng, share):
+    """Карта месяцев: часть значений числом, часть — {"amount", "status"}."""
+    months = {}
+    for month in MONTHS:
+        if rng.random() >= share:
+            continue
+        if rng.random() < 0.5:
+            months[month] = _amount(rng)
+        else:
+            status = rng.choices(STATUSES, weights=(8, 1, 1))[0]
+            months[month] = {"amount": _amount(rng), "status": status}
+    return months
+
+
+def clear():
+    """Удалить ранее сгенерированные группы со статьями, работами и резервами."""
+    items = BudgetItem.objects.filter(group__code__startswith=SEED_PREFIX)
+    # без сигналов: иначе каждая работа и резерв пересчитывали бы итоги
+    # своим запросом; зеркало и итоги статей удаляются здесь же целиком
+    with transaction.atomic(), suspended():
+        WorkMonthAmount.objects.filter(item__in=items).delete()
+        ItemQuarterRollup.objects.filter(item__in=items).delete()
+        deleted = items.delete()[0]
+        deleted += Group.objects.filter(code__startswith=SEED_PREFIX).delete()[0]
+        if deleted:
+            # журнал для синтетики не ведётся, но ETag и кэш ответов должны устареть
+            for model in REVISION_MODELS:
+                Revision.bump(model._meta.model_name, [None])
+
+
+def generate(seed=0, *, groups, items, works, years, start_year, users=10,
+             detail_share=0.3, materials=1):
+    """
+    Сгенерировать groups групп по items статей, в каждой — works работ
+    на каждый из years лет начиная со start_year. Прежние синтетические
+    данные удаляются. Возвращает число созданных строк по моделям.
+    """
+    rng = random.Random(seed)
+    year_list = list(range(start_year, start_year + years))
+    clear()
+    with transaction.atomic():
+        User = get_user_model()
+        usernames = [f"{SEED_PREFIX}user{n}" for n in range(users)]
+        existing = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+        new_users = []
+        for n, username in enumerate(usernames):
+            if username not in existing:
+                user = User(username=username, first_name="Тест", last_name=f"Пользователь {n}")
+                user.set_unusable_password()
+                new_users.append(user)
+        User.objects.bulk_create(new_users)
+        responsible = list(User.objects.filter(username__in=usernames).order_by("username"))
+
+        group_objs = Group.objects.bulk_create([
+            Group(code=f"{SEED_PREFIX}{g:03d}", name=f"Группа {g}") for g in range(groups)
+        ])
+        item_objs = BudgetItem.objects.bulk_create(
+            [
+                BudgetItem(group=group, name=f"Статья {group.code}-{i}", position=i)
+                for group in group_objs for i in range(items)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+        work_objs = []
+        for item in item_objs:
+            for year in year_list:
+                for w in range(works):
+                    work_objs.append(Work(
+                        item=item, year=year, name=f"Работа {item.pk}-{year}-{w}",
+                        justification="Обоснование " * rng.randrange(0, 20),
+                        comment="Комментарий" if rng.random() < 0.3 else "",
+                        responsible=rng.choice(responsible),
+                        vat_rate=rng.choice(Work.VAT_CHOICES)[0],
+                        feasibility=rng.choice(Work.FEASIBILITY_CHOICES)[0],
+                        accruals=_month_map(rng, 0.6),
+                        payments=_month_map(rng, 0.6),
+                        actual_accruals=_month_map(rng, 0.3),
+                        actual_payments=_month_map(rng, 0.3),
+                    ))
+        Work.objects.bulk_create(work_objs, batch_size=BATCH_SIZE)
+
+        payment_details, accrual_details, material_objs = [], [], []
+        for work in work_objs:
+            for month in work.actual_payments:
+                if rng.random() < detail_share:
+                    payment_details.append(PaymentDetail(
+                        work=work, month=month, amount=Decimal(_amount(rng)),
+                        creditor=f"ООО «Поставщик {rng.randrange(100)}»",
+                        contract=f"Д-{rng.randrange(10000)}", fp=f"ФП-{rng.randrange(50)}",
+                        mvz=f"МВЗ-{rng.randrange(30)}", is_correction=rng.random() < 0.05,
+                    ))
+            for month in work.actual_accruals:
+                if rng.random() < detail_share:
+                    accrual_details.append(AccrualDetail(
+                        work=work, month=month, amount=Decimal(_amount(rng)),
+                        closing_document=f"Акт {rng.randrange(10000)}",
+                        is_correction=rng.random() < 0.05,
+                    ))
+            for n in range(rng.randrange(materials + 1)):
+                material_objs.append(Material(work=work, file=f"materials/seed/work-{work.pk}-{n}.pdf"))
+        for item in item_objs:
+            for n in range(rng.randrange(materials + 1)):
+                material_objs.append(Material(item=item, file=f"materials/seed/item-{item.pk}-{n}.pdf"))
+        PaymentDetail.objects.bulk_create(payment_details, batch_size=BATCH_SIZE)
+        AccrualDetail.objects.bulk_create(accrual_details, batch_size=BATCH_SIZE)
+        Material.objects.bulk_create(material_objs, batch_size=BATCH_SIZE)
+
+        reserves = []
+        for item in item_objs:
+            for year in year_list:
+                for quarter in range(1, 5):
+                    total = rng.randrange(100, 1000) * 10000
+                    reserves.append(QuarterReserve(
+                        item=item, year=year, quarter=quarter,
+                        accrual_sum=total, payment_sum=total,
+                        used_acc=rng.randrange(0, total // 2), used_pay=rng.randrange(0, total // 2),
+                    ))
+        QuarterReserve.objects.bulk_create(reserves, batch_size=BATCH_SIZE)
+
+        WorkMonthAmount.objects.bulk_create(
+            [row for work in work_objs for row in WorkMonthAmount.rows_for(work)],
+            batch_size=BATCH_SIZE,
+        )
+        ItemQuarterRollup.rebuild()
+        # bulk_create мимо сигналов: сдвигаем ревизии, чтобы ETag и кэш ответов устарели
+        for model in REVISION_MODELS:
+            Revision.bump(model._meta.model_name, year_list + [None])
+
+    return {
+        "users": len(new_users),
+        "groups": len(group_objs),
+        "items": len(item_objs),
+        "works": len(work_objs),
+        "payment_details": len(payment_details),
+        "accrual_details": len(accrual_details),
+        "materials": len(material_objs),
+        "reserves": len(reserves),
+    }
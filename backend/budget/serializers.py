@@ -1,16 +1,202 @@
+import posixpath
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from .models import BudgetItem, Work, Material, QuarterReserve, PaymentDetail, AccrualDetail
-from .models import Group
+from .models import ArticleReport, Group, ImportJob, Job, Upload
 from django.contrib.auth.models import User
+from .signals import batch_changes, log_changes
+from .imports import FORMATS as IMPORT_FORMATS
+from .jobs import HANDLERS as JOB_HANDLERS
+
+
+# вложенные списки, которые отдаются только по ?expand=, если он задан
+EXPANDABLE_FIELDS = ("payment_details", "accrual_details", "materials", "reports")
+
+
+def _csv_param(request, name):
+    raw = request.query_params.get(name)
+    if raw is None:
+        return None
+    return {part.strip() for part in raw.split(",") if part.strip()}
+
+
+class FieldSelection:
+    """
+    Выбор полей ответа по ?fields= и ?expand=.
+
+    fields — имена через запятую; вложенные поля задаются через точку
+    (works.name, works.payment_details.amount). Если для уровня не указано
+    ни одного имени, он отдаётся целиком; id отдаётся всегда.
+    expand — какие из EXPANDABLE_FIELDS включать; без параметра включены все.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
 
+    @classmethod
+    def from_request(cls, request):
+        """None, если ни один из параметров не задан (ответ как раньше)."""
+        fields, expand = _csv_param(request, "fields"), _csv_param(request, "expand")
+        if fields is None and expand is None:
+            return None
+        return cls(fields, expand)
 
-class MaterialSerializer(serializers.ModelSerializer):
+    def _level(self, path):
+        prefix = f"{path}." if path else ""
+        return {f[len(prefix):].split(".")[0] for f in self.fields if f.startswith(prefix)}
+
+    def allows(self, path, name):
+        """Отдавать ли поле name на уровне path ("" — корень, "works" — работы статьи)."""
+        if self.expand is not None and name in EXPANDABLE_FIELDS and name not in self.expand:
+            return False
+        if self.fields is None or name == "id":
+            return True
+        level = self._level(path)
+        return not level or name in level
+
+    def allows_path(self, path):
+        """Разрешён ли вложенный уровень целиком: works.materials → works и materials."""
+        parts = path.split(".")
+        return all(self.allows(".".join(parts[:i]), part) for i, part in enumerate(parts))
+
+
+class SelectableFieldsMixin:
+    """
+    Отбрасывает поля, не выбранные context["field_selection"] (FieldSelection).
+    Работает и для вложенных сериализаторов: путь берётся по цепочке parent.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.context.get("field_selection")
+        if selection is None:
+            return fields
+        path = self.field_path()
+        return {name: field for name, field in fields.items() if selection.allows(path, name)}
+
+    def field_path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return ".".join(reversed(names))
+
+
+class MaterialSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Material
         fields = ("id", "file", "uploaded_at", "work", "item")
 
 
-class PaymentDetailSerializer(serializers.ModelSerializer):
+class ArticleReportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArticleReport
+        fields = ("id", "file", "uploaded_at", "item")
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Задача фонового импорта работ; при создании задаются только file и dry_run."""
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = ("id", "file", "dry_run", "status", "total", "processed", "progress",
+                  "created", "updated", "unchanged", "invalid", "errors", "diff", "message",
+                  "created_at", "started_at", "finished_at")
+        read_only_fields = tuple(f for f in fields if f not in ("file", "dry_run"))
+
+    def validate_file(self, value):
+        if Path(value.name).suffix.lower() not in IMPORT_FORMATS:
+            raise serializers.ValidationError(f"Поддерживаются файлы {', '.join(IMPORT_FORMATS)}")
+        return value
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Фоновая задача; при создании задаются только kind и params."""
+    has_file = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ("id", "kind", "params", "status", "attempts", "max_attempts", "run_after",
+                  "progress", "result", "has_file", "error", "created_at", "started_at", "finished_at")
+        read_only_fields = tuple(f for f in fields if f not in ("kind", "params"))
+
+    def get_has_file(self, obj):
+        return bool(obj.result_file)
+
+    def validate_kind(self, value):
+        handler = JOB_HANDLERS.get(value)
+        if handler is None or not handler.api:
+            raise serializers.ValidationError(f"Неизвестный вид задачи: {value}")
+        return value
+
+    def validate_params(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Ожидается объект")
+        return value
+
+    def validate(self, attrs):
+        handler = JOB_HANDLERS[attrs["kind"]]
+        params = attrs.get("params") or {}
+        if handler.clean is not None:
+            try:
+                params = handler.clean(params)
+            except ValueError as exc:
+                raise serializers.ValidationError({"params": [str(exc)]})
+        attrs["params"] = params
+        return attrs
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    """Сессия загрузки частями; chunk_size — наибольшая часть, которую примет сервер."""
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Upload
+        fields = ("id", "filename", "size", "sha256", "received", "target", "work", "item",
+                  "detail_id", "chunk_size", "created_at")
+        read_only_fields = ("id", "received", "created_at")
+
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_MAX
+
+    def validate_filename(self, value):
+        name = posixpath.basename(value.replace("\\", "/")).strip()
+        if not name:
+            raise serializers.ValidationError("Пустое имя файла")
+        return name
+
+    def validate_sha256(self, value):
+        value = value.strip().lower()
+        if value and (len(value) != 64 or value.strip("0123456789abcdef")):
+            raise serializers.ValidationError("Ожидается sha256 в шестнадцатеричном виде")
+        return value
+
+    def validate_size(self, value):
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Файл больше {settings.UPLOAD_MAX_SIZE} байт")
+        return value
+
+    def validate(self, attrs):
+        target, work, item = attrs["target"], attrs.get("work"), attrs.get("item")
+        if target == "material" and (work is None) == (item is None):
+            raise serializers.ValidationError("Нужно указать либо work, либо item")
+        if target == "report" and (item is None or work is not None):
+            raise serializers.ValidationError("Отчёт прикрепляется к статье: нужен item")
+        if target.endswith("_detail") and attrs.get("detail_id") is None:
+            raise serializers.ValidationError("Нужно указать detail_id")
+        return attrs
+
+
+class PaymentDetailSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = PaymentDetail
         fields = (
@@ -31,7 +217,7 @@ class PaymentDetailSerializer(serializers.ModelSerializer):
             'is_correction': {'required': False},
         }
 
-class AccrualDetailSerializer(serializers.ModelSerializer):
+class AccrualDetailSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = AccrualDetail
         fields = (
@@ -66,7 +252,7 @@ class GroupSerializer(serializers.ModelSerializer):
         model = Group
         fields = ("id", "code", "name")
 
-class WorkSerializer(serializers.ModelSerializer):
+class WorkSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     item = serializers.PrimaryKeyRelatedField(
         queryset=BudgetItem.objects.all(),
         write_only=True
@@ -96,35 +282,78 @@ class WorkSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         pay_details = validated_data.pop('payment_details', [])
         accr_details = validated_data.pop('accrual_details', [])
-        work = super().create(validated_data)
-        for det in pay_details:
-            PaymentDetail.objects.create(work=work, **det)
-        for det in accr_details:
-            AccrualDetail.objects.create(work=work, **det)
+        with transaction.atomic(), batch_changes():
+            work = super().create(validated_data)
+            self._sync_details(work, PaymentDetail, pay_details)
+            self._sync_details(work, AccrualDetail, accr_details)
         return work
 
     def update(self, instance, validated_data):
         pay_details = validated_data.pop('payment_details', None)
         accr_details = validated_data.pop('accrual_details', None)
-        work = super().update(instance, validated_data)
-        if pay_details is not None:
-            instance.payment_details.all().delete()
-            for det in pay_details:
-                # удалить пустой файл и старый id перед созданием
-                if det.get('comment_file') in (None, {}, ''):
-                    det.pop('comment_file', None)
-                det.pop('id', None)
-                PaymentDetail.objects.create(work=work, **det)
-        if accr_details is not None:
-            instance.accrual_details.all().delete()
-            for det in accr_details:
-                # удалить пустой файл и старый id перед созданием
-                if det.get('comment_file') in (None, {}, ''):
-                    det.pop('comment_file', None)
-                det.pop('id', None)
-                AccrualDetail.objects.create(work=work, **det)
+        with transaction.atomic(), batch_changes():
+            work = super().update(instance, validated_data)
+            if pay_details is not None:
+                self._sync_details(work, PaymentDetail, pay_details)
+            if accr_details is not None:
+                self._sync_details(work, AccrualDetail, accr_details)
         return work
 
+    @staticmethod
+    def _sync_details(work, model, rows):
+        """
+        Привести детали работы к списку rows, сопоставляя строки по месяцу:
+        изменённые — одним bulk_update, новые — одним bulk_create,
+        отсутствующие — одним delete. Файл комментария без новой загрузки
+        остаётся прежним.
+        """
+        accessor = model._meta.get_field('work').remote_field.get_accessor_name()
+        # через related manager: берёт prefetch-кэш и проставляет det.work
+        existing = {det.month: det for det in getattr(work, accessor).all()}
+        incoming = {}
+        for det in rows:
+            det = dict(det)
+            det.pop('id', None)
+            if det.get('comment_file') in (None, {}, ''):
+                det.pop('comment_file', None)
+            incoming[det.get('month', '')] = det
+
+        now = timezone.now()
+        file_field = model._meta.get_field('comment_file')
+        to_create, to_update, changed_fields, replaced_files = [], [], set(), []
+        for month, det in incoming.items():
+            current = existing.get(month)
+            if current is None:
+                to_create.append(model(work=work, **det))
+                continue
+            changed = [f for f, value in det.items() if getattr(current, f) != value]
+            if not changed:
+                continue
+            if 'comment_file' in changed and current.comment_file:
+                replaced_files.append(current.comment_file.name)
+            for field in changed:
+                setattr(current, field, det[field])
+            if 'comment_file' in changed:
+                # bulk_update не вызывает pre_save: сохраняем загрузку сами
+                file_field.pre_save(current, add=False)
+            current.updated_at = now
+            changed_fields.update(changed)
+            to_update.append(current)
+
+        removed = [det for month, det in existing.items() if month not in incoming]
+        if removed:
+            # файлы удалённых деталей освобождает сигнал post_delete
+            model.objects.filter(pk__in=[det.pk for det in removed]).delete()
+        if to_update:
+            model.objects.bulk_update(to_update, sorted(changed_fields) + ['updated_at'])
+            log_changes(to_update)
+        if to_create:
+            model.objects.bulk_create(to_create)
+            log_changes(to_create)
+        if replaced_files:
+            storage = file_field.storage
+            transaction.on_commit(lambda: [storage.delete(name) for name in replaced_files])
+
     class Meta:
         model = Work
         fields = (
@@ -144,7 +373,52 @@ class WorkSerializer(serializers.ModelSerializer):
 
 
 
-class BudgetItemSerializer(serializers.ModelSerializer):
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PK-поле, которое берёт объекты из заранее загруженного словаря
+    context["preloaded"][Model] вместо отдельного запроса на каждое значение.
+    """
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get("preloaded", {}).get(self.queryset.model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            return preloaded[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class WorkBulkUpdateSerializer(serializers.ModelSerializer):
+    """Одна строка POST /api/works/bulk/: id работы и изменяемые поля."""
+    id = serializers.IntegerField()
+    item = PreloadedPrimaryKeyRelatedField(queryset=BudgetItem.objects.all(), required=False)
+    responsible = PreloadedPrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
+    feasibility = serializers.ChoiceField(choices=Work.FEASIBILITY_CHOICES, required=False)
+    work_type = serializers.CharField(required=False, allow_blank=True)
+    product_name = serializers.CharField(required=False, allow_blank=True)
+    responsible_slok = serializers.CharField(required=False, allow_blank=True)
+    responsible_dpm = serializers.CharField(required=False, allow_blank=True)
+    certificate_number = serializers.CharField(required=False, allow_blank=True)
+    certification_body = serializers.CharField(required=False, allow_blank=True)
+
+    class Meta:
+        model = Work
+        fields = (
+            "id", "item", "year", "responsible",
+            "name", "justification", "comment",
+            "certification", "work_type", "product_name", "responsible_slok", "responsible_dpm",
+            "certificate_number", "certification_body",
+            "accruals", "payments",
+            "actual_accruals", "actual_payments",
+            "vat_rate",
+            "feasibility",
+        )
+
+
+class BudgetItemSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     group = GroupSerializer(read_only=True)
     works = WorkSerializer(source='detailed_works', many=True, read_only=True)
     reports = MaterialSerializer(source='materials', many=True, read_only=True)
@@ -185,3 +459,29 @@ class ReserveSerializer(serializers.ModelSerializer):
 
     def get_balance_pay(self, obj):
         return obj.payment_sum - obj.used_pay
+
+
+class CentsField(serializers.DecimalField):
+    """
+    Сумма, округлённая до копеек. Фронт складывает суммы числами JS
+    (0.1 + 0.2 = 0.30000000000000004): лишние знаки не ошибка, а погрешность.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(max_digits=12, decimal_places=2, **kwargs)
+
+    def to_internal_value(self, data):
+        try:
+            data = Decimal(str(data).strip()).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        except (InvalidOperation, ValueError):
+            pass  # не число — ошибку выдаст DecimalField
+        return super().to_internal_value(data)
+
+
+class ReserveWriteOffSerializer(serializers.Serializer):
+    """Одна позиция пакетного списания резерва."""
+    item = serializers.IntegerField()
+    year = serializers.IntegerField()
+    quarter = serializers.ChoiceField(choices=QuarterReserve.QUARTERS)
+    acc = CentsField(min_value=0, default=0)
+    pay = CentsField(min_value=0, default=0)
@@ -0,0 +1,165 @@
+"""
+Учёт изменений: журнал ChangeLog, счётчики ревизий для ETag,
+зеркало помесячных сумм WorkMonthAmount и итоги ItemQuarterRollup.
+Файлы удалённых записей (FileField) освобождаются в хранилище после фиксации.
+
+Одиночные save()/delete() отслеживаются сигналами; массовые операции
+(bulk_create/bulk_update/QuerySet.update) должны вызывать log_changes явно.
+Внутри batch_changes() записи копятся и пишутся пачкой при выходе из блока.
+"""
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from .models import (
+    AccrualDetail, ArticleReport, BudgetItem, ChangeLog, Group, ImportJob, ItemQuarterRollup, Job,
+    Material, PaymentDetail, QuarterReserve, Revision, Work, WorkMonthAmount,
+)
+
+# модели, попадающие в ChangeLog (/api/changes/)
+TRACKED_MODELS = (Work, PaymentDetail, AccrualDetail, QuarterReserve)
+# модели, изменения которых сдвигают ревизии ETag
+REVISION_MODELS = TRACKED_MODELS + (BudgetItem, Group, Material, get_user_model())
+# сохранения только этих полей не меняют ответы API: вход пользователя
+# пишет last_login и не должен сбрасывать ETag списка users/
+IGNORED_UPDATE_FIELDS = {get_user_model(): {"last_login"}}
+# модели с FileField: файл удалённой записи больше никому не нужен
+FILE_MODELS = (Material, ArticleReport, PaymentDetail, AccrualDetail, ImportJob, Job)
+
+
+def _year_of(instance):
+    """Год объекта без лишних запросов; None, если его не узнать даром."""
+    if hasattr(instance, "year"):
+        return instance.year
+    work_field = getattr(type(instance), "work", None)
+    if work_field is not None and instance.work_id and work_field.is_cached(instance):
+        return instance.work.year
+    return None
+
+
+_local = threading.local()
+
+
+@contextmanager
+def batch_changes():
+    """
+    Копить изменения внутри блока и записать их при выходе одной вставкой
+    в журнал и одним сдвигом ревизий на модель: так удаление N деталей
+    стоит пару запросов, а не 2·N.
+    """
+    if getattr(_local, "pending", None) is not None:
+        yield
+        return
+    _local.pending = pending = {"entries": [], "years": {}}
+    try:
+        yield
+    finally:
+        _local.pending = None
+    _flush(pending["entries"], pending["years"])
+
+
+def _flush(entries, years):
+    if entries:
+        ChangeLog.objects.bulk_create(entries)
+    for model_name, model_years in years.items():
+        Revision.bump(model_name, model_years)
+
+
+def log_changes(objs, deleted=False):
+    """Записать изменение набора объектов одной модели в журнал и ревизии."""
+    objs = list(objs)
+    if not objs:
+        return
+    model = type(objs[0])
+    model_name = model._meta.model_name
+    if model is QuarterReserve:
+        ItemQuarterRollup.set_reserves(objs, deleted=deleted)
+    years = set()
+    entries = []
+    for obj in objs:
+        year = _year_of(obj)
+        years.add(year)
+        loaded_year = getattr(obj, "_loaded_year", None)
+        if loaded_year is not None and loaded_year != year:
+            # работа ушла из прежнего года: для него это удаление
+            years.add(loaded_year)
+            if not deleted:
+                entries.append(ChangeLog(model=model_name, object_id=obj.pk, year=loaded_year, deleted=True))
+            obj._loaded_year = year
+        entries.append(ChangeLog(model=model_name, object_id=obj.pk, year=year, deleted=deleted))
+    if model not in TRACKED_MODELS:
+        entries = []
+
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        _flush(entries, {model_name: years})
+    else:
+        pending["entries"].extend(entries)
+        pending["years"].setdefault(model_name, set()).update(years)
+
+
+def _on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and set(update_fields) <= IGNORED_UPDATE_FIELDS.get(sender, set()):
+        return
+    log_changes([instance])
+
+
+def _sync_month_amounts(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not (set(update_fields) & WorkMonthAmount.WORK_FIELDS):
+        return
+    WorkMonthAmount.sync([instance])
+
+
+def _drop_month_amounts(sender, instance, **kwargs):
+    # строки WorkMonthAmount уйдут каскадом; заранее вычитаем их из итогов
+    WorkMonthAmount.sync([instance], deleted=True)
+
+
+def _on_delete(sender, instance, **kwargs):
+    log_changes([instance], deleted=True)
+
+
+def _release_files(sender, instance, **kwargs):
+    # после фиксации: при откате запись вернётся и файл ей ещё нужен
+    for field in sender._meta.concrete_fields:
+        if isinstance(field, models.FileField):
+            file = getattr(instance, field.attname)
+            if file:
+                transaction.on_commit(partial(file.storage.delete, file.name))
+
+
+def _receivers():
+    yield post_save, _sync_month_amounts, Work, "work_month_amounts"
+    yield pre_delete, _drop_month_amounts, Work, "work_month_amounts_delete"
+    for model in REVISION_MODELS:
+        yield post_save, _on_save, model, f"changelog_save_{model.__name__}"
+        yield post_delete, _on_delete, model, f"changelog_delete_{model.__name__}"
+    for model in FILE_MODELS:
+        yield post_delete, _release_files, model, f"release_files_{model.__name__}"
+
+
+def connect():
+    for signal, receiver, sender, uid in _receivers():
+        signal.connect(receiver, sender=sender, dispatch_uid=uid)
+
+
+@contextmanager
+def suspended():
+    """
+    Отключить обработчики этого модуля на время блока: удаление без них не
+    вызывает пересчёт по каждой строке и может пройти быстрым DELETE.
+    Журнал, ревизии, зеркало и итоги вызывающий приводит в порядок сам.
+    Действует на весь процесс — только для команд, не в веб-воркерах.
+    """
+    for signal, receiver, sender, uid in _receivers():
+        signal.disconnect(receiver, sender=sender, dispatch_uid=uid)
+    try:
+        yield
+    finally:
+        connect()
@@ -0,0 +1,188 @@
+"""
+Снимок базы только для чтения под тяжёлые отчёты и выгрузки.
+
+refresh() копирует основную базу онлайн-бэкапом SQLite
+(sqlite3.Connection.backup) во временный файл и атомарно подменяет им
+снимок: копия согласована на момент начала, писателей в WAL не задерживает,
+а читатели старого снимка дочитывают уже открытый файл. Соединение
+"snapshot" открывает файл в mode=ro с PRAGMA query_only.
+
+Отчёты оборачиваются в use_snapshot(): внутри блока ReportingRouter
+отправляет чтения в снимок, запись всегда идёт в основную базу. Снимок
+старше REPORTING_SNAPSHOT_MAX_AGE обновляется фоновым потоком при
+обращении (одним процессом, под файловой блокировкой), а запрос тем
+временем читает прежний снимок; в самом запросе снимается только первая
+копия, когда снимка ещё нет. Чтобы отчёты не читали устаревшее, снимок
+обновляют командой refresh_snapshot --interval. При REPORTING_SNAPSHOT=0
+или без снимка всё читается из основной базы. Возраст снимка отдаётся в
+заголовке X-Snapshot-Age.
+"""
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ALIAS = "snapshot"
+AGE_HEADER = "X-Snapshot-Age"
+
+logger = logging.getLogger(__name__)
+
+_active = ContextVar("budget_reporting_snapshot", default=False)
+# занят, пока в этом процессе идёт фоновое обновление
+_refreshing = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, "REPORTING_SNAPSHOT", False) and ALIAS in settings.DATABASES
+
+
+def snapshot_path():
+    return Path(settings.REPORTING_SNAPSHOT_PATH)
+
+
+def age():
+    """Возраст снимка в секундах или None, если снимка нет."""
+    try:
+        return max(0.0, time.time() - snapshot_path().stat().st_mtime)
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def _lock(blocking):
+    path = snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "a") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def refresh(blocking=True, max_age=None):
+    """
+    Снять новую копию основной базы. С max_age снимок, который успел
+    обновить другой процесс, пока мы ждали блокировку, не переснимается.
+    Возвращает False, если blocking=False и снимок обновляет другой процесс.
+    """
+    target = snapshot_path()
+    with _lock(blocking) as acquired:
+        if not acquired:
+            return False
+        current = age()
+        if max_age is not None and current is not None and current <= max_age:
+            return True
+        tmp = target.with_name(target.name + ".tmp")
+        # отдельное соединение: бэкап через соединение с открытой транзакцией
+        # записи (atomic вокруг вызова) ждал бы сам себя; так копируется
+        # только зафиксированное
+        source = sqlite3.connect(
+            connections[DEFAULT_DB_ALIAS].settings_dict["NAME"], uri=True,
+            timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        )
+        dest = sqlite3.connect(tmp)
+        try:
+            started = time.time()
+            source.backup(dest)
+            # mode=ro не может создать -wal/-shm рядом со снимком — журнал обычный
+            dest.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dest.close()
+            source.close()
+        # возраст снимка считается от момента, на который он согласован
+        os.utime(tmp, (started, started))
+        os.replace(tmp, target)
+    return True
+
+
+def _refresh_logged(blocking):
+    try:
+        refresh(blocking=blocking, max_age=settings.REPORTING_SNAPSHOT_MAX_AGE)
+    except (OSError, sqlite3.Error):
+        logger.exception("Не удалось обновить снимок %s", snapshot_path())
+
+
+def _refresh_in_background():
+    def run():
+        try:
+            _refresh_logged(blocking=False)
+        finally:
+            _refreshing.release()
+
+    # поток уже обновляет снимок — второй не нужен
+    if _refreshing.acquire(blocking=False):
+        threading.Thread(target=run, name="snapshot-refresh", daemon=True).start()
+
+
+def _prepare():
+    """
+    Запустить обновление устаревшего снимка и переоткрыть соединение, если
+    файл подменён. Возвращает False, если читать снимок нельзя.
+    """
+    current = age()
+    if current is None:
+        # читать пока нечего: первую копию снимаем сразу, дожидаясь чужой
+        _refresh_logged(blocking=True)
+    elif current > settings.REPORTING_SNAPSHOT_MAX_AGE:
+        _refresh_in_background()
+    try:
+        inode = snapshot_path().stat().st_ino
+    except FileNotFoundError:
+        return False
+    # постоянное соединение держит прежний файл, пока его не закрыть
+    connection = connections[ALIAS]
+    if connection.connection is not None and getattr(connection, "snapshot_inode", None) != inode:
+        connection.close()
+    connection.snapshot_inode = inode
+    return True
+
+
+@contextmanager
+def use_snapshot():
+    """
+    Чтения внутри блока идут в снимок. Отдаёт возраст снимка в секундах
+    или None, если читается основная база.
+    """
+    if not enabled() or not _prepare():
+        yield None
+        return
+    token = _active.set(True)
+    try:
+        yield age()
+    finally:
+        _active.reset(token)
+
+
+def set_age_header(response, snapshot_age):
+    if snapshot_age is not None:
+        response[AGE_HEADER] = str(int(snapshot_age))
+    return response
+
+
+class ReportingRouter:
+    """Чтения внутри use_snapshot() — из снимка; запись и миграции — только в основной базе."""
+
+    def db_for_read(self, model, **hints):
+        return ALIAS if _active.get() else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ALIAS
@@ -0,0 +1,197 @@
+"""
+Хранилище загруженных файлов с дедупликацией по содержимому.
+
+ContentAddressedStorage пишет байты во временный файл, на ходу считая
+sha256, и кладёт их один раз в blobs/<aa>/<sha256>. Имя, которое получает
+FileField (materials/%Y/%m/<имя>, payment_comments/<имя>, ...), — это
+относительная символическая ссылка на такой файл. Повторная загрузка того
+же содержимого добавляет только ссылку, а лишняя копия сразу удаляется.
+
+Blob.refs считает имена, которые ссылаются на содержимое. delete() убирает
+имя, а когда ссылок не остаётся — и сам файл. Счётчик меняется в
+транзакции: в SQLite это BEGIN IMMEDIATE, поэтому одновременные save и
+delete одного содержимого не теряют файл.
+
+Имена файлов не меняются. Поэтому адреса /materials/..., проверка прав в
+serve_media и имя файла во фронтенде остаются прежними, а nginx и
+X-Sendfile просто идут по ссылке. Файлы, сохранённые до перехода на это
+хранилище, переносит в него команда dedupe_media.
+"""
+import hashlib
+import os
+import shutil
+import uuid
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from .models import Blob
+
+BLOB_DIR = "blobs"
+BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        while block := handle.read(BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, в котором одинаковое содержимое хранится один раз."""
+
+    def blob_path(self, digest):
+        return os.path.join(self.location, BLOB_DIR, digest[:2], digest)
+
+    def digest_of(self, name):
+        """sha256 содержимого, если name — ссылка на него, иначе None (обычный файл)."""
+        path = self.path(name)
+        try:
+            target = os.readlink(path)
+        except OSError:
+            return None
+        target = os.path.normpath(os.path.join(os.path.dirname(path), target))
+        if os.path.dirname(os.path.dirname(target)) != os.path.join(self.location, BLOB_DIR):
+            return None
+        return os.path.basename(target)
+
+    def _makedirs(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        # umask, потому что os.makedirs не применяет mode к промежуточным каталогам
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def _spool(self, content):
+        """Записать content во временный файл рядом с blobs -> (sha256, размер, путь)."""
+        tmp_dir = os.path.join(self.location, BLOB_DIR, "tmp")
+        self._makedirs(tmp_dir)
+        tmp = os.path.join(tmp_dir, uuid.uuid4().hex)
+        digest, size = hashlib.sha256(), 0
+        try:
+            with open(tmp, "wb") as handle:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    handle.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return digest.hexdigest(), size, tmp
+
+    def _acquire(self, digest, size, source):
+        """
+        Добавить ссылку на содержимое. Если его ещё нет, source переносится
+        в blobs; иначе source не трогается.
+        """
+        blob = self.blob_path(digest)
+        with transaction.atomic():
+            if Blob.objects.filter(digest=digest).update(refs=F("refs") + 1) and os.path.exists(blob):
+                return
+            # новое содержимое или потерянный файл при живой записи
+            self._makedirs(os.path.dirname(blob))
+            file_move_safe(source, blob, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(blob, self.file_permissions_mode)
+            Blob.objects.get_or_create(digest=digest, defaults={"size": size, "refs": 1})
+
+    def _release(self, digest):
+        with transaction.atomic():
+            Blob.objects.filter(digest=digest, refs__gt=0).update(refs=F("refs") - 1)
+            if Blob.objects.filter(digest=digest, refs=0).delete()[0]:
+                try:
+                    os.unlink(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def _link(self, name, digest):
+        """Создать имя name (или свободное похожее) ссылкой на содержимое."""
+        while True:
+            full_path = self.path(name)
+            directory = os.path.dirname(full_path)
+            self._makedirs(directory)
+            try:
+                os.symlink(os.path.relpath(self.blob_path(digest), directory), full_path)
+            except FileExistsError:
+                if self._allow_overwrite:
+                    self.delete(name)
+                else:
+                    name = self.get_available_name(name)
+                continue
+            return str(name).replace("\\", "/")
+
+    def _save(self, name, content):
+        if hasattr(content, "temporary_file_path"):
+            # файл уже на диске (большая загрузка, загрузка частями): хэш по
+            # нему или готовый, перенос переименованием
+            source, spooled = content.temporary_file_path(), False
+            digest = getattr(content, "sha256", None) or file_digest(source)
+            size = os.path.getsize(source)
+        else:
+            (digest, size, source), spooled = self._spool(content), True
+        try:
+            self._acquire(digest, size, source)
+        finally:
+            if spooled and os.path.exists(source):
+                os.unlink(source)
+        try:
+            return self._link(name, digest)
+        except BaseException:
+            self._release(digest)
+            raise
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        digest = self.digest_of(name)
+        if digest is None:
+            return super().delete(name)
+        try:
+            os.unlink(self.path(name))
+        except FileNotFoundError:
+            # имя уже снято другим вызовом — ссылку он и освободил
+            return
+        self._release(digest)
+
+    def adopt(self, name):
+        """
+        Перевести обычный файл name в хранилище содержимого, сохранив имя.
+        Возвращает размер освобождённого места (для дубликата) или None,
+        если переносить нечего.
+        """
+        path = self.path(name)
+        if os.path.islink(path) or not os.path.isfile(path):
+            return None
+        digest, size = file_digest(path), os.path.getsize(path)
+        blob = self.blob_path(digest)
+        duplicate = os.path.exists(blob)
+        # в blobs переносится жёсткая ссылка (или копия), а не сам файл:
+        # до подмены ссылкой имя должно указывать на содержимое
+        tmp_dir = os.path.join(self.location, BLOB_DIR, "tmp")
+        self._makedirs(tmp_dir)
+        source = os.path.join(tmp_dir, uuid.uuid4().hex)
+        try:
+            os.link(path, source)
+        except OSError:
+            shutil.copy2(path, source)
+        try:
+            self._acquire(digest, size, source)
+        finally:
+            # содержимое уже было в blobs: source не понадобился
+            if os.path.exists(source):
+                os.unlink(source)
+        # ссылка подменяет файл атомарно: имя не пропадает ни на миг
+        tmp_link = f"{path}.{uuid.uuid4().hex}.tmp"
+        os.symlink(os.path.relpath(blob, os.path.dirname(path)), tmp_link)
+        os.replace(tmp_link, path)
+        return size if duplicate else 0
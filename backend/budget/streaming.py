@@ -0,0 +1,191 @@
+"""
+Быстрый путь чтения дерева items → works → детали/материалы.
+
+Строки берутся через values(), собираются в обычные dict и отдаются
+JSON-массивом по одной статье, без экземпляров моделей и вложенных
+сериализаторов DRF. Результат побайтно совпадает с выводом
+BudgetItemSerializer через JSONRenderer, в том числе с ?fields=/?expand=:
+невыбранные поля не читаются, невыбранные связи не запрашиваются.
+"""
+from rest_framework import fields as drf_fields
+from rest_framework.renderers import JSONRenderer
+
+from .models import AccrualDetail, Material, PaymentDetail, Work
+from .serializers import (
+    AccrualDetailSerializer,
+    BudgetItemSerializer,
+    MaterialSerializer,
+    PaymentDetailSerializer,
+    WorkSerializer,
+)
+
+# статей в одной пачке запросов: память ограничена пачкой, а не всем годом
+CHUNK_SIZE = 50
+
+_decimal = drf_fields.DecimalField(max_digits=12, decimal_places=2)
+_datetime = drf_fields.DateTimeField()
+
+
+def _output_fields(serializer_class):
+    """Поля, которые сериализатор отдаёт наружу (без write_only)."""
+    declared = serializer_class._declared_fields
+    return [
+        name for name in serializer_class.Meta.fields
+        if not getattr(declared.get(name), "write_only", False)
+    ]
+
+
+def _column(model, name):
+    """Имя для values(): для FK — attname (work -> work_id)."""
+    field = model._meta.get_field(name)
+    return field.attname if field.is_relation else name
+
+
+class TreeStreamer:
+    """Генератор JSON-массива статей для GET /api/items/."""
+
+    def __init__(self, request, items, year=None, selection=None):
+        self.request = request
+        self.items = items
+        self.year = year
+        self.selection = selection
+        self.renderer = JSONRenderer()
+        self.item_output = self._selected("", list(BudgetItemSerializer.Meta.fields))
+        self.work_output = self._selected("works", _output_fields(WorkSerializer))
+        if "works" not in self.item_output:
+            self.work_output = []
+        self.work_columns = ["id", "item_id"] + [
+            _column(Work, f) for f in self.work_output
+            if f not in ("id", "payment_details", "accrual_details", "materials", "group")
+        ]
+        self.detail_fields = {
+            model: self._selected(f"works.{name}", _output_fields(serializer_class))
+            for model, name, serializer_class in (
+                (PaymentDetail, "payment_details", PaymentDetailSerializer),
+                (AccrualDetail, "accrual_details", AccrualDetailSerializer),
+            )
+            if name in self.work_output
+        }
+        self.work_material_fields = (
+            self._selected("works.materials", _output_fields(MaterialSerializer))
+            if "materials" in self.work_output else None
+        )
+        self.item_material_fields = (
+            self._selected("reports", _output_fields(MaterialSerializer))
+            if "reports" in self.item_output else None
+        )
+
+    def _selected(self, path, names):
+        if self.selection is None:
+            return names
+        return [name for name in names if self.selection.allows(path, name)]
+
+    # --- представление значений как в DRF ---------------------------------
+    def _file_url(self, model, name):
+        if not name:
+            return None
+        url = model._meta.get_field("file" if model is Material else "comment_file").storage.url(name)
+        return self.request.build_absolute_uri(url)
+
+    def _material(self, row, fields):
+        out = {}
+        for name in fields:
+            if name == "file":
+                out[name] = self._file_url(Material, row["file"])
+            elif name == "uploaded_at":
+                out[name] = _datetime.to_representation(row["uploaded_at"])
+            else:
+                out[name] = row[_column(Material, name)]
+        return out
+
+    def _detail(self, model, row):
+        out = {}
+        for name in self.detail_fields[model]:
+            value = row[name]
+            if name == "amount":
+                value = _decimal.to_representation(value) if value is not None else None
+            elif name == "comment_file":
+                value = self._file_url(model, value)
+            out[name] = value
+        return out
+
+    # --- выборки ------------------------------------------------------------
+    def _rows(self, model, columns, **lookup):
+        return model.objects.filter(**lookup).order_by("pk").values(*dict.fromkeys(columns))
+
+    def _group_by(self, rows, key):
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row[key], []).append(row)
+        return grouped
+
+    def _chunk(self, items):
+        item_ids = [item["id"] for item in items]
+        work_lookup = {"item_id__in": item_ids}
+        if self.year is not None:
+            work_lookup["year"] = self.year
+        works = list(self._rows(Work, self.work_columns, **work_lookup)) if "works" in self.item_output else []
+        work_ids = [w["id"] for w in works]
+
+        details = {
+            model: self._group_by(
+                self._rows(model, ["work_id"] + fields, work_id__in=work_ids), "work_id"
+            ) if work_ids else {}
+            for model, fields in self.detail_fields.items()
+        }
+        work_materials = item_materials = {}
+        if self.work_material_fields is not None and work_ids:
+            columns = ["work_id"] + [_column(Material, f) for f in self.work_material_fields]
+            work_materials = self._group_by(self._rows(Material, columns, work_id__in=work_ids), "work_id")
+        if self.item_material_fields is not None:
+            columns = ["item_id"] + [_column(Material, f) for f in self.item_material_fields]
+            item_materials = self._group_by(self._rows(Material, columns, item_id__in=item_ids), "item_id")
+        works_by_item = self._group_by(works, "item_id")
+
+        for item in items:
+            group = {"id": item["group_id"], "code": item["group__code"], "name": item["group__name"]}
+            work_nodes = []
+            for w in works_by_item.get(item["id"], []):
+                node = {}
+                for name in self.work_output:
+                    if name == "payment_details":
+                        node[name] = [self._detail(PaymentDetail, d)
+                                      for d in details[PaymentDetail].get(w["id"], [])]
+                    elif name == "accrual_details":
+                        node[name] = [self._detail(AccrualDetail, d)
+                                      for d in details[AccrualDetail].get(w["id"], [])]
+                    elif name == "materials":
+                        node[name] = [self._material(m, self.work_material_fields)
+                                      for m in work_materials.get(w["id"], [])]
+                    elif name == "group":
+                        node[name] = dict(group)
+                    else:
+                        node[name] = w[_column(Work, name)]
+                work_nodes.append(node)
+
+            out = {}
+            for name in self.item_output:
+                if name == "group":
+                    out[name] = group
+                elif name == "works":
+                    out[name] = work_nodes
+                elif name == "reports":
+                    out[name] = [self._material(m, self.item_material_fields)
+                                 for m in item_materials.get(item["id"], [])]
+                else:
+                    out[name] = item[name]
+            yield out
+
+    def __iter__(self):
+        item_columns = ["id"] + [
+            n for n in self.item_output if n not in ("id", "group", "works", "reports")
+        ] + ["group_id", "group__code", "group__name"]
+        # строк статей немного; тяжёлые вложенные выборки идут пачками
+        items = list(self.items.values(*item_columns))
+        separator = b""
+        yield b"["
+        for start in range(0, len(items), CHUNK_SIZE):
+            for node in self._chunk(items[start:start + CHUNK_SIZE]):
+                yield separator + self.renderer.render(node)
+                separator = b","
+        yield b"]"
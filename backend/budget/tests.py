@@ -1,3 +1,1460 @@
-from django.test import TestCase
+"""
+Тесты API и фоновых механизмов бюджета.
+
+BudgetTestCase — общие данные: пользователь с change_any_work, группа и
+seed(n) статей с работами, деталями, материалами и резервом.
+QueryCountTestCase добавляет к нему регрессионные тесты числа SQL-запросов:
+запрос выполняется на малом и на большом наборе данных, и число запросов
+не должно расти вместе с данными. При падении в сообщении перечислены
+запросы, число которых выросло (N+1).
+"""
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import Http404
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from openpyxl import Workbook, load_workbook
+from rest_framework.test import APIClient
+
+from . import cache as response_cache
+from . import imports, jobs, seeding, snapshot
+from .rollover import rollover
+from .transfers import serve
+from .models import (
+    AccrualDetail, ArticleReport, Blob, BudgetItem, Group, ImportJob, ItemQuarterRollup, Job, Material,
+    PaymentDetail, QuarterReserve, Upload, Work, WorkMonthAmount,
+)
+
+YEAR = 2025
+MEDIA_ROOT = tempfile.mkdtemp(prefix="budget-tests-")
+
+
+def _normalize(sql):
+    """SQL без конкретных значений: одинаковые запросы с разными id совпадают."""
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\d+(\.\d+)?", "?", sql)
+    sql = re.sub(r"\(\?(?:, \?)*\)", "(...)", sql)
+    sql = re.sub(r"(\(\.\.\.\)(, )?)+", "(...)", sql)
+    return re.sub(r"(WHEN .*? THEN \S+ )+", "WHEN ... ", sql)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False, MEDIA_ROOT=MEDIA_ROOT)
+class BudgetTestCase(TestCase):
+    """Пользователь, группа и наполнение статьями с работами для тестов API."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user("admin", password="x")
+        self.user.user_permissions.add(Permission.objects.get(codename="change_any_work"))
+        self.group = Group.objects.create(code="G", name="Группа")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.seeded = 0
+
+    def seed(self, count):
+        """Добавить статьи до count штук: у каждой работа с деталями, материалами и резерв."""
+        for i in range(self.seeded, count):
+            user = User.objects.create_user(f"user{i}")
+            item = BudgetItem.objects.create(name=f"Статья {i}", group=self.group, position=i)
+            work = Work.objects.create(
+                item=item, year=YEAR, name=f"Работа {i}", responsible=user,
+                accruals={"Янв": 100, "Фев": {"amount": 50, "status": "перенос"}},
+                payments={"Мар": 70},
+            )
+            PaymentDetail.objects.create(work=work, month="Мар", amount=70, creditor="ООО")
+            AccrualDetail.objects.create(work=work, month="Янв", amount=100)
+            Material.objects.create(work=work, file=SimpleUploadedFile(f"m{i}.pdf", b"x"))
+            Material.objects.create(item=item, file=SimpleUploadedFile(f"r{i}.pdf", b"x"))
+            QuarterReserve.objects.create(item=item, year=YEAR, quarter=1, accrual_sum=1000, payment_sum=1000)
+        self.seeded = max(self.seeded, count)
+
+
+class QueryCountTestCase(BudgetTestCase):
+    """Сравнение числа запросов на разных объёмах данных."""
+
+    def capture(self, request):
+        """Выполнить request() и вернуть (ответ, список SQL)."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = request()
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 300, getattr(response, "data", None))
+        return response, [q["sql"] for q in ctx.captured_queries]
+
+    def assertConstantQueries(self, make_request, small=2, large=6, setup=None):
+        """
+        make_request(n) выполняется после наполнения до small и до large статей;
+        число запросов должно совпасть. Первый вызов — прогревочный (кэш прав и т.п.),
+        setup(n), если задан, готовит данные перед каждым вызовом и не считается.
+        """
+        def measure(n):
+            if setup is not None:
+                setup(n)
+            return self.capture(lambda: make_request(n))[1]
+
+        self.seed(small)
+        measure(small)
+        before = measure(small)
+        self.seed(large)
+        after = measure(large)
+        if len(before) == len(after):
+            return
+        grown = Counter(map(_normalize, after))
+        grown.subtract(Counter(map(_normalize, before)))
+        offending = "\n".join(
+            f"  +{extra}: {sql}" for sql, extra in grown.most_common() if extra > 0
+        )
+        self.fail(
+            f"Число запросов растёт с объёмом данных: {len(before)} при {small}, "
+            f"{len(after)} при {large}.\nЛишние запросы:\n{offending}"
+        )
+
+
+class ReadQueryCountTests(QueryCountTestCase):
+    """Списки API: число запросов не зависит от числа строк."""
+
+    def get(self, url):
+        return lambda n: self.client.get(url, HTTP_ACCEPT="application/json")
+
+    def test_items_stream(self):
+        self.assertConstantQueries(self.get(f"/api/items/?year={YEAR}"))
+
+    def test_items_paginated(self):
+        self.assertConstantQueries(self.get(f"/api/items/?year={YEAR}&limit=100"))
+
+    def test_items_sparse(self):
+        self.assertConstantQueries(self.get("/api/items/?limit=100&fields=name,works.name&expand="))
+
+    def test_items_browsable(self):
+        self.assertConstantQueries(lambda n: self.client.get(f"/api/items/?year={YEAR}&format=api"))
+
+    def test_works(self):
+        self.assertConstantQueries(self.get("/api/works/"))
+
+    def test_works_sparse(self):
+        self.assertConstantQueries(self.get("/api/works/?fields=name,group&expand=materials"))
+
+    def test_materials(self):
+        self.assertConstantQueries(self.get("/api/materials/"))
+
+    def test_reserves(self):
+        self.assertConstantQueries(self.get(f"/api/reserves/?year={YEAR}"))
+
+    def test_users(self):
+        self.assertConstantQueries(self.get("/api/users/"))
+
+    def test_summary(self):
+        self.assertConstantQueries(self.get(f"/api/summary/?year={YEAR}"))
+
+    def test_changes(self):
+        self.assertConstantQueries(self.get("/api/changes/?since=0"))
+
+
+class WriteQueryCountTests(QueryCountTestCase):
+    """Запись: число запросов не зависит от размера пакета или числа деталей."""
+
+    def work_payload(self, n):
+        """Работа с n деталями каждого вида; суммы по месяцам одинаковы при любом n."""
+        months = ["Янв", "Фев", "Мар", "Апр", "Май", "Июн", "Июл", "Авг"]
+        item = BudgetItem.objects.first()
+        return {
+            "item": item.id, "year": YEAR, "name": "Новая", "responsible": self.user.id,
+            "accruals": {"Янв": 10, "Фев": 20},
+            "payment_details": [{"month": m, "amount": "10.00", "fp": "ФП"} for m in months[:n]],
+            "accrual_details": [{"month": m, "amount": "5.00"} for m in months[:n]],
+        }
+
+    def create_work(self, n):
+        response = self.client.post("/api/works/", self.work_payload(n), format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data["id"]
+
+    def test_create_work(self):
+        self.assertConstantQueries(
+            lambda n: self.client.post("/api/works/", self.work_payload(n), format="json"),
+        )
+
+    def test_update_work_details(self):
+        def setup(n):
+            self.target = self.create_work(0)
+        self.assertConstantQueries(
+            lambda n: self.client.put(f"/api/works/{self.target}/", self.work_payload(n), format="json"),
+            setup=setup,
+        )
+
+    def test_delete_work(self):
+        def setup(n):
+            self.target = self.create_work(n)
+        self.assertConstantQueries(lambda n: self.client.delete(f"/api/works/{self.target}/"), setup=setup)
+
+    def test_bulk_update(self):
+        amounts = itertools.count(100)
+
+        def request(n):
+            # сумма меняется на каждом вызове, чтобы итоги действительно пересчитывались
+            amount = next(amounts)
+            rows = [{"id": w.id, "feasibility": "red", "responsible": self.user.id, "payments": {"Мар": amount}}
+                    for w in Work.objects.all()]
+            return self.client.post("/api/works/bulk/", rows, format="json")
+        self.assertConstantQueries(request)
+
+    def test_write_off_batch(self):
+        def request(n):
+            rows = [{"item": r.item_id, "year": YEAR, "quarter": 1, "acc": 1, "pay": 1}
+                    for r in QuarterReserve.objects.all()]
+            return self.client.post("/api/reserves/write_off/", rows, format="json")
+        self.assertConstantQueries(request)
+
+
+class ConditionalGetTests(BudgetTestCase):
+    """ETag списков по счётчикам Revision и ответ 304 на If-None-Match."""
+
+    def setUp(self):
+        super().setUp()
+        self.seed(2)
+
+    def get(self, url, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        response = self.client.get(url, HTTP_ACCEPT="application/json", **headers)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    def test_not_modified(self):
+        url = f"/api/items/?year={YEAR}"
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+        # 304 отдаётся по одной выборке счётчиков, без статей и работ
+        with self.assertNumQueries(1):
+            response = self.get(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertFalse(response.content)
+        self.assertEqual(self.get(url, f'W/{etag}, "other"').status_code, 304)
+        self.assertEqual(self.get(url, "*").status_code, 304)
+        # ETag зависит от параметров запроса
+        self.assertNotEqual(self.get(f"{url}&limit=1")["ETag"], etag)
+
+    def test_changed_after_write(self):
+        url = f"/api/items/?year={YEAR}"
+        etag = self.get(url)["ETag"]
+        work = Work.objects.first()
+        self.client.patch(f"/api/works/{work.pk}/", {"name": "Другая"}, format="json")
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(self.get(url, response["ETag"]).status_code, 304)
+
+    def test_login_keeps_users_etag(self):
+        etag = self.get("/api/users/")["ETag"]
+        response = self.client.post("/api/login/", {"username": "admin", "password": "x"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(User.objects.get(username="admin").last_login)
+        self.assertEqual(self.get("/api/users/", etag).status_code, 304)
+        User.objects.get(username="admin").save(update_fields=["first_name"])
+        self.assertEqual(self.get("/api/users/", etag).status_code, 200)
+
+    def test_reserves_by_year(self):
+        url = f"/api/reserves/?year={YEAR}"
+        etag, all_years = self.get(url)["ETag"], self.get("/api/reserves/")["ETag"]
+        QuarterReserve.objects.create(item=BudgetItem.objects.first(), year=YEAR + 1, quarter=1,
+                                      accrual_sum=10, payment_sum=10)
+        # резерв другого года не сбрасывает ETag этого года, но меняет общий
+        self.assertEqual(self.get(url, etag).status_code, 304)
+        self.assertEqual(self.get("/api/reserves/", all_years).status_code, 200)
+        QuarterReserve.objects.filter(year=YEAR).first().save()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+
+class ChangesFeedTests(BudgetTestCase):
+    """Лента /api/changes/: изменённые строки и удалённые id после курсора."""
+
+    def setUp(self):
+        super().setUp()
+        self.seed(2)
+        self.work, self.other = Work.objects.order_by("pk")
+        self.cursor = self.changes()["cursor"]
+
+    def changes(self, **params):
+        response = self.client.get("/api/changes/", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_without_since(self):
+        data = self.changes()
+        self.assertEqual(data["cursor"], self.cursor)
+        self.assertTrue(all(not rows for rows in data["changed"].values()))
+
+    def test_changed_and_deleted(self):
+        self.client.patch(f"/api/works/{self.work.pk}/", {"name": "Другая"}, format="json")
+        detail = PaymentDetail.objects.create(work=self.work, month="Апр", amount=5)
+        detail_id = detail.pk
+        detail.delete()
+        QuarterReserve.objects.filter(item=self.other.item).first().save()
+
+        data = self.changes(since=self.cursor)
+        self.assertGreater(data["cursor"], self.cursor)
+        self.assertEqual([w["name"] for w in data["changed"]["works"]], ["Другая"])
+        self.assertEqual(len(data["changed"]["reserves"]), 1)
+        # созданная и удалённая после курсора деталь приходит только как удалённая
+        self.assertEqual(data["deleted"]["payment_details"], [detail_id])
+        self.assertFalse(data["changed"]["payment_details"])
+        # с нового курсора изменений нет
+        data = self.changes(since=data["cursor"])
+        self.assertTrue(all(not rows for rows in data["changed"].values()))
+        self.assertTrue(all(not ids for ids in data["deleted"].values()))
+
+    def test_year(self):
+        Work.objects.filter(pk=self.other.pk).update(year=YEAR + 1)
+        self.client.patch(f"/api/works/{self.work.pk}/", {"name": "Эта"}, format="json")
+        self.client.patch(f"/api/works/{self.other.pk}/", {"name": "Следующий год"}, format="json")
+        names = [w["name"] for w in self.changes(since=self.cursor, year=YEAR)["changed"]["works"]]
+        self.assertEqual(names, ["Эта"])
+
+
+class MonthAmountTests(BudgetTestCase):
+    """WorkMonthAmount повторяет JSON-карты работы после любой записи."""
+
+    def setUp(self):
+        super().setUp()
+        self.seed(2)
+        self.work, self.other = Work.objects.order_by("pk")
+
+    def assertMirrors(self, work):
+        work.refresh_from_db()
+        columns = ("item_id", "year", "month", "kind", "amount", "status")
+        expected = {tuple(getattr(row, c) for c in columns) for row in WorkMonthAmount.rows_for(work)}
+        stored = set(WorkMonthAmount.objects.filter(work=work).values_list(*columns))
+        self.assertEqual(stored, expected)
+        return stored
+
+    def test_seeded(self):
+        stored = self.assertMirrors(self.work)
+        self.assertIn((self.work.item_id, YEAR, 2, "plan_acc", Decimal("50"), "перенос"), stored)
+
+    def test_update(self):
+        response = self.client.patch(f"/api/works/{self.work.pk}/", {
+            "accruals": {"Апр": {"amount": "12.50", "status": "ожидание"}},
+            "actual_payments": {"Мар": 70, "Дек": 5},
+        }, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        stored = self.assertMirrors(self.work)
+        self.assertEqual({(month, kind) for _, _, month, kind, _, _ in stored},
+                         {(4, "plan_acc"), (3, "plan_pay"), (3, "fact_pay"), (12, "fact_pay")})
+
+    def test_not_a_map(self):
+        response = self.client.patch(f"/api/works/{self.work.pk}/",
+                                     {"accruals": [1, 2], "payments": "70"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.assertMirrors(self.work), set())
+        call_command("rebuild_rollups", "--verify", stdout=io.StringIO())
+
+    def test_move_and_bulk(self):
+        rows = [{"id": self.work.pk, "item": self.other.item_id, "payments": {"Июн": 1}},
+                {"id": self.other.pk, "year": YEAR + 1}]
+        response = self.client.post("/api/works/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.assertMirrors(self.work).pop()[0], self.other.item_id)
+        self.assertEqual(self.assertMirrors(self.other).pop()[1], YEAR + 1)
+
+    def test_delete(self):
+        self.client.delete(f"/api/works/{self.work.pk}/")
+        self.assertFalse(WorkMonthAmount.objects.filter(work_id=self.work.pk).exists())
+        self.assertMirrors(self.other)
+
+
+class RollupConsistencyTests(BudgetTestCase):
+    """ItemQuarterRollup после правок совпадает с пересчётом с нуля (rebuild_rollups --verify)."""
+
+    def setUp(self):
+        super().setUp()
+        self.seed(2)
+        self.work, self.other = Work.objects.order_by("pk")
+
+    def assertConsistent(self):
+        call_command("rebuild_rollups", "--verify", stdout=io.StringIO())
+
+    def quarter(self, item_id, quarter=1):
+        rows = ItemQuarterRollup.objects.filter(item_id=item_id, year=YEAR, quarter=quarter)
+        return {f: sum(getattr(r, f) for r in rows) for f in ("plan_acc", "plan_pay", "reserve_used_acc")}
+
+    def test_seeded(self):
+        self.assertConsistent()
+        # «перенос» в феврале в итог не входит
+        self.assertEqual(self.quarter(self.work.item_id),
+                         {"plan_acc": 100, "plan_pay": 70, "reserve_used_acc": 0})
+
+    def test_work_edits(self):
+        self.client.patch(f"/api/works/{self.work.pk}/", {"accruals": {"Янв": 40, "Май": 10}}, format="json")
+        self.assertConsistent()
+        self.assertEqual(self.quarter(self.work.item_id)["plan_acc"], 40)
+        rows = [{"id": self.work.pk, "item": self.other.item_id}, {"id": self.other.pk, "year": YEAR + 1}]
+        self.assertEqual(self.client.post("/api/works/bulk/", rows, format="json").status_code, 200)
+        self.assertConsistent()
+        self.assertEqual(self.quarter(self.other.item_id)["plan_acc"], 40)
+        self.client.delete(f"/api/works/{self.work.pk}/")
+        self.assertConsistent()
+        self.assertEqual(self.quarter(self.other.item_id)["plan_acc"], 0)
+
+    def test_reserve_edits(self):
+        reserve = QuarterReserve.objects.get(item=self.work.item)
+        self.client.post(f"/api/reserves/{reserve.pk}/write_off/", {"acc": "15.5"}, format="json")
+        self.assertConsistent()
+        self.assertEqual(self.quarter(self.work.item_id)["reserve_used_acc"], Decimal("15.5"))
+        # перенос резерва в другой квартал, статью и год убирает прежнюю строку итогов
+        for change in ({"quarter": 2}, {"item": self.other.item_id}, {"year": YEAR + 1}):
+            response = self.client.patch(f"/api/reserves/{reserve.pk}/", change, format="json")
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertConsistent()
+        self.assertEqual(self.quarter(self.work.item_id, quarter=2)["reserve_used_acc"], 0)
+        # для прежнего года перенесённый резерв — удалённый
+        feed = self.client.get("/api/changes/", {"since": 0, "year": YEAR}).data
+        self.assertIn(reserve.pk, feed["deleted"]["reserves"])
+        self.client.delete(f"/api/reserves/{reserve.pk}/")
+        self.assertConsistent()
+
+
+class FieldSelectionTests(BudgetTestCase):
+    """?fields= и ?expand=: выбранные поля в ответе и только нужные выборки."""
+
+    def setUp(self):
+        super().setUp()
+        self.seed(2)
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return json.loads(b"".join(response.streaming_content))
+        return response.json()
+
+    def test_works_fields(self):
+        works = self.get("/api/works/?fields=name,accruals,payment_details.amount")
+        self.assertEqual(set(works[0]), {"id", "name", "accruals", "payment_details"})
+        self.assertEqual([set(d) for d in works[0]["payment_details"]], [{"id", "amount"}])
+
+    def test_works_expand(self):
+        full = self.get("/api/works/")[0]
+        work = self.get("/api/works/?expand=materials")[0]
+        self.assertEqual(set(full) - set(work), {"payment_details", "accrual_details"})
+        self.assertEqual(work["materials"], full["materials"])
+        with CaptureQueriesContext(connection) as everything:
+            self.get("/api/works/")
+        with CaptureQueriesContext(connection) as bare:
+            self.get("/api/works/?expand=")
+        # невыбранные связи не подгружаются
+        self.assertEqual(len(everything) - len(bare), 3)
+
+    def test_items_stream_matches_pages(self):
+        query = f"year={YEAR}&fields=name,works.name,works.materials&expand=materials"
+        streamed = self.get(f"/api/items/?{query}")
+        paged = self.get(f"/api/items/?{query}&limit=100")["results"]
+        self.assertEqual(streamed, paged)
+        self.assertEqual(set(streamed[0]), {"id", "name", "works"})
+        self.assertEqual(set(streamed[0]["works"][0]), {"id", "name", "materials"})
+
+    def test_write_ignores_selection(self):
+        work = Work.objects.first()
+        response = self.client.patch(f"/api/works/{work.pk}/?fields=name", {"name": "Другая"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertIn("payment_details", response.data)
+
+
+class BulkUpdateTests(BudgetTestCase):
+    """POST /api/works/bulk/: всё или ничего, ошибки по строкам."""
+
+    def setUp(self):
+        super().setUp()
+        self.seed(2)
+        self.work, self.other = Work.objects.order_by("pk")
+
+    def bulk(self, rows):
+        return self.client.post("/api/works/bulk/", rows, format="json")
+
+    def test_updates_all(self):
+        response = self.bulk([{"id": self.work.pk, "feasibility": "red"},
+                              {"id": self.other.pk, "name": "Другая", "responsible": self.user.pk}])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["updated"], [self.work.pk, self.other.pk])
+        self.work.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.work.feasibility, "red")
+        self.assertEqual((self.other.name, self.other.responsible_id), ("Другая", self.user.pk))
+
+    def test_errors_change_nothing(self):
+        response = self.bulk([{"id": self.work.pk, "name": "Другая"},
+                              {"id": 0, "name": "x"},
+                              {"id": self.work.pk, "feasibility": "red"},
+                              {"id": self.other.pk, "year": "год"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e["index"] for e in response.data["errors"]], [1, 2, 3])
+        self.assertEqual(response.data["errors"][0]["errors"], {"id": ["Работа не найдена"]})
+        self.work.refresh_from_db()
+        self.assertEqual(self.work.name, "Работа 0")
+
+    def test_foreign_work(self):
+        self.user.user_permissions.clear()
+        self.user = User.objects.get(pk=self.user.pk)
+        self.client.force_authenticate(self.user)
+        response = self.bulk([{"id": self.work.pk, "name": "Другая"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"][0]["errors"], {"id": ["Нельзя редактировать чужую работу"]})
+
+
+class DetailUpsertTests(BudgetTestCase):
+    """Детали работы при сохранении сопоставляются по месяцу, а не пересоздаются."""
+
+    def setUp(self):
+        super().setUp()
+        self.seed(1)
+        self.work = Work.objects.get()
+        self.detail = PaymentDetail.objects.get()
+        self.detail.comment_file.save("note.txt", ContentFile(b"note"))
+
+    def patch(self, rows):
+        response = self.client.patch(f"/api/works/{self.work.pk}/", {"payment_details": rows}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        return {d.month: d for d in PaymentDetail.objects.filter(work=self.work)}
+
+    def test_upsert(self):
+        details = self.patch([{"month": "Мар", "amount": "75.00", "creditor": "ООО"},
+                              {"month": "Апр", "amount": "5.00"}])
+        self.assertEqual(set(details), {"Мар", "Апр"})
+        # изменённая деталь — та же строка, файл комментария остался
+        march = details["Мар"]
+        self.assertEqual((march.pk, march.amount), (self.detail.pk, Decimal("75.00")))
+        self.assertEqual(march.comment_file.name, self.detail.comment_file.name)
+
+        details = self.patch([{"month": "Апр", "amount": "5.00"}])
+        self.assertEqual(set(details), {"Апр"})
+        self.assertFalse(PaymentDetail.objects.filter(pk=self.detail.pk).exists())
+
+    def test_unchanged_not_written(self):
+        before = self.detail.updated_at
+        details = self.patch([{"month": "Мар", "amount": "70.00", "creditor": "ООО"}])
+        self.assertEqual(details["Мар"].updated_at, before)
+
+
+class SQLiteProfileTests(TestCase):
+    """Профиль SQLite из settings: PRAGMA при подключении и BEGIN IMMEDIATE."""
+
+    def connect(self):
+        # отдельное соединение с файлом: у тестовой базы в памяти нет WAL
+        path = Path(tempfile.mkdtemp(prefix="budget-sqlite-")) / "db.sqlite3"
+        self.addCleanup(shutil.rmtree, path.parent, ignore_errors=True)
+        wrapper = DatabaseWrapper({**connection.settings_dict, "NAME": str(path)}, alias="profile")
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper, path
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        wrapper, _ = self.connect()
+        self.assertEqual(self.pragma(wrapper, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(wrapper, "synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, "busy_timeout"), settings.SQLITE_BUSY_TIMEOUT_MS)
+        self.assertEqual(self.pragma(wrapper, "temp_store"), 2)  # MEMORY
+
+    def test_begin_immediate(self):
+        wrapper, path = self.connect()
+        connections["profile"] = wrapper
+        self.addCleanup(connections.__delitem__, "profile")
+        other = sqlite3.connect(path, timeout=0)
+        self.addCleanup(other.close)
+        with transaction.atomic(using="profile"):
+            # блокировка записи взята уже при BEGIN, до первой записи
+            with self.assertRaisesRegex(sqlite3.OperationalError, "locked"):
+                other.execute("BEGIN IMMEDIATE")
+
+
+class ItemTreeTests(BudgetTestCase):
+    """Дерево items/: ограничение по году и группе, постраничный режим по ?limit=."""
+
+    def setUp(self):
+        super().setUp()
+        self.seed(3)
+        first = BudgetItem.objects.order_by("position").first()
+        Work.objects.create(item=first, year=YEAR + 1, name="Следующий год", responsible=self.user)
+        self.other_group = Group.objects.create(code="H", name="Другая")
+        BudgetItem.objects.filter(pk=first.pk).update(group=self.other_group)
+
+    def get(self, query):
+        response = self.client.get(f"/api/items/?{query}", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b"".join(response.streaming_content) if response.streaming else response.content)
+
+    def test_year_and_group(self):
+        items = self.get(f"year={YEAR}")
+        self.assertEqual({w["year"] for item in items for w in item["works"]}, {YEAR})
+        items = self.get(f"year={YEAR + 1}&group={self.other_group.pk}")
+        self.assertEqual([[w["name"] for w in item["works"]] for item in items], [["Следующий год"]])
+
+    def test_pages(self):
+        page = self.get(f"year={YEAR}&limit=2&page=2")
+        self.assertEqual(page["count"], 3)
+        self.assertIsNone(page["next"])
+        self.assertEqual(len(page["results"]), 1)
+        # страницы вместе дают тот же список, что и поток
+        first = self.get(f"year={YEAR}&limit=2")["results"]
+        self.assertEqual(first + page["results"], self.get(f"year={YEAR}"))
+
+
+class ItemStreamTests(BudgetTestCase):
+    """Поток items/ из values() совпадает с ответом сериализаторов DRF."""
+
+    def test_matches_serializer(self):
+        self.seed(2)
+        item = BudgetItem.objects.order_by("position").first()
+        ArticleReport.objects.create(item=item, file=SimpleUploadedFile("report.pdf", b"x"))
+        Work.objects.create(item=item, year=YEAR, name="Без ответственного", justification="Основание")
+        detail = PaymentDetail.objects.filter(work__item=item).get()
+        detail.comment_file.save("note.txt", ContentFile(b"note"))
+        BudgetItem.objects.create(name="Пустая статья", group=self.group, position=10)
+
+        response = self.client.get(f"/api/items/?year={YEAR}", HTTP_ACCEPT="application/json")
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b"".join(response.streaming_content))
+        serialized = self.client.get(f"/api/items/?year={YEAR}&limit=100").json()["results"]
+        self.assertEqual(streamed, serialized)
+        self.assertEqual(len(streamed), 3)
+
+
+class SummaryTests(BudgetTestCase):
+    """Сводка /api/summary/ по итогам ItemQuarterRollup."""
+
+    def test_totals(self):
+        self.seed(2)
+        work = Work.objects.order_by("pk").first()
+        work.actual_payments = {"Апр": {"amount": 30, "status": "оплачено"},
+                                "Май": {"amount": 5, "status": "перенос"}}
+        work.save()
+        data = self.client.get("/api/summary/", {"year": YEAR}).data
+        # «перенос» в итоги не входит
+        self.assertEqual(data["totals"], {"plan_acc": 200.0, "plan_pay": 140.0, "fact_acc": 0.0, "fact_pay": 30.0})
+        item = data["groups"][0]["items"][0]
+        self.assertEqual(item["quarters"][2]["fact_pay"], 30.0)
+        self.assertEqual(item["months"]["Апр"]["fact_pay"], 30.0)
+        self.assertEqual(item["months"]["Фев"]["plan_acc"], 0.0)
+        self.assertEqual(data["groups"][0]["totals"], data["totals"])
+        empty = Group.objects.create(code="E", name="Пустая")
+        data = self.client.get("/api/summary/", {"year": YEAR, "group": empty.pk}).data
+        self.assertEqual((data["groups"], set(data["totals"].values())), ([], {0.0}))
+
+
+class ReserveWriteOffTests(BudgetTestCase):
+    """Списание резерва: точный остаток, нехватка, пакет «всё или ничего»."""
+
+    def setUp(self):
+        super().setUp()
+        self.seed(2)
+        self.reserve, self.other = QuarterReserve.objects.order_by("pk")
+        QuarterReserve.objects.filter(pk=self.reserve.pk).update(accrual_sum=Decimal("0.3"), used_acc=Decimal("0.1"))
+
+    def test_exact_remainder(self):
+        # в REAL 0.1 + 0.2 > 0.3: остаток сравнивается в копейках
+        response = self.client.post(f"/api/reserves/{self.reserve.pk}/write_off/", {"acc": "0.2"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.reserve.refresh_from_db()
+        self.assertEqual(self.reserve.used_acc, Decimal("0.30"))
+        response = self.client.post(f"/api/reserves/{self.reserve.pk}/write_off/", {"acc": "0.01"}, format="json")
+        self.assertEqual(response.data["detail"], "Недостаточно резерва Н")
+
+    def test_batch_exact_remainder(self):
+        rows = [{"item": self.reserve.item_id, "year": YEAR, "quarter": 1, "acc": "0.1"},
+                {"item": self.reserve.item_id, "year": YEAR, "quarter": 1, "acc": "0.1"}]
+        response = self.client.post("/api/reserves/write_off/", rows, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_float_sums(self):
+        # фронт шлёт суммы, сложенные числами JS: 0.1 + 0.2 = 0.30000000000000004
+        response = self.client.post(f"/api/reserves/{self.other.pk}/write_off/",
+                                    {"acc": 0.1 + 0.2, "pay": 0.7 + 0.1}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.used_acc, self.other.used_pay), (Decimal("0.30"), Decimal("0.80")))
+        rows = [{"item": self.reserve.item_id, "year": YEAR, "quarter": 1, "acc": 0.1 + 0.1 - 0.0000001},
+                {"item": self.other.item_id, "year": YEAR, "quarter": 1, "pay": 1.005}]
+        response = self.client.post("/api/reserves/write_off/", rows, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.reserve.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.reserve.used_acc, self.other.used_pay), (Decimal("0.30"), Decimal("1.81")))
+        response = self.client.post(f"/api/reserves/{self.other.pk}/write_off/", {"acc": "много"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_shortage_rolls_back(self):
+        rows = [{"item": self.other.item_id, "year": YEAR, "quarter": 1, "pay": "10"},
+                {"item": self.reserve.item_id, "year": YEAR, "quarter": 1, "acc": "0.21"}]
+        response = self.client.post("/api/reserves/write_off/", rows, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"], [{"index": 1, "detail": "Недостаточно резерва Н"}])
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.used_pay, 0)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True, CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "responses": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "budget-tests"},
+})
+class ResponseCacheTests(BudgetTestCase):
+    """Общий кэш ответов: попадание, сдвиг ревизии после записи, счётчики."""
+
+    def setUp(self):
+        super().setUp()
+        caches["responses"].clear()
+        response_cache.reset_stats()
+
+    def get_items(self):
+        response = self.client.get(f"/api/items/?year={YEAR}", HTTP_ACCEPT="application/json")
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return response["X-Cache"], content
+
+    def test_hit_and_invalidation(self):
+        self.seed(2)
+        status, first = self.get_items()
+        self.assertEqual(status, "MISS")
+        self.assertEqual(self.get_items(), ("HIT", first))
+
+        work = Work.objects.first()
+        response = self.client.patch(f"/api/works/{work.pk}/", {"name": "Другая"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        status, content = self.get_items()
+        self.assertEqual(status, "MISS")
+        self.assertIn("Другая".encode(), content)
+
+    def test_warm_cache(self):
+        self.seed(1)
+        User.objects.create_superuser("root", password="x")
+        out = io.StringIO()
+        call_command("warm_cache", "--years", str(YEAR), "--base-url", "http://testserver", stdout=out)
+        self.assertIn(f"/api/items/ {{'year': {YEAR}}}: 200 MISS", out.getvalue())
+        # прогретый ответ достаётся и обычному запросу
+        self.assertEqual(self.get_items()[0], "HIT")
+
+    def test_stats(self):
+        self.seed(1)
+        self.get_items()
+        # до сброса счётчики живут в памяти процесса, общий кэш не трогается
+        self.assertEqual(caches["responses"].get("stats:miss"), 0)
+        self.get_items()
+        self.assertEqual(response_cache.stats(), {"hit": 1, "miss": 1})
+        out = io.StringIO()
+        call_command("warm_cache", "--stats", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "hit=1, miss=1")
+        with mock.patch.object(response_cache, "STATS_FLUSH_SECONDS", 0):
+            self.get_items()
+        self.assertEqual(caches["responses"].get("stats:hit"), 2)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False, SERVER_TIMING=True, SERVER_TIMING_LOG_MS=0)
+class ServerTimingTests(BudgetTestCase):
+    """Заголовок Server-Timing и строка лога budget.timing."""
+
+    def test_phases(self):
+        self.seed(2)
+        with self.assertLogs("budget.timing", "INFO") as logs:
+            response = self.client.get("/api/works/", HTTP_ACCEPT="application/json")
+        header = response["Server-Timing"]
+        for phase in ("db;", "serialize;", "render;", "total;"):
+            self.assertIn(phase, header)
+        self.assertIn('"queries":', logs.output[0])
+
+    def test_streamed(self):
+        self.seed(2)
+        with self.assertLogs("budget.timing", "INFO") as logs:
+            response = self.client.get(f"/api/items/?year={YEAR}", HTTP_ACCEPT="application/json")
+            self.assertTrue(response.streaming)
+            b"".join(response.streaming_content)
+        self.assertIn("total;", response["Server-Timing"])
+        self.assertIn('"streamed": true', logs.output[0])
+
+
+@override_settings(REPORTING_SNAPSHOT=True, REPORTING_SNAPSHOT_MAX_AGE=300)
+class ReportingSnapshotTests(TransactionTestCase):
+    """Снимок для отчётов и маршрутизация чтений (снимок видит только зафиксированное)."""
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp(prefix="budget-snapshot-")
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        settings = override_settings(REPORTING_SNAPSHOT_PATH=Path(tmp) / "snapshot.sqlite3")
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_refresh(self):
+        Group.objects.create(code="snap", name="Снимок")
+        self.assertIsNone(snapshot.age())
+        self.assertTrue(snapshot.refresh())
+        self.assertLess(snapshot.age(), 60)
+        db = sqlite3.connect(snapshot.snapshot_path().as_uri() + "?mode=ro", uri=True)
+        try:
+            self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+            self.assertEqual(
+                db.execute("SELECT count(*) FROM budget_group WHERE code = 'snap'").fetchone()[0], 1,
+            )
+            with self.assertRaises(sqlite3.OperationalError):
+                db.execute("DELETE FROM budget_group")
+        finally:
+            db.close()
+
+    def test_routing(self):
+        router = snapshot.ReportingRouter()
+        self.assertIsNone(router.db_for_read(Work))
+        with snapshot.use_snapshot() as age:
+            # снимка не было — он снимается при первом обращении
+            self.assertIsNotNone(age)
+            self.assertEqual(router.db_for_read(Work), snapshot.ALIAS)
+            self.assertEqual(router.db_for_write(Work), "default")
+        self.assertIsNone(router.db_for_read(Work))
+        self.assertFalse(router.allow_migrate(snapshot.ALIAS, "budget"))
+
+    def test_stale_refreshed_in_background(self):
+        snapshot.refresh()
+        stale = time.time() - 3600
+        os.utime(snapshot.snapshot_path(), (stale, stale))
+        Group.objects.create(code="snap", name="Снимок")
+        with mock.patch.object(snapshot, "refresh", wraps=snapshot.refresh) as refresh:
+            with snapshot.use_snapshot() as age:
+                # запрос читает прежний снимок, не дожидаясь новой копии
+                self.assertGreater(age, 3000)
+            with snapshot._refreshing:
+                pass
+        refresh.assert_called_once_with(blocking=False, max_age=300)
+        self.assertLess(snapshot.age(), 60)
+        db = sqlite3.connect(snapshot.snapshot_path())
+        try:
+            self.assertEqual(
+                db.execute("SELECT count(*) FROM budget_group WHERE code = 'snap'").fetchone()[0], 1,
+            )
+        finally:
+            db.close()
+
+    @override_settings(REPORTING_SNAPSHOT=False)
+    def test_disabled(self):
+        with snapshot.use_snapshot() as age:
+            self.assertIsNone(age)
+            self.assertIsNone(snapshot.ReportingRouter().db_for_read(Work))
+        self.assertIsNone(snapshot.age())
+
+
+class TransferTests(BudgetTestCase):
+    """Отдача файлов и потоковых ответов под ASGI и WSGI."""
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp(prefix="budget-media-")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.content = os.urandom(200 * 1024)
+        with open(os.path.join(self.root, "scan.pdf"), "wb") as handle:
+            handle.write(self.content)
+
+    async def test_serve_asgi(self):
+        response = await serve(AsyncRequestFactory().get("/materials/scan.pdf"), "scan.pdf", self.root)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Length"], str(len(self.content)))
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(b"".join([chunk async for chunk in response.streaming_content]), self.content)
+
+        request = AsyncRequestFactory().get(
+            "/materials/scan.pdf", headers={"If-Modified-Since": response["Last-Modified"]},
+        )
+        self.assertEqual((await serve(request, "scan.pdf", self.root)).status_code, 304)
+
+    def test_range(self):
+        get = lambda **headers: async_to_sync(serve)(
+            RequestFactory().get("/materials/scan.pdf", headers=headers), "scan.pdf", self.root,
+        )
+        response = get(Range="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.content)}")
+        self.assertEqual(b"".join(response.streaming_content), self.content[100:200])
+        response.close()
+
+        response = get(Range="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), self.content[-10:])
+        response.close()
+
+        self.assertEqual(get(Range=f"bytes={len(self.content)}-").status_code, 416)
+        # устаревший If-Range — файл целиком
+        full = get(Range="bytes=0-9", **{"If-Range": '"old"'})
+        self.assertEqual(full.status_code, 200)
+        full.close()
+
+        etag = full["ETag"]
+        self.assertEqual(get(**{"If-None-Match": etag}).status_code, 304)
+        self.assertEqual(get(Range="bytes=0-9", **{"If-Range": etag}).status_code, 206)
+
+    @override_settings(MEDIA_ACCEL="nginx", MEDIA_ACCEL_PREFIX="/protected/")
+    def test_accel(self):
+        response = async_to_sync(serve)(RequestFactory().get("/materials/scan.pdf"), "scan.pdf", self.root)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/scan.pdf")
+        self.assertEqual(response.content, b"")
+
+    def test_media_permissions(self):
+        self.seed(1)
+        material = Material.objects.get(work__isnull=False)
+        url = f"/materials/{material.file.name}"
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"x")
+        response.close()
+        self.assertEqual(self.client.get("/materials/materials/none.pdf").status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    async def test_serve_missing(self):
+        with self.assertRaises(Http404):
+            await serve(AsyncRequestFactory().get("/materials/none.pdf"), "none.pdf", self.root)
+
+    def test_serve_wsgi(self):
+        response = async_to_sync(serve)(RequestFactory().get("/materials/scan.pdf"), "scan.pdf", self.root)
+        self.assertFalse(response.is_async)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        response.close()
+
+    def test_items_asgi(self):
+        self.seed(3)
+        url = f"/api/items/?year={YEAR}"
+        expected = self.client.get(url, HTTP_ACCEPT="application/json")
+        self.async_client.force_login(self.user)
+
+        async def fetch():
+            response = await self.async_client.get(url, HTTP_ACCEPT="application/json")
+            self.assertTrue(response.is_async)
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(
+            json.loads(async_to_sync(fetch)()),
+            json.loads(b"".join(expected.streaming_content)),
+        )
+
+
+@override_settings(UPLOAD_SESSION_DIR=Path(MEDIA_ROOT) / ".uploads", UPLOAD_CHUNK_MAX=1000)
+class UploadTests(BudgetTestCase):
+    """Загрузка частями: смещения, докачка, контрольная сумма, прикрепление."""
+
+    content = bytes(range(256)) * 10
+
+    def start(self, **payload):
+        response = self.client.post("/api/uploads/", {
+            "filename": "C:\\scans\\акт.pdf", "size": len(self.content), **payload,
+        }, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def put(self, upload, offset, data):
+        return self.client.generic(
+            "PUT", f"/api/uploads/{upload['id']}/chunk/?offset={offset}", data,
+            content_type="application/octet-stream",
+        )
+
+    def send(self, upload):
+        for offset in range(0, len(self.content), 1000):
+            response = self.put(upload, offset, self.content[offset:offset + 1000])
+            self.assertEqual(response.status_code, 200, response.data)
+        return self.client.post(f"/api/uploads/{upload['id']}/finalize/",
+                                {"sha256": hashlib.sha256(self.content).hexdigest()}, format="json")
+
+    def test_material(self):
+        self.seed(1)
+        work = Work.objects.get()
+        upload = self.start(target="material", work=work.pk)
+        self.assertEqual(upload["filename"], "акт.pdf")
+        self.assertEqual(self.put(upload, 0, self.content[:500]).data["received"], 500)
+        # повтор и пропуск части отклоняются, клиент продолжает с received
+        response = self.put(upload, 0, self.content[:500])
+        self.assertEqual((response.status_code, response.data["received"]), (409, 500))
+        self.assertEqual(self.put(upload, 700, b"x").status_code, 409)
+        self.assertEqual(self.put(upload, 500, self.content[500:1600]).status_code, 413)
+        self.assertEqual(self.client.get(f"/api/uploads/{upload['id']}/").data["received"], 500)
+
+        for offset in range(500, len(self.content), 1000):
+            self.assertEqual(self.put(upload, offset, self.content[offset:offset + 1000]).status_code, 200)
+        response = self.client.post(f"/api/uploads/{upload['id']}/finalize/",
+                                    {"sha256": hashlib.sha256(self.content).hexdigest()}, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        material = Material.objects.get(pk=response.data["id"])
+        self.assertEqual(material.work, work)
+        with material.file.open("rb") as handle:
+            self.assertEqual(handle.read(), self.content)
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(os.listdir(Path(MEDIA_ROOT) / ".uploads"), [])
+
+    def test_bad_checksum(self):
+        self.seed(1)
+        upload = self.start(target="report", item=BudgetItem.objects.get().pk)
+        self.put(upload, 0, self.content[:1000])
+        response = self.client.post(f"/api/uploads/{upload['id']}/finalize/", {"sha256": "0"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Upload.objects.exists())
+        for offset in range(1000, len(self.content), 1000):
+            self.put(upload, offset, self.content[offset:offset + 1000])
+        response = self.client.post(f"/api/uploads/{upload['id']}/finalize/", {"sha256": "0"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_detail_comment(self):
+        self.seed(1)
+        detail = PaymentDetail.objects.get()
+        response = self.send(self.start(target="payment_detail", detail_id=detail.pk))
+        self.assertEqual(response.status_code, 201, response.data)
+        detail.refresh_from_db()
+        self.assertTrue(detail.comment_file.name.startswith("payment_comments/"))
+
+        other = User.objects.create_user("other")
+        self.client.force_authenticate(other)
+        response = self.client.post("/api/uploads/", {
+            "filename": "x.pdf", "size": 1, "target": "payment_detail", "detail_id": detail.pk,
+        }, format="json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_known_content(self):
+        self.seed(1)
+        work = Work.objects.get()
+        self.assertEqual(self.send(self.start(target="material", work=work.pk)).status_code, 201)
+        digest = hashlib.sha256(self.content).hexdigest()
+        # известная сумма не заменяет байты: по ней нельзя получить чужой файл
+        upload = self.start(target="material", work=work.pk, sha256=digest.upper())
+        self.assertEqual(upload["received"], 0)
+        response = self.client.post(f"/api/uploads/{upload['id']}/finalize/", {"sha256": digest}, format="json")
+        self.assertEqual(response.status_code, 400)
+        # после передачи байтов содержимое на диске всё равно одно
+        self.assertEqual(self.send(upload).status_code, 201)
+        self.assertEqual(Blob.objects.get(digest=digest).refs, 2)
+        first, second = Material.objects.filter(file__contains="акт").order_by("pk")
+        self.assertNotEqual(first.file.name, second.file.name)
+        with second.file.open("rb") as handle:
+            self.assertEqual(handle.read(), self.content)
+
+
+class ContentStorageTests(BudgetTestCase):
+    """Хранилище по содержимому: один файл на содержимое, счётчик ссылок."""
+
+    def test_dedupe(self):
+        first = default_storage.save("materials/a.pdf", ContentFile(b"same"))
+        second = default_storage.save("materials/a.pdf", ContentFile(b"same"))
+        other = default_storage.save("materials/b.pdf", ContentFile(b"other"))
+        self.assertEqual(first, "materials/a.pdf")
+        self.assertTrue(second.startswith("materials/a_") and second.endswith(".pdf"))
+        digest = hashlib.sha256(b"same").hexdigest()
+        self.assertEqual(default_storage.digest_of(second), digest)
+        self.assertEqual(Blob.objects.get(digest=digest).refs, 2)
+        blob = Path(default_storage.blob_path(digest))
+        self.assertEqual(os.path.realpath(default_storage.path(first)), str(blob))
+        with default_storage.open(second) as handle:
+            self.assertEqual(handle.read(), b"same")
+
+        default_storage.delete(first)
+        default_storage.delete(first)
+        self.assertFalse(default_storage.exists(first))
+        self.assertEqual(Blob.objects.get(digest=digest).refs, 1)
+        self.assertTrue(blob.exists())
+        default_storage.delete(second)
+        self.assertFalse(Blob.objects.filter(digest=digest).exists())
+        self.assertFalse(blob.exists())
+        self.assertEqual(Blob.objects.get().refs, 1)
+        default_storage.delete(other)
+        self.assertFalse(os.listdir(Path(MEDIA_ROOT) / "blobs" / "tmp"))
+
+    def test_release_on_delete(self):
+        self.seed(1)
+        work = Work.objects.get()
+        material = Material.objects.create(work=work, file=ContentFile(b"pdf", name="акт.pdf"))
+        name = material.file.name
+        self.assertTrue(name.startswith("materials/") and name.endswith("акт.pdf"))
+        with self.captureOnCommitCallbacks(execute=True):
+            work.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(Blob.objects.filter(digest=hashlib.sha256(b"pdf").hexdigest()).exists())
+        # материал статьи с тем же содержимым, что у удалённого материала работы, цел
+        self.assertEqual(Blob.objects.get(digest=hashlib.sha256(b"x").hexdigest()).refs, 1)
+
+    def test_dedupe_media(self):
+        self.seed(1)
+        work = Work.objects.get()
+        names = ["materials/old/1.pdf", "materials/old/2.pdf"]
+        os.makedirs(default_storage.path("materials/old"), exist_ok=True)
+        for name in names:
+            Path(default_storage.path(name)).write_bytes(b"legacy")
+            Material.objects.create(work=work, file=name)
+        call_command("dedupe_media", stdout=open(os.devnull, "w"))
+        legacy = Blob.objects.filter(digest=hashlib.sha256(b"legacy").hexdigest())
+        self.assertEqual(legacy.get().refs, 2)
+        for name in names:
+            self.assertTrue(os.path.islink(default_storage.path(name)))
+            with default_storage.open(name) as handle:
+                self.assertEqual(handle.read(), b"legacy")
+        # повторный запуск ничего не меняет
+        call_command("dedupe_media", stdout=open(os.devnull, "w"))
+        self.assertEqual(legacy.get().refs, 2)
+
+
+class WorkExportTests(QueryCountTestCase):
+    """Выгрузка работ из админки: CSV и XLSX потоком, число запросов постоянно."""
+
+    columns = ["id", "item", "name", "accruals_month", "accruals_amount", "accruals_status",
+               "payments_month", "payments_amount", "responsible"]
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+
+    def export(self, file_format):
+        data = {"format": file_format, "resource": 0}
+        data.update({f"workresource_{column}": "on" for column in self.columns})
+        return self.client.post(reverse("admin:budget_work_export"), data)
+
+    def test_csv(self):
+        self.assertConstantQueries(lambda n: self.export(0))
+        response = self.export(0)
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment", response["Content-Disposition"])
+        table = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(table[0], self.columns)
+        self.assertEqual(len(table), 1 + Work.objects.count())
+        work = Work.objects.select_related("item").order_by("pk").first()
+        row = next(row for row in table[1:] if row[0] == str(work.pk))
+        self.assertEqual(row[1:], [work.item.name, work.name, "Янв", "100", "", "Мар", "70",
+                                   str(work.responsible_id)])
+
+    def test_xlsx(self):
+        self.seed(3)
+        response = self.export(1)
+        book = load_workbook(io.BytesIO(b"".join(response.streaming_content)), read_only=True)
+        table = list(book.active.values)
+        self.assertEqual(list(table[0]), self.columns)
+        self.assertEqual(len(table), 4)
+        # суммы в XLSX остаются числами
+        self.assertEqual(table[1][4], 100)
+
+
+class ImportJobTests(BudgetTestCase):
+    """Фоновый импорт работ: пробный прогон, применение, ошибки строк, пачки."""
+
+    header = ["id", "item", "name", "accruals_month", "accruals_amount", "accruals_status", "year"]
+
+    def rows(self):
+        work = Work.objects.select_related("item").order_by("pk").first()
+        return work, [
+            self.header,
+            [work.pk, work.item.name, "Переименована", "Янв", "100", "", YEAR],
+            ["", work.item.name, "Новая работа", "Май", "300", "", YEAR],
+            ["", "Нет такой статьи", "Ошибка", "", "", "", YEAR],
+        ]
+
+    def upload(self, name, content, dry_run):
+        response = self.client.post("/api/imports/", {
+            "file": SimpleUploadedFile(name, content), "dry_run": dry_run,
+        })
+        self.assertEqual(response.status_code, 202, response.data)
+        # фоновый поток стартует после фиксации; в тесте выполняем задачу сами
+        return imports.run(ImportJob.objects.get(pk=response.data["id"]))
+
+    def test_csv_dry_run_and_apply(self):
+        self.seed(2)
+        work, rows = self.rows()
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        job = self.upload("works.csv", buffer.getvalue().encode(), dry_run=True)
+
+        data = self.client.get(f"/api/imports/{job.pk}/").data
+        self.assertEqual((data["status"], data["total"], data["progress"]), ("done", 3, 1.0))
+        self.assertEqual((data["created"], data["updated"], data["invalid"]), (1, 1, 1))
+        self.assertEqual(data["errors"][0]["row"], 4)
+        self.assertIn("item", data["errors"][0]["errors"])
+        update = next(entry for entry in data["diff"] if entry["action"] == "update")
+        self.assertEqual(update["changes"]["name"], [work.name, "Переименована"])
+        # пробный прогон ничего не пишет
+        self.assertEqual(Work.objects.count(), 2)
+        work.refresh_from_db()
+        self.assertNotEqual(work.name, "Переименована")
+
+        response = self.client.post(f"/api/imports/{job.pk}/apply/")
+        self.assertEqual(response.status_code, 202, response.data)
+        applied = imports.run(ImportJob.objects.get(pk=response.data["id"]))
+        self.assertEqual((applied.status, applied.created, applied.updated), ("done", 1, 1))
+        work.refresh_from_db()
+        self.assertEqual(work.name, "Переименована")
+        new = Work.objects.get(name="Новая работа")
+        self.assertEqual(new.accruals, {"Май": {"amount": "300", "status": ""}})
+        self.assertTrue(WorkMonthAmount.objects.filter(work=new).exists())
+
+    def test_ambiguous_item(self):
+        self.seed(1)
+        work, rows = self.rows()
+        BudgetItem.objects.create(name=work.item.name, group=self.group, position=9)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows[:1] + rows[2:3])
+        job = self.upload("works.csv", buffer.getvalue().encode(), dry_run=False)
+        # две статьи с одним названием: ошибка строки, а не произвольная из двух
+        self.assertEqual((job.status, job.created, job.invalid), ("done", 0, 1))
+        self.assertIn("несколько", job.errors[0]["errors"]["item"][0])
+
+    def test_xlsx_chunks(self):
+        self.seed(1)
+        work, rows = self.rows()
+        book = Workbook()
+        for row in rows[:1] + rows[2:3] * 5:
+            book.active.append(row)
+        buffer = io.BytesIO()
+        book.save(buffer)
+        with mock.patch.object(imports, "CHUNK_SIZE", 2):
+            job = self.upload("works.xlsx", buffer.getvalue(), dry_run=False)
+        self.assertEqual((job.status, job.processed, job.created), ("done", 5, 5))
+        self.assertEqual(Work.objects.filter(name="Новая работа").count(), 5)
+
+    def test_resume_after_crash(self):
+        self.seed(1)
+        work, rows = self.rows()
+        content = io.StringIO()
+        csv.writer(content).writerows(rows[:1] + rows[2:3] * 5)
+        save = imports._save
+
+        def crash_on_second_chunk(job, **fields):
+            if fields.get("processed") == 4:
+                raise DatabaseError("процесс умер")
+            save(job, **fields)
+
+        with mock.patch.object(imports, "CHUNK_SIZE", 2), \
+                mock.patch.object(imports, "_save", crash_on_second_chunk), \
+                self.assertLogs("budget.imports", "ERROR"):
+            job = self.upload("works.csv", content.getvalue().encode(), dry_run=False)
+        # вторая пачка откатилась вместе со счётчиком
+        self.assertEqual((job.status, job.processed), ("failed", 2))
+        self.assertEqual(Work.objects.filter(name="Новая работа").count(), 2)
+
+        ImportJob.objects.filter(pk=job.pk).update(status="pending")
+        with mock.patch.object(imports, "CHUNK_SIZE", 2):
+            job = imports.run(job)
+        self.assertEqual((job.status, job.processed, job.created), ("done", 5, 5))
+        self.assertEqual(Work.objects.filter(name="Новая работа").count(), 5)
+
+    def test_permission(self):
+        self.client.force_authenticate(User.objects.create_user("viewer"))
+        response = self.client.post("/api/imports/", {"file": SimpleUploadedFile("w.csv", b"id\n")})
+        self.assertEqual(response.status_code, 403)
+
+
+
+class SeedingTests(BudgetTestCase):
+    """Синтетические данные: воспроизводимость, очистка без хвостов и без N+1."""
+
+    def generate(self, seed=1, **params):
+        params = {"groups": 2, "items": 2, "works": 2, "years": 2, **params}
+        return seeding.generate(seed, start_year=YEAR, users=3, **params)
+
+    def snapshot(self):
+        """Содержимое синтетики без id (их в имени работы нет смысла сравнивать)."""
+        works = Work.objects.order_by("pk").values_list(
+            "year", "justification", "comment", "responsible__username", "vat_rate", "feasibility",
+            "accruals", "payments", "actual_accruals", "actual_payments",
+        )
+        return {
+            "works": list(works),
+            "payments": list(PaymentDetail.objects.order_by("pk").values_list("month", "amount", "creditor")),
+            "accruals": list(AccrualDetail.objects.order_by("pk").values_list("month", "amount")),
+            "materials": Material.objects.count(),
+            "reserves": list(QuarterReserve.objects.order_by("pk").values_list(
+                "year", "quarter", "accrual_sum", "used_acc", "used_pay")),
+        }
+
+    def test_deterministic(self):
+        counts = self.generate()
+        first = self.snapshot()
+        # пользователи остаются от первого запуска и повторно не создаются
+        self.assertEqual(self.generate(), {**counts, "users": 0})
+        self.assertEqual(self.snapshot(), first)
+        self.generate(seed=2)
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_clear_leaves_nothing(self):
+        self.seed(1)
+        own = (ItemQuarterRollup.objects.count(), WorkMonthAmount.objects.count())
+        self.generate()
+        self.assertGreater(ItemQuarterRollup.objects.count(), own[0])
+        seeding.clear()
+        self.assertEqual((ItemQuarterRollup.objects.count(), WorkMonthAmount.objects.count()), own)
+        self.assertFalse(Group.objects.filter(code__startswith=seeding.SEED_PREFIX).exists())
+        self.generate()
+        call_command("rebuild_rollups", "--verify", stdout=io.StringIO())
+
+    def test_clear_constant_queries(self):
+        counts = []
+        for works in (1, 1, 4):
+            self.generate(works=works)
+            with CaptureQueriesContext(connection) as ctx:
+                seeding.clear()
+            counts.append(len(ctx.captured_queries))
+        # первый прогон — прогревочный
+        self.assertEqual(counts[1], counts[2], "Число запросов очистки растёт с числом работ")
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command("seed_budget", "--groups", "1", "--items", "1", "--works", "1", "--years", "1",
+                     "--start-year", str(YEAR), stdout=out)
+        self.assertIn("works=1", out.getvalue())
+        call_command("seed_budget", "--clear", stdout=io.StringIO())
+        self.assertFalse(Work.objects.exists())
+
+
+class RolloverTests(BudgetTestCase):
+    """Перенос на новый год: копии работ с планом, резервы, итоги, число запросов."""
+
+    def test_constant_queries(self):
+        counts = []
+        # каждый раз новый целевой год: строки итогов для него ещё не созданы
+        for offset, n in enumerate((2, 2, 6), start=1):
+            self.seed(n)
+            with CaptureQueriesContext(connection) as ctx:
+                rollover(Work.objects.filter(year=YEAR), YEAR + offset)
+            counts.append(len(ctx.captured_queries))
+        # первый прогон — прогревочный
+        self.assertEqual(counts[1], counts[2], "Число запросов растёт с числом работ")
+
+    def test_not_a_map(self):
+        self.seed(1)
+        Work.objects.update(accruals=[100], payments="70")
+        self.assertEqual(rollover(Work.objects.filter(year=YEAR), YEAR + 1).works, 1)
+        clone = Work.objects.get(year=YEAR + 1)
+        self.assertEqual((clone.accruals, clone.payments), ({}, {}))
+
+    def test_admin_action(self):
+        self.seed(2)
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("admin:budget_work_changelist"), {
+            "action": "copy_to_next_year",
+            "_selected_action": list(Work.objects.filter(year=YEAR).values_list("pk", flat=True)),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Work.objects.filter(year=YEAR + 1).count(), 2)
+        self.assertEqual(QuarterReserve.objects.filter(year=YEAR + 1).count(), 2)
+
+    def test_command(self):
+        self.seed(3)
+        call_command("rollover_year", YEAR, YEAR + 1, "--shift", "1", "--scale", "1.1", stdout=io.StringIO())
+        clones = Work.objects.filter(year=YEAR + 1).order_by("pk")
+        self.assertEqual(clones.count(), 3)
+        clone = clones[0]
+        # месяц со статусом «перенос» не копируется, факт обнуляется
+        self.assertEqual((clone.accruals, clone.payments), ({"Фев": 110}, {"Апр": 77}))
+        self.assertEqual((clone.actual_accruals, clone.name), ({}, "Работа 0"))
+        self.assertFalse(clone.payment_details.exists())
+        reserve = QuarterReserve.objects.get(item=clone.item, year=YEAR + 1)
+        self.assertEqual((reserve.quarter, reserve.accrual_sum, reserve.used_acc), (1, Decimal("1100.00"), 0))
+        call_command("rebuild_rollups", verify=True, stdout=io.StringIO())
+
+        # повторный перенос ничего не задваивает
+        result = rollover(Work.objects.filter(year=YEAR), YEAR + 1)
+        self.assertEqual((result.works, result.skipped_works, result.reserves), (0, 3, 0))
+        self.assertEqual(Work.objects.filter(year=YEAR + 1).count(), 3)
+
+@override_settings(JOBS_IN_PROCESS=False, JOB_RETRY_DELAY=0)
+class JobTests(BudgetTestCase):
+    """Фоновые задачи: очередь, повторы, результат файлом и JSON, права на виды задач."""
+
+    def enqueue(self, data):
+        response = self.client.post("/api/jobs/", data, format="json")
+        self.assertEqual(response.status_code, 202, response.data)
+        return Job.objects.get(pk=response.data["id"])
+
+    def test_export_result_file(self):
+        self.seed(3)
+        job = self.enqueue({"kind": "export_works", "params": {"year": YEAR, "format": "csv"}})
+        self.assertEqual(self.client.get(f"/api/jobs/{job.pk}/result/").status_code, 409)
+        # execute_pk напрямую: пул потоков в TestCase не видел бы незафиксированных данных
+        self.assertEqual(jobs.execute_pk(jobs.claim("test").pk), "done")
+
+        data = self.client.get(f"/api/jobs/{job.pk}/").data
+        self.assertEqual((data["status"], data["progress"], data["has_file"]), ("done", 1.0, True))
+        self.assertEqual(data["result"], {"rows": 3})
+        response = self.client.get(f"/api/jobs/{job.pk}/result/")
+        self.assertIn("attachment", response["Content-Disposition"])
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn("Работа 0", lines[1])
+
+        # чужой пользователь не получает файл ни через API, ни по адресу в /materials/
+        job.refresh_from_db()
+        other = User.objects.create_user("other")
+        self.client.force_authenticate(other)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f"/api/jobs/{job.pk}/result/").status_code, 404)
+        self.assertEqual(self.client.get(f"/materials/{job.result_file.name}").status_code, 404)
+
+    def test_summary_result_json(self):
+        self.seed(1)
+        self.enqueue({"kind": "summary_report", "params": {"year": YEAR}})
+        job = jobs.execute(jobs.claim("test"))
+        self.assertEqual(job.status, "done")
+        self.assertEqual(self.client.get(f"/api/jobs/{job.pk}/result/").data["groups"][0]["code"], "G")
+
+    def test_retry_then_fail(self):
+        job = jobs.enqueue("summary_report", user=self.user, year="нет")
+        for attempt in range(1, 4):
+            claimed = jobs.claim("test")
+            self.assertEqual((claimed.pk, claimed.attempts), (job.pk, attempt))
+            with self.assertLogs("budget.jobs", "ERROR"):
+                job = jobs.execute(claimed)
+            self.assertEqual(job.status, "pending" if attempt < 3 else "failed")
+            self.assertIn("целое число", job.error)
+        self.assertIsNone(jobs.claim("test"))
+
+    def test_requeue_stale(self):
+        job = jobs.enqueue("summary_report", user=self.user, year=YEAR)
+        jobs.claim("dead")
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=job.created_at - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim("alive").attempts, 2)
+
+    def test_api_validation_and_permission(self):
+        response = self.client.post("/api/jobs/", {"kind": "import_works", "params": {}}, format="json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/api/jobs/", {"kind": "export_works", "params": {"year": YEAR, "format": "pdf"}},
+                                    format="json")
+        self.assertIn("params", response.data)
+        self.client.force_authenticate(User.objects.create_user("viewer"))
+        response = self.client.post("/api/jobs/", {"kind": "rebuild_rollups"}, format="json")
+        self.assertEqual(response.status_code, 403)
+        self.enqueue({"kind": "summary_report", "params": {"year": YEAR}})
+        self.assertEqual(len(self.client.get("/api/jobs/").data), 1)
 
-# Create your tests here.
@@ -0,0 +1,166 @@
+"""
+Замер фаз запроса: SQL, сериализация, рендеринг.
+
+ServerTimingMiddleware заводит на запрос RequestTimer и считает время и
+число SQL-запросов через connection.execute_wrapper. ServerTimingMixin
+для представлений DRF добавляет фазы serialize (to_representation) и
+render (renderer.render); из них вычитается время SQL внутри фазы, поэтому
+ленивые prefetch-выборки при сериализации попадают в db, а не в serialize.
+
+Итог уходит в заголовок Server-Timing и строкой JSON в логгер budget.timing.
+Включается settings.SERVER_TIMING (env SERVER_TIMING=1); выключенная
+middleware исключается Django при старте, миксин лишь проверяет contextvar.
+У потоковых ответов заголовок содержит фазы до начала потока, а строка
+лога пишется после его окончания и включает SQL, выполненный в потоке.
+"""
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger("budget.timing")
+
+_current = ContextVar("budget_request_timer", default=None)
+
+
+def current_timer():
+    return _current.get()
+
+
+class RequestTimer:
+    """Накопитель длительностей фаз одного запроса (в секундах)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {"db": 0.0}
+        self.queries = 0
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.phases["db"] += time.perf_counter() - started
+            self.queries += 1
+
+    @contextmanager
+    def track_db(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.db_wrapper))
+            yield
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        db_before = self.phases["db"]
+        try:
+            yield
+        finally:
+            own = time.perf_counter() - started - (self.phases["db"] - db_before)
+            self.phases[name] = self.phases.get(name, 0.0) + own
+
+    def wrap(self, name, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        parts = [f'db;dur={self.phases["db"] * 1000:.1f};desc="{self.queries} queries"']
+        parts += [
+            f"{name};dur={seconds * 1000:.1f}"
+            for name, seconds in self.phases.items() if name != "db"
+        ]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def record(self, request, response, streamed=False):
+        total = self.elapsed()
+        if total * 1000 < settings.SERVER_TIMING_LOG_MS:
+            return
+        data = {
+            "method": request.method,
+            "path": request.path,
+            "query": request.META.get("QUERY_STRING", ""),
+            "status": response.status_code,
+            "user": getattr(getattr(request, "user", None), "pk", None),
+            "queries": self.queries,
+            "total_ms": round(total * 1000, 1),
+            **{f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "streamed": streamed,
+            "cache": response.get("X-Cache"),
+        }
+        logger.info(json.dumps(data, ensure_ascii=False), extra={"timing": data})
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing и строка лога на каждый запрос (settings.SERVER_TIMING)."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SERVER_TIMING", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            with timer.track_db():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        response["Server-Timing"] = timer.header()
+        if response.streaming:
+            stream = self._astream if response.is_async else self._stream
+            response.streaming_content = stream(timer, request, response, response.streaming_content)
+        else:
+            timer.record(request, response)
+        return response
+
+    @staticmethod
+    def _stream(timer, request, response, content):
+        with timer.phase("stream"), timer.track_db():
+            yield from content
+        timer.record(request, response, streamed=True)
+
+    @staticmethod
+    async def _astream(timer, request, response, content):
+        # под ASGI SQL потока выполняется в другом потоке (sync_to_async),
+        # поэтому в db попадает только выполненное до начала передачи
+        with timer.phase("stream"):
+            async for chunk in content:
+                yield chunk
+        timer.record(request, response, streamed=True)
+
+
+class ServerTimingMixin:
+    """
+    Фазы serialize и render для представлений DRF. Без активного замера
+    (middleware выключена) ничего не оборачивает.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        timer = current_timer()
+        if timer is not None:
+            serializer.to_representation = timer.wrap("serialize", serializer.to_representation)
+        return serializer
+
+    def perform_content_negotiation(self, request, force=False):
+        renderer, media_type = super().perform_content_negotiation(request, force)
+        timer = current_timer()
+        if timer is not None:
+            # экземпляры рендереров создаются на каждый запрос — обёртка не утекает
+            renderer.render = timer.wrap("render", renderer.render)
+        return renderer, media_type
@@ -0,0 +1,232 @@
+"""
+Передача файлов и потоковых ответов под ASGI.
+
+Под ASGI (gunicorn с UvicornWorker) тело запроса принимает асинхронный
+обработчик Django: куски пишутся во временный файл, который уходит на диск
+после FILE_UPLOAD_MAX_MEMORY_SIZE, а синхронное представление загрузки
+вызывается, когда тело уже получено целиком, — медленный клиент не держит
+поток воркера. С отдачей наоборот: серверу нужен асинхронный итератор,
+синхронный поток Django собирает целиком в память (sync_to_async(list)).
+stream() перекладывает синхронный поток (дерево items/) в асинхронный,
+забирая блоки в том потоке, где живёт соединение с БД. Под WSGI
+(runserver, тестовый клиент) ответы остаются синхронными.
+
+Файлы /materials/ отдаёт serve_media: только вошедшим пользователям и
+только файлы, на которые ссылается FileField моделей budget. Ответ несёт
+ETag и Last-Modified (If-None-Match/If-Modified-Since дают 304), понимает
+один диапазон Range (206/416, с If-Range). Целиком файл под WSGI уходит
+через wsgi.file_wrapper (sendfile в gunicorn), под ASGI читается блоками в
+пуле потоков. С settings.MEDIA_ACCEL сами байты отдаёт фронтовой сервер:
+X-Accel-Redirect (nginx) или X-Sendfile (Apache, lighttpd).
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import models
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+
+BLOCK_SIZE = 64 * 1024
+
+
+def is_asgi(request):
+    # у ASGIRequest есть scope; Request из DRF проксирует атрибуты к нему
+    return getattr(request, "scope", None) is not None
+
+
+def async_blocks(iterator, size=BLOCK_SIZE, thread_sensitive=True):
+    """
+    Асинхронный итератор по синхронному: блоки не меньше size байт.
+    thread_sensitive — в потоке синхронных представлений (там соединение
+    с БД), иначе в пуле потоков.
+    """
+    iterator = iter(iterator)
+
+    def next_block():
+        parts, length = [], 0
+        for part in iterator:
+            parts.append(part)
+            length += len(part)
+            if length >= size:
+                break
+        return b"".join(parts)
+
+    async def blocks():
+        while block := await sync_to_async(next_block, thread_sensitive=thread_sensitive)():
+            yield block
+
+    return blocks()
+
+
+def stream(request, iterator, thread_sensitive=True):
+    """Содержимое StreamingHttpResponse под протокол сервера."""
+    if is_asgi(request):
+        return async_blocks(iterator, thread_sensitive=thread_sensitive)
+    return iterator
+
+
+def attachment(request, handle, filename, content_type=None):
+    """FileResponse на скачивание открытого файла; под ASGI файл читается блоками в пуле потоков."""
+    response = FileResponse(handle, as_attachment=True, filename=filename, content_type=content_type)
+    if is_asgi(request):
+        response.streaming_content = async_blocks(
+            iter(lambda: handle.read(BLOCK_SIZE), b""), thread_sensitive=False,
+        )
+    return response
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def byte_range(header, size):
+    """
+    (начало, конец включительно) из заголовка Range или None — отдать файл
+    целиком (нет заголовка, несколько диапазонов, ошибка синтаксиса).
+    """
+    match = RANGE_RE.match((header or "").strip())
+    if not match or not (match[1] or match[2]):
+        return None
+    if match[1]:
+        start = int(match[1])
+        end = int(match[2]) if match[2] else size - 1
+        if match[2] and end < start:
+            return None
+        if start >= size:
+            raise RangeNotSatisfiable
+        return start, min(end, size - 1)
+    suffix = int(match[2])
+    if suffix == 0 or size == 0:
+        raise RangeNotSatisfiable
+    return max(0, size - suffix), size - 1
+
+
+def _read_range(handle, start, length):
+    handle.seek(start)
+    while length > 0:
+        block = handle.read(min(BLOCK_SIZE, length))
+        if not block:
+            break
+        length -= len(block)
+        yield block
+
+
+def _offload(path, fullpath):
+    """Пустой ответ, тело которого подставит фронтовой сервер."""
+    content_type, _ = mimetypes.guess_type(path)
+    response = HttpResponse(content_type=content_type or "application/octet-stream")
+    if settings.MEDIA_ACCEL == "nginx":
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    else:
+        response["X-Sendfile"] = fullpath
+    response["Content-Disposition"] = content_disposition_header(False, os.path.basename(path))
+    return response
+
+
+async def serve(request, path, document_root):
+    """
+    Отдать файл из document_root с условными запросами и Range (без проверки
+    прав — её делает serve_media).
+    """
+    path = posixpath.normpath(path).lstrip("/")
+    fullpath = safe_join(document_root, path)
+    try:
+        st = await sync_to_async(os.stat, thread_sensitive=False)(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("Файл не найден")
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("Файл не найден")
+
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    last_modified = http_date(st.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is None and settings.MEDIA_ACCEL:
+        response = _offload(path, fullpath)
+    if response is None:
+        if_range = request.headers.get("If-Range")
+        try:
+            span = None
+            if not if_range or if_range in (etag, last_modified):
+                span = byte_range(request.headers.get("Range"), st.st_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{st.st_size}"
+        else:
+            handle = await sync_to_async(open, thread_sensitive=False)(fullpath, "rb")
+            # тип, имя и закрытие файла — как у FileResponse
+            response = FileResponse(handle)
+            if span is not None:
+                start, end = span
+                response.status_code = 206
+                response.streaming_content = stream(
+                    request, _read_range(handle, start, end - start + 1), thread_sensitive=False,
+                )
+                response["Content-Length"] = str(end - start + 1)
+                response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+            elif is_asgi(request):
+                response.streaming_content = async_blocks(
+                    iter(lambda: handle.read(BLOCK_SIZE), b""), thread_sensitive=False,
+                )
+        response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = last_modified
+    # адрес файла не меняется вместе с содержимым: новые загрузки получают новые имена
+    response["Cache-Control"] = f"private, max-age={settings.MEDIA_CACHE_SECONDS}"
+    return response
+
+
+def file_fields():
+    """(модель, поле) для всех FileField приложения budget."""
+    return [
+        (model, field.name)
+        for model in apps.get_app_config("budget").get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, models.FileField)
+    ]
+
+
+# вложения, которые видит любой вошедший пользователь. Файлы задач (Job,
+# ImportJob) личные и отдаются только через /api/jobs/<id>/result/
+MEDIA_FILE_FIELDS = (
+    ("budget.Material", "file"),
+    ("budget.ArticleReport", "file"),
+    ("budget.PaymentDetail", "comment_file"),
+    ("budget.AccrualDetail", "comment_file"),
+)
+
+
+def media_file_fields():
+    """(модель, поле) для файлов, которые отдаёт /materials/."""
+    return [(apps.get_model(label), field) for label, field in MEDIA_FILE_FIELDS]
+
+
+def is_media_file(name):
+    """Ссылается ли на файл хоть одна запись — остальное в MEDIA_ROOT не отдаётся."""
+    return any(
+        model._default_manager.filter(**{field: name}).exists()
+        for model, field in media_file_fields()
+    )
+
+
+async def serve_media(request, path):
+    """GET /materials/<path> — вложения работ и статей для вошедших пользователей."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        raise PermissionDenied
+    path = posixpath.normpath(path).lstrip("/")
+    if not await sync_to_async(is_media_file)(path):
+        raise Http404("Файл не найден")
+    return await serve(request, path, settings.MEDIA_ROOT)
@@ -0,0 +1,164 @@
+"""
+Загрузка файлов частями с докачкой.
+
+Клиент создаёт сессию (POST /api/uploads/: имя, размер, цель), затем шлёт
+части PUT /api/uploads/<id>/chunk/?offset=N с телом-байтами. Часть
+принимается, только если offset равен уже полученному — после обрыва
+клиент спрашивает GET /api/uploads/<id>/ и продолжает с received. Байты
+пишутся блоками прямо в файл сессии на диске, без сборки в памяти.
+finalize сверяет размер и sha256 и переносит файл в хранилище
+переименованием (тот же том), после чего он прикрепляется к цели:
+Material работы или статьи, ArticleReport статьи или comment_file детали.
+sha256, переданный при создании сессии, — ожидаемая сумма: finalize с
+другой суммой не пройдёт. Байты передаются всегда, даже если такое
+содержимое уже хранится: иначе по одной сумме можно было бы узнать, что
+файл есть, и получить его копию. Повтор содержимого хранилище
+(budget.storage) всё равно держит на диске один раз. Брошенные сессии
+удаляет команда purge_uploads.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AccrualDetail, ArticleReport, Material, PaymentDetail, Upload
+from .storage import file_digest
+
+BLOCK_SIZE = 1024 * 1024
+
+DETAIL_MODELS = {"payment_detail": PaymentDetail, "accrual_detail": AccrualDetail}
+
+
+class OffsetMismatch(Exception):
+    """Часть пришла не с того смещения (повтор или пропуск)."""
+
+
+class UploadError(Exception):
+    pass
+
+
+class AssembledFile(File):
+    """
+    Собранный на диске файл: FileSystemStorage переносит его, а не копирует,
+    а ContentAddressedStorage берёт уже посчитанный sha256.
+    """
+
+    def __init__(self, file, name=None, sha256=None):
+        super().__init__(file, name)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def write_chunk(upload, offset, stream):
+    """
+    Дописать тело запроса stream в файл сессии с позиции offset. Возвращает
+    новое число полученных байт; обрыв посередине части тоже сдвигает его
+    на фактически записанное.
+    """
+    if offset != upload.received:
+        raise OffsetMismatch
+    limit = min(upload.size - offset, settings.UPLOAD_CHUNK_MAX)
+    upload.part_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(upload.part_path, os.O_WRONLY | os.O_CREAT, 0o600)
+    written = 0
+    try:
+        while block := stream.read(min(BLOCK_SIZE, limit + 1 - written)):
+            if written + len(block) > limit:
+                raise UploadError(
+                    f"Часть больше допустимого: не более {limit} байт с позиции {offset}"
+                )
+            os.pwrite(fd, block, offset + written)
+            written += len(block)
+    finally:
+        os.close(fd)
+    # условное обновление: из двух одновременных повторов одной части проходит один
+    updated = Upload.objects.filter(pk=upload.pk, received=offset).update(
+        received=F("received") + written, updated_at=timezone.now(),
+    )
+    if not updated:
+        raise OffsetMismatch
+    upload.received = offset + written
+    return upload.received
+
+
+def finalize(upload, sha256):
+    """Проверить файл сессии и прикрепить его к цели. Возвращает созданный/изменённый объект."""
+    if upload.received != upload.size:
+        raise UploadError(f"Получено {upload.received} из {upload.size} байт")
+    path = upload.part_path
+    sha256 = (sha256 or "").strip().lower()
+    if upload.sha256 and sha256 != upload.sha256:
+        raise UploadError("Контрольная сумма не совпадает с указанной при создании сессии")
+    if upload.size == 0:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    # хвост оборванной части за пределами received не входит в файл
+    os.truncate(path, upload.size)
+    if file_digest(path) != sha256:
+        discard(upload)
+        raise UploadError("Контрольная сумма не совпала — загрузите файл заново")
+
+    obj, field = _target(upload)
+    file = getattr(obj, field)
+    old_name = file.name
+    with transaction.atomic():
+        with open(path, "rb") as handle:
+            file.save(upload.filename, AssembledFile(handle, upload.filename, sha256), save=False)
+        # если такое содержимое уже было, файл части не перенесён
+        path.unlink(missing_ok=True)
+        try:
+            obj.save()
+            upload.delete()
+        except Exception:
+            file.storage.delete(file.name)
+            raise
+        if old_name:
+            # заменённый файл комментария удаляется после фиксации, как в WorkSerializer
+            transaction.on_commit(lambda: file.storage.delete(old_name))
+    return obj
+
+
+def _target(upload):
+    """(объект, имя FileField), к которому прикрепляется файл."""
+    if upload.target == "material":
+        return Material(work=upload.work, item=upload.item), "file"
+    if upload.target == "report":
+        return ArticleReport(item=upload.item), "file"
+    model = DETAIL_MODELS[upload.target]
+    return model.objects.select_related("work").get(pk=upload.detail_id), "comment_file"
+
+
+def discard(upload):
+    upload.part_path.unlink(missing_ok=True)
+    if upload.pk is not None:
+        upload.delete()
+
+
+def purge(hours=None):
+    """
+    Удалить сессии без новых частей дольше hours часов и файлы частей
+    без сессии. Возвращает (сессий, файлов).
+    """
+    hours = settings.UPLOAD_SESSION_HOURS if hours is None else hours
+    cutoff = timezone.now() - timedelta(hours=hours)
+    stale = Upload.objects.filter(updated_at__lt=cutoff)
+    sessions = 0
+    for upload in stale:
+        discard(upload)
+        sessions += 1
+    files = 0
+    if os.path.isdir(settings.UPLOAD_SESSION_DIR):
+        live = {f"{pk}.part" for pk in Upload.objects.values_list("pk", flat=True)}
+        for entry in os.scandir(settings.UPLOAD_SESSION_DIR):
+            # свежие файлы могут принадлежать сессии, созданной после выборки live
+            if (entry.name.endswith(".part") and entry.name not in live
+                    and entry.stat().st_mtime < cutoff.timestamp()):
+                os.unlink(entry.path)
+                files += 1
+    return sessions, files
@@ -1,10 +1,18 @@
-from rest_framework import viewsets, parsers, serializers
+from rest_framework import viewsets, parsers, serializers, pagination, mixins
 from rest_framework import permissions
+from rest_framework.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from django.db.models import Prefetch
+from django.db import transaction
+from django.db.models import Prefetch, Q, Max
 
-from .models import BudgetItem, Work, Material, QuarterReserve, PaymentDetail
+from .models import BudgetItem, Work, Material, QuarterReserve, PaymentDetail, AccrualDetail, ChangeLog, Revision, WorkMonthAmount, Upload
+from .models import ImportJob, Job
+from .reports import build_summary
+from .snapshot import set_age_header, use_snapshot
+from .streaming import TreeStreamer
+from . import cache as response_cache
+from . import imports, jobs, transfers, uploads
 from .serializers import (
     BudgetItemSerializer,
     WorkSerializer,
@@ -12,15 +20,29 @@ from .serializers import (
     ReserveSerializer,
     UserLightSerializer,
     PaymentDetailSerializer,
+    AccrualDetailSerializer,
+    WorkBulkUpdateSerializer,
+    ReserveWriteOffSerializer,
+    FieldSelection,
+    ArticleReportSerializer,
+    UploadSerializer,
+    ImportJobSerializer,
+    JobSerializer,
 )
+from .signals import batch_changes, log_changes
+from .timing import ServerTimingMixin
 
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from decimal import Decimal
+import hashlib
 import json
+from pathlib import Path
+from django.utils.http import parse_etags
+from django.utils import timezone
 from django.contrib.auth import authenticate, login, logout
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponseNotAllowed
+from django.http import JsonResponse, HttpResponseNotAllowed, HttpResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 
 # --- Custom permission -------------------------------------------------
@@ -37,6 +59,13 @@ class IsOwnerOrCanEditAny(permissions.BasePermission):
         resp_id = getattr(obj, "responsible_id", None)
         return resp_id == request.user.id
 
+class CanEditAnyWork(permissions.BasePermission):
+    """Only users with `budget.change_any_work` (bulk operations on everyone's works)."""
+    message = "Нужно право change_any_work"
+
+    def has_permission(self, request, view):
+        return request.user.has_perm("budget.change_any_work")
+
 # ---- Session-based login/logout --------------------------------------
 @csrf_exempt
 def session_login(request):
@@ -89,18 +118,176 @@ class CurrentUserView(APIView):
             }
         )
 
-class BudgetItemViewSet(viewsets.ModelViewSet):
-    queryset = BudgetItem.objects.prefetch_related(
-        Prefetch(
-            'works',
-            queryset=Work.objects.with_details().prefetch_related('materials'),
-            to_attr='detailed_works'
-        )
-    ).prefetch_related('materials')
+def _int_param(request, name):
+    """Прочитать целочисленный query-параметр; None, если он не задан."""
+    raw = request.query_params.get(name)
+    if raw in (None, "", "all"):
+        return None
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise serializers.ValidationError({name: "Ожидается целое число"})
+
+
+class RevisionETagMixin:
+    """
+    Условный GET для list(): ETag строится из счётчиков Revision по etag_tables,
+    и при совпадении If-None-Match отдаётся 304 без выборки и сериализации.
+    С cache_responses=True отрендеренный JSON кладётся в общий кэш ответов
+    (budget.cache) под ключом из того же ETag.
+    """
+    etag_tables = ()
+    etag_by_year = False
+    cache_responses = False
+
+    def get_list_etag(self, request):
+        year = _int_param(request, "year") if self.etag_by_year else None
+        revisions = Revision.current(self.etag_tables, year)
+        query = sorted(request.query_params.lists())
+        raw = json.dumps([request.path, query, revisions])
+        return '"%s"' % hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+
+    def get_cache_scope(self, request):
+        """Часть ключа кэша, зависящая от прав пользователя; списки сейчас общие."""
+        return ""
+
+    def stream_list(self, request):
+        """Итератор байтов готового JSON-списка или None, если быстрого пути нет."""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(request)
+        client_tags = parse_etags(request.headers.get("If-None-Match", ""))
+        if "*" in client_tags or etag in (t.removeprefix("W/") for t in client_tags):
+            response = Response(status=304)
+        elif request.accepted_renderer.format == "json":
+            response = self.json_list(request, etag, *args, **kwargs)
+        else:
+            response = super().list(request, *args, **kwargs)
+        response["ETag"] = etag
+        # браузер хранит ответ, но каждый раз перепроверяет его по ETag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def json_list(self, request, etag, *args, **kwargs):
+        renderer = request.accepted_renderer
+        use_cache = self.cache_responses and response_cache.enabled()
+        if use_cache:
+            # в ответе абсолютные ссылки на файлы — ключ зависит и от хоста
+            key = response_cache.make_key(etag, self.get_cache_scope(request), request.build_absolute_uri("/"))
+            content = response_cache.get(key)
+            if content is not None:
+                response = HttpResponse(content, content_type=renderer.media_type)
+                response["X-Cache"] = "HIT"
+                return response
+
+        stream = self.stream_list(request)
+        if stream is not None:
+            if use_cache:
+                stream = self._cache_stream(stream, key)
+            response = StreamingHttpResponse(transfers.stream(request, stream), content_type=renderer.media_type)
+        else:
+            response = super().list(request, *args, **kwargs)
+            if not use_cache or response.status_code != 200:
+                return response
+            content = renderer.render(response.data, request.accepted_media_type, self.get_renderer_context())
+            response_cache.set(key, content)
+            response = HttpResponse(content, content_type=renderer.media_type)
+        if use_cache:
+            response["X-Cache"] = "MISS"
+        return response
+
+    @staticmethod
+    def _cache_stream(stream, key):
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        response_cache.set(key, b"".join(chunks))
+
+
+class FieldSelectionMixin:
+    """
+    ?fields= / ?expand= для чтения (см. FieldSelection): сериализатор отдаёт
+    только выбранные поля, а get_queryset подгружает только нужные связи.
+    Запись всегда работает с полным набором полей.
+    """
+    # связи работы, которые подгружаются prefetch_related
+    work_relations = ("payment_details", "accrual_details", "materials")
+
+    def get_field_selection(self):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return None
+        return FieldSelection.from_request(self.request)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["field_selection"] = self.get_field_selection()
+        return context
+
+    def wants(self, path):
+        selection = self.get_field_selection()
+        return selection is None or selection.allows_path(path)
+
+    def work_prefetches(self, prefix=""):
+        return [name for name in self.work_relations if self.wants(prefix + name)]
+
+
+class BudgetTreePagination(pagination.PageNumberPagination):
+    """
+    Постраничная выдача дерева статей.
+    Включается только при явном ?limit=, иначе отдаём весь список как раньше.
+    """
+    page_size = None
+    page_query_param = "page"
+    page_size_query_param = "limit"
+    max_page_size = 500
+
+
+class BudgetItemViewSet(ServerTimingMixin, FieldSelectionMixin, RevisionETagMixin, viewsets.ModelViewSet):
+    """
+    GET /api/items/?year=2025&group=3&page=1&limit=50
+    year и group ограничивают и сами статьи, и вложенные Prefetch-выборки работ.
+    ?fields=id,name,works.name,works.accruals&expand= — только нужные поля и выборки.
+    Непостраничный JSON-список отдаётся потоком через TreeStreamer (values()).
+    """
+    queryset = BudgetItem.objects.select_related('group')
     serializer_class = BudgetItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = BudgetTreePagination
+    etag_tables = ("budgetitem", "group", "work", "paymentdetail", "accrualdetail", "material")
+    etag_by_year = True
+    cache_responses = True
 
-class WorkViewSet(viewsets.ModelViewSet):
+    def stream_list(self, request):
+        # постраничный режим идёт обычным путём DRF
+        if self.paginator.get_page_size(request) is not None:
+            return None
+        items = self.get_queryset().prefetch_related(None)
+        return iter(TreeStreamer(request, items, year=_int_param(request, "year"),
+                                 selection=self.get_field_selection()))
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        works = Work.objects.prefetch_related(*self.work_prefetches("works."))
+        year = _int_param(self.request, "year")
+        group = _int_param(self.request, "group")
+        if year is not None:
+            works = works.filter(year=year)
+        if group is not None:
+            qs = qs.filter(group_id=group)
+        prefetches = []
+        if self.wants("works"):
+            prefetches.append(Prefetch('works', queryset=works, to_attr='detailed_works'))
+        if self.wants("reports"):
+            prefetches.append('materials')
+        return qs.prefetch_related(*prefetches)
+
+class WorkViewSet(ServerTimingMixin, FieldSelectionMixin, viewsets.ModelViewSet):
+    """
+    GET /api/works/?fields=id,name,accruals&expand=payment_details
+    Без параметров отдаются все поля и все вложенные списки.
+    """
     queryset = Work.objects.with_details()
     serializer_class = WorkSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrCanEditAny]
@@ -111,7 +298,10 @@ class WorkViewSet(viewsets.ModelViewSet):
     )
 
     def get_queryset(self):
-        qs = Work.objects.with_details()
+        qs = Work.objects.prefetch_related(*self.work_prefetches())
+        if self.wants("group"):
+            # group = GroupSerializer(source="item.group") — без этого запрос на каждую работу
+            qs = qs.select_related("item__group")
         user = self.request.user
         if user.has_perm("budget.change_any_work"):
             return qs
@@ -125,14 +315,89 @@ class WorkViewSet(viewsets.ModelViewSet):
             serializer.save(responsible=self.request.user)
 
     def perform_update(self, serializer):
-        work = self.get_object()
+        # объект уже загружен и проверен в update(); повторный get_object() не нужен
+        work = serializer.instance
         # Разрешаем обновление только создателю или при наличии специального права
         if not self.request.user.has_perm('budget.change_any_work') \
            and work.responsible_id != self.request.user.id:
-            raise permissions.PermissionDenied('Нельзя редактировать чужую работу')
+            raise PermissionDenied('Нельзя редактировать чужую работу')
         serializer.save()
 
-class MaterialViewSet(viewsets.ModelViewSet):
+    def perform_destroy(self, instance):
+        # каскад удаляет детали по одной через сигналы — журнал пишем одной пачкой
+        with transaction.atomic(), batch_changes():
+            instance.delete()
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        POST /api/works/bulk/ [{"id": 1, "feasibility": "red"}, {"id": 2, "responsible": 5}, ...]
+        Частичное обновление многих работ одной транзакцией.
+        Если хоть одна строка не прошла проверку, ничего не меняется,
+        а в ответе — ошибки по каждой строке.
+        """
+        rows = request.data
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise serializers.ValidationError("Ожидается список объектов")
+
+        def ids_of(field):
+            ids = set()
+            for row in rows:
+                try:
+                    ids.add(int(row[field]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            return ids
+
+        # все внешние ключи — тремя запросами на весь пакет
+        works = Work.objects.in_bulk(ids_of("id"))
+        context = self.get_serializer_context()
+        context["preloaded"] = {
+            BudgetItem: BudgetItem.objects.in_bulk(ids_of("item")),
+            User: User.objects.in_bulk(ids_of("responsible")),
+        }
+        owner_check = IsOwnerOrCanEditAny()
+
+        errors = []
+        changed_fields = set()
+        seen = set()
+        for index, row in enumerate(rows):
+            serializer = WorkBulkUpdateSerializer(data=row, partial=True, context=context)
+            if not serializer.is_valid():
+                errors.append({"index": index, "id": row.get("id"), "errors": serializer.errors})
+                continue
+            data = serializer.validated_data
+            work = works.get(data.pop("id", None))
+            if work is None:
+                errors.append({"index": index, "id": row.get("id"), "errors": {"id": ["Работа не найдена"]}})
+                continue
+            if not owner_check.has_object_permission(request, self, work):
+                errors.append({"index": index, "id": work.id, "errors": {"id": ["Нельзя редактировать чужую работу"]}})
+                continue
+            if work.id in seen:
+                errors.append({"index": index, "id": work.id, "errors": {"id": ["Работа указана несколько раз"]}})
+                continue
+            seen.add(work.id)
+            for field, value in data.items():
+                setattr(work, field, value)
+                changed_fields.add(field)
+
+        if errors:
+            return Response({"errors": errors}, status=400)
+
+        updated = [works[pk] for pk in seen]
+        if updated and changed_fields:
+            now = timezone.now()
+            for work in updated:
+                work.updated_at = now
+            with transaction.atomic():
+                Work.objects.bulk_update(updated, sorted(changed_fields) + ["updated_at"], batch_size=200)
+                if changed_fields & WorkMonthAmount.WORK_FIELDS:
+                    WorkMonthAmount.sync(updated)
+                log_changes(updated)
+        return Response({"updated": sorted(seen)})
+
+class MaterialViewSet(ServerTimingMixin, viewsets.ModelViewSet):
     queryset = Material.objects.select_related('work', 'item')
     serializer_class = MaterialSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrCanEditAny]
@@ -147,7 +412,7 @@ class MaterialViewSet(viewsets.ModelViewSet):
             obj = get_object_or_404(Work, pk=work_id)
             if not self.request.user.has_perm("budget.change_any_work") \
                and obj.responsible_id != self.request.user.id:
-                raise permissions.PermissionDenied("Нельзя прикрепить к чужой работе")
+                raise PermissionDenied("Нельзя прикрепить к чужой работе")
             serializer.save(work=obj)
         elif item_id:
             obj = get_object_or_404(BudgetItem, pk=item_id)
@@ -155,7 +420,7 @@ class MaterialViewSet(viewsets.ModelViewSet):
         else:
             raise serializers.ValidationError("Нужно указать либо work, либо item")
 
-class PaymentDetailViewSet(viewsets.ModelViewSet):
+class PaymentDetailViewSet(ServerTimingMixin, viewsets.ModelViewSet):
     """CRUD для деталей оплаты"""
     queryset = PaymentDetail.objects.select_related('work')
     serializer_class = PaymentDetailSerializer
@@ -167,44 +432,311 @@ class PaymentDetailViewSet(viewsets.ModelViewSet):
         work = get_object_or_404(Work, pk=work_id)
         # проверяем права на работу
         if not self.request.user.has_perm('budget.change_any_work') and work.responsible_id != self.request.user.id:
-            raise permissions.PermissionDenied('Нельзя создать деталь оплаты для чужой работы')
+            raise PermissionDenied('Нельзя создать деталь оплаты для чужой работы')
         serializer.save(work=work)
 
-class ReserveViewSet(viewsets.ModelViewSet):
+class UploadViewSet(ServerTimingMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Загрузка файлов частями (budget.uploads):
+    POST /api/uploads/ {filename, size, sha256?, target, work|item|detail_id} — сессия;
+    PUT  /api/uploads/<id>/chunk/?offset=N, тело — байты части;
+    GET  /api/uploads/<id>/ — сколько получено (received), для докачки;
+    POST /api/uploads/<id>/finalize/ {sha256} — проверить и прикрепить файл;
+    DELETE /api/uploads/<id>/ — отменить.
+    """
+    serializer_class = UploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    result_serializers = {
+        "material": MaterialSerializer,
+        "report": ArticleReportSerializer,
+        "payment_detail": PaymentDetailSerializer,
+        "accrual_detail": AccrualDetailSerializer,
+    }
+
+    def get_queryset(self):
+        return Upload.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        work = data.get("work")
+        if data["target"] in uploads.DETAIL_MODELS:
+            model = uploads.DETAIL_MODELS[data["target"]]
+            work = get_object_or_404(model.objects.select_related("work"), pk=data["detail_id"]).work
+        if work is not None and not self.request.user.has_perm("budget.change_any_work") \
+           and work.responsible_id != self.request.user.id:
+            raise PermissionDenied("Нельзя прикрепить файл к чужой работе")
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+
+    @action(detail=True, methods=["put"])
+    def chunk(self, request, pk=None):
+        upload = self.get_object()
+        offset = _int_param(request, "offset")
+        if offset is None:
+            return Response({"detail": "Нужен параметр offset"}, status=400)
+        if request.stream is None:
+            return Response({"detail": "Нужно тело части с Content-Length"}, status=411)
+        try:
+            uploads.write_chunk(upload, offset, request.stream)
+        except uploads.OffsetMismatch:
+            upload.refresh_from_db(fields=["received"])
+            return Response({"detail": "Часть не с того смещения", "received": upload.received}, status=409)
+        except uploads.UploadError as exc:
+            return Response({"detail": str(exc)}, status=413)
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=["post"])
+    def finalize(self, request, pk=None):
+        upload = self.get_object()
+        result_serializer = self.result_serializers[upload.target]
+        try:
+            obj = uploads.finalize(upload, request.data.get("sha256"))
+        except uploads.UploadError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        return Response(result_serializer(obj, context=self.get_serializer_context()).data, status=201)
+
+
+class ImportJobViewSet(ServerTimingMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                       mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Фоновый импорт работ из CSV/XLSX (budget.imports):
+    POST /api/imports/ multipart {file, dry_run} — задача, 202;
+    GET  /api/imports/<id>/ — статус, progress, счётчики, errors, diff;
+    POST /api/imports/<id>/apply/ — выполнить проверенный пробный прогон.
+    Импорт меняет чужие работы, поэтому нужно право change_any_work.
+    """
+    serializer_class = ImportJobSerializer
+    permission_classes = [permissions.IsAuthenticated, CanEditAnyWork]
+    parser_classes = (parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser)
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        imports.start(serializer.save(user=request.user))
+        return Response(serializer.data, status=202)
+
+    @action(detail=True, methods=["post"])
+    def apply(self, request, pk=None):
+        job = self.get_object()
+        if not job.dry_run or job.status != "done":
+            return Response({"detail": "Применить можно только завершённый пробный прогон"}, status=400)
+        applied = ImportJob(user=request.user)
+        with job.file.open("rb") as handle:
+            applied.file.save(Path(job.file.name).name, handle)
+        imports.start(applied)
+        return Response(self.get_serializer(applied).data, status=202)
+
+
+class JobViewSet(ServerTimingMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                 mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Фоновые задачи (budget.jobs):
+    POST /api/jobs/ {kind, params} — поставить задачу, 202;
+    GET  /api/jobs/<id>/ — статус, progress, попытки, ошибка;
+    GET  /api/jobs/<id>/result/ — файл результата или JSON; 409, пока не готово.
+    Видны только свои задачи.
+    """
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        kind = serializer.validated_data["kind"]
+        permission = jobs.HANDLERS[kind].permission
+        if permission and not request.user.has_perm(permission):
+            raise PermissionDenied(f"Нужно право {permission.split('.')[-1]}")
+        job = jobs.enqueue(kind, user=request.user, **serializer.validated_data["params"])
+        return Response(self.get_serializer(job).data, status=202)
+
+    @action(detail=True, methods=["get"])
+    def result(self, request, pk=None):
+        job = self.get_object()
+        if job.status != "done":
+            return Response({"detail": "Задача ещё не выполнена", "status": job.status}, status=409)
+        if job.result_file:
+            return transfers.attachment(request, job.result_file.open("rb"), Path(job.result_file.name).name)
+        return Response(job.result)
+
+
+class ReserveViewSet(ServerTimingMixin, RevisionETagMixin, viewsets.ModelViewSet):
     queryset = QuarterReserve.objects.all()
     serializer_class = ReserveSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_tables = ("quarterreserve",)
+    etag_by_year = True
+    cache_responses = True
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        year = _int_param(self.request, "year")
+        if year is not None:
+            qs = qs.filter(year=year)
+        return qs
+
+    @staticmethod
+    def _shortage_detail(reserve, acc, pay):
+        if acc > reserve.accrual_sum - reserve.used_acc:
+            return "Недостаточно резерва Н"
+        if pay > reserve.payment_sum - reserve.used_pay:
+            return "Недостаточно резерва О"
+        return "Резерв изменён другим пользователем, повторите списание"
 
     @action(detail=True, methods=["post"])
     def write_off(self, request, pk):
         """ списать резерв под новую работу """
         reserve = self.get_object()
-        amount_acc = Decimal(request.data.get("acc", 0))
-        amount_pay = Decimal(request.data.get("pay", 0))
+        data = ReserveWriteOffSerializer(data={
+            "item": reserve.item_id, "year": reserve.year, "quarter": reserve.quarter,
+            "acc": request.data.get("acc", 0), "pay": request.data.get("pay", 0),
+        })
+        data.is_valid(raise_exception=True)
+        acc, pay = data.validated_data["acc"], data.validated_data["pay"]
 
-        if amount_acc > reserve.accrual_sum - reserve.used_acc:
-            return Response({"detail": "Недостаточно резерва Н"},
+        # проверка остатка и списание — один условный UPDATE, без гонки read-modify-write
+        if not QuarterReserve.objects.filter(pk=reserve.pk).write_off(acc, pay):
+            reserve.refresh_from_db()
+            return Response({"detail": self._shortage_detail(reserve, acc, pay)},
                             status=400)
-        if amount_pay > reserve.payment_sum - reserve.used_pay:
-            return Response({"detail": "Недостаточно резерва О"},
-                            status=400)
-
-        reserve.used_acc += amount_acc
-        reserve.used_pay += amount_pay
-        reserve.save()
 
+        reserve.refresh_from_db()
+        log_changes([reserve])
         return Response(self.get_serializer(reserve).data)
 
+    @action(detail=False, methods=["post"], url_path="write_off")
+    def write_off_batch(self, request):
+        """
+        POST /api/reserves/write_off/ [{"item": 1, "year": 2025, "quarter": 2, "acc": 100, "pay": 0}, ...]
+        Списание по нескольким кварталам одной транзакцией: либо всё, либо ничего.
+        Возвращает обновлённые резервы с остатками.
+        """
+        entries = ReserveWriteOffSerializer(data=request.data, many=True)
+        entries.is_valid(raise_exception=True)
+
+        # повторы одного квартала складываются: проверяется общий остаток
+        amounts = {}
+        for entry in entries.validated_data:
+            key = (entry["item"], entry["year"], entry["quarter"])
+            acc, pay = amounts.get(key, (0, 0))
+            amounts[key] = (acc + entry["acc"], pay + entry["pay"])
+        lookup = Q()
+        for item_id, year, quarter in amounts:
+            lookup |= Q(item_id=item_id, year=year, quarter=quarter)
+
+        with transaction.atomic():
+            # один условный UPDATE на все кварталы; не списалось хоть одно — откат
+            if QuarterReserve.objects.write_off_many(amounts) == len(amounts):
+                reserves = list(QuarterReserve.objects.filter(lookup).order_by("item_id", "year", "quarter"))
+                log_changes(reserves)
+                return Response(self.get_serializer(reserves, many=True).data)
+            transaction.set_rollback(True)
+
+        # после отката остатки прежние: по ним определяем, какие позиции не прошли
+        reserves = {(r.item_id, r.year, r.quarter): r for r in QuarterReserve.objects.filter(lookup)}
+        failed = {}
+        for key, (acc, pay) in amounts.items():
+            reserve = reserves.get(key)
+            if reserve is None:
+                failed[key] = "Резерв не найден"
+            elif acc > reserve.accrual_sum - reserve.used_acc or pay > reserve.payment_sum - reserve.used_pay:
+                failed[key] = self._shortage_detail(reserve, acc, pay)
+        errors = []
+        for index, entry in enumerate(entries.validated_data):
+            key = (entry["item"], entry["year"], entry["quarter"])
+            if key in failed or not failed:
+                errors.append({"index": index, "detail": failed.get(
+                    key, "Резерв изменён другим пользователем, повторите списание")})
+        return Response({"errors": errors}, status=400)
+
+
+class SummaryView(ServerTimingMixin, APIView):
+    """
+    GET /api/summary/?year=2025&group=3
+    Итоги план/факт (Н и О) по группам, статьям, кварталам и месяцам.
+    Считаются в БД, без загрузки дерева работ, по снимку для отчётов
+    (возраст снимка — в заголовке X-Snapshot-Age).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        year = _int_param(request, "year") or timezone.now().year
+        group = _int_param(request, "group")
+        with use_snapshot() as snapshot_age:
+            data = build_summary(year, group)
+        return set_age_header(Response(data), snapshot_age)
+
+class ChangesView(ServerTimingMixin, APIView):
+    """
+    GET /api/changes/?since=<cursor>&year=2025
+    Строки Work / PaymentDetail / AccrualDetail / QuarterReserve, изменённые
+    после курсора, и id удалённых. В ответе — новый курсор для следующего запроса.
+    Без since возвращается только текущий курсор (после полной загрузки items/).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    # model_name -> (ключ ответа, queryset, сериализатор, путь к году)
+    sources = {
+        "work": ("works", Work.objects.with_details().select_related('item__group').prefetch_related('materials'),
+                 WorkSerializer, "year"),
+        "paymentdetail": ("payment_details", PaymentDetail.objects.select_related('work'),
+                          PaymentDetailSerializer, "work__year"),
+        "accrualdetail": ("accrual_details", AccrualDetail.objects.select_related('work'),
+                          AccrualDetailSerializer, "work__year"),
+        "quarterreserve": ("reserves", QuarterReserve.objects.all(), ReserveSerializer, "year"),
+    }
+
+    def get(self, request):
+        since = _int_param(request, "since")
+        year = _int_param(request, "year")
+        head = ChangeLog.objects.aggregate(head=Max("id"))["head"] or 0
+        if since is None:
+            since = head
+
+        log = ChangeLog.objects.filter(id__gt=since, id__lte=head)
+        if year is not None:
+            log = log.filter(Q(year=year) | Q(year__isnull=True))
+        # последняя запись по каждому объекту определяет, изменён он или удалён
+        latest = {}
+        for model, object_id, deleted in log.order_by("id").values_list("model", "object_id", "deleted"):
+            latest[(model, object_id)] = deleted
+
+        changed = {}
+        removed = {}
+        for model, (key, qs, serializer_class, year_path) in self.sources.items():
+            ids = [oid for (m, oid), deleted in latest.items() if m == model and not deleted]
+            removed[key] = [oid for (m, oid), deleted in latest.items() if m == model and deleted]
+            rows = qs.filter(pk__in=ids) if ids else qs.none()
+            if year is not None:
+                rows = rows.filter(**{year_path: year})
+            data = []
+            for obj in rows:
+                row = serializer_class(obj, context={"request": request}).data
+                if year_path == "work__year":
+                    row["work"] = obj.work_id
+                data.append(row)
+            changed[key] = data
+
+        return Response({"cursor": head, "changed": changed, "deleted": removed})
 
 
 # ---- Users -----------------------------------------------------------
 User = get_user_model()
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+class UserViewSet(ServerTimingMixin, RevisionETagMixin, viewsets.ReadOnlyModelViewSet):
     """
     GET /api/users/  – список пользователей (id, username, first_name, last_name, full_name).
     Только для аутентифицированных.
     """
     queryset = User.objects.all().order_by("username")
     serializer_class = UserLightSerializer
-    permission_classes = [permissions.IsAuthenticated]
\ No newline at end of file
+    permission_classes = [permissions.IsAuthenticated]
+    etag_tables = ("user",)
\ No newline at end of file
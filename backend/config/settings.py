@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'budget.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     "corsheaders.middleware.CorsMiddleware",
@@ -121,13 +122,89 @@ else:
     data_dir = os.environ.get('DATA_DIR', '/data')
     sqlite_path = Path(data_dir) / 'db.sqlite3'
 
+# Профиль SQLite для нескольких gunicorn-воркеров на одном файле:
+# WAL — читатели не ждут писателя; synchronous=NORMAL в WAL не теряет
+# целостность при падении процесса; busy_timeout — ждать блокировку, а не
+# сразу падать с «database is locked»; mmap/cache/temp_store — меньше
+# системных вызовов на чтение. Запись начинается с BEGIN IMMEDIATE: блокировка
+# берётся в начале транзакции, без взаимной блокировки при повышении
+# читателя до писателя. Соединения переиспользуются с проверкой перед запросом.
+# Замер: manage.py bench_sqlite.
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 20000))
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", 64 * 1024)),  # < 0 — в КиБ
+    "temp_store": "MEMORY",
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': str(sqlite_path),
+        'OPTIONS': {
+            'init_command': ";".join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+        'CONN_MAX_AGE': int(os.getenv("CONN_MAX_AGE", 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Снимок базы только для чтения под сводку и выгрузки (budget.snapshot):
+# онлайн-бэкап основной базы, обновляется не реже REPORTING_SNAPSHOT_MAX_AGE
+# секунд; запись и интерактивное чтение остаются на основной базе.
+REPORTING_SNAPSHOT = bool(int(os.getenv("REPORTING_SNAPSHOT", 0 if DEBUG else 1)))
+REPORTING_SNAPSHOT_PATH = Path(os.getenv("REPORTING_SNAPSHOT_PATH", sqlite_path.with_name('snapshot.sqlite3')))
+REPORTING_SNAPSHOT_MAX_AGE = int(os.getenv("REPORTING_SNAPSHOT_MAX_AGE", 300))
+DATABASES['snapshot'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': REPORTING_SNAPSHOT_PATH.resolve().as_uri() + '?mode=ro',
+    'OPTIONS': {
+        'init_command': ";".join(
+            f"PRAGMA {name}={SQLITE_PRAGMAS[name]}" for name in ("mmap_size", "cache_size", "temp_store")
+        ) + ";PRAGMA query_only=ON",
+    },
+    'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+    'CONN_HEALTH_CHECKS': True,
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['budget.snapshot.ReportingRouter']
+
+# Общий для gunicorn-воркеров кэш ответов items/ и reserves/ (budget.cache).
+# Файловый, рядом с БД; инвалидируется счётчиками ревизий в ключе.
+RESPONSE_CACHE_ENABLED = bool(int(os.getenv("RESPONSE_CACHE", 1)))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('RESPONSE_CACHE_DIR', str(sqlite_path.parent / 'response_cache')),
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 500},
+    },
+}
+
+# Заголовок Server-Timing и строки лога budget.timing с фазами db/serialize/render.
+# SERVER_TIMING_LOG_MS — писать в лог только запросы не быстрее порога.
+SERVER_TIMING = bool(int(os.getenv("SERVER_TIMING", 0)))
+SERVER_TIMING_LOG_MS = float(os.getenv("SERVER_TIMING_LOG_MS", 0))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'budget.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -179,6 +256,43 @@ else:
     data_dir = os.environ.get('DATA_DIR', '/data')
     MEDIA_ROOT = Path(data_dir)
 
+# Загруженные файлы хранятся по содержимому (budget.storage): одинаковые
+# вложения лежат на диске один раз, имена FileField — ссылки на них.
+# staticfiles — то же хранилище, что Django берёт по умолчанию.
+STORAGES = {
+    "default": {"BACKEND": "budget.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# Отдача /materials/ (budget.transfers.serve_media). Права проверяет Django,
+# байты при MEDIA_ACCEL отдаёт фронтовой сервер: "nginx" — X-Accel-Redirect
+# на internal-location MEDIA_ACCEL_PREFIX (alias на MEDIA_ROOT), "sendfile" —
+# X-Sendfile с путём к файлу (Apache mod_xsendfile, lighttpd). Пусто — Django.
+MEDIA_ACCEL = os.getenv("MEDIA_ACCEL", "")
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/protected-materials/")
+MEDIA_CACHE_SECONDS = int(os.getenv("MEDIA_CACHE_SECONDS", 3600))
+
+# Загрузка частями (budget.uploads): недокачанные файлы лежат в
+# UPLOAD_SESSION_DIR — на том же томе, что MEDIA_ROOT, чтобы готовый файл
+# переносился переименованием. Часть — не больше UPLOAD_CHUNK_MAX байт.
+UPLOAD_SESSION_DIR = Path(os.getenv("UPLOAD_SESSION_DIR", MEDIA_ROOT / ".uploads"))
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", 2 * 1024 ** 3))
+UPLOAD_CHUNK_MAX = int(os.getenv("UPLOAD_CHUNK_MAX", 16 * 1024 ** 2))
+UPLOAD_SESSION_HOURS = int(os.getenv("UPLOAD_SESSION_HOURS", 48))
+
+# Фоновые задачи (budget.jobs): очередь — таблица Job, выполняет их
+# manage.py run_workers (JOB_WORKERS потоков или процессов). Упавшая задача
+# повторяется до JOB_MAX_ATTEMPTS раз через JOB_RETRY_DELAY·2^n секунд;
+# задача без пульса дольше JOB_STALE_SECONDS считается брошенной.
+# JOBS_IN_PROCESS — сразу выполнять задачу в потоке веб-процесса (для
+# runserver без отдельного воркера).
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", 30))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", 30))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 300))
+JOBS_IN_PROCESS = os.getenv("JOBS_IN_PROCESS", "1" if DEBUG else "0") == "1"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
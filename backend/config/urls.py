@@ -3,25 +3,31 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 from django.views.generic import TemplateView
 from django.http import HttpResponse
-from django.conf import settings
-from django.conf.urls.static import static  # ⬅ медиа в DEBUG
 from rest_framework.routers import DefaultRouter
 from budget.views import (
     BudgetItemViewSet,
     WorkViewSet,
     MaterialViewSet,
+    UploadViewSet,
+    ImportJobViewSet,
+    JobViewSet,
     ReserveViewSet,
     UserViewSet,
     session_login,
     session_logout,
     CurrentUserView,
+    SummaryView,
+    ChangesView,
 )
-from django.views.static import serve as static_serve
+from budget.transfers import serve_media
 
 router = DefaultRouter()
 router.register(r"items", BudgetItemViewSet)
 router.register(r"works", WorkViewSet)
 router.register(r"materials", MaterialViewSet)
+router.register(r"uploads", UploadViewSet, basename="upload")
+router.register(r"imports", ImportJobViewSet, basename="import")
+router.register(r"jobs", JobViewSet, basename="job")
 router.register(r"reserves", ReserveViewSet)
 router.register(r"users", UserViewSet, basename="user")
 
@@ -30,22 +36,16 @@ urlpatterns = [
     path("api/login/",  session_login, name="api_login"),
     path("api/logout/", session_logout, name="api_logout"),
     path("api/users/me/", CurrentUserView.as_view(), name="api_me"),
+    path("api/summary/", SummaryView.as_view(), name="api_summary"),
+    path("api/changes/", ChangesView.as_view(), name="api_changes"),
     path("api/", include(router.urls)),
     path("health/", lambda request: HttpResponse("ok"), name="health"),
 ]
 
-# Serve media files at MEDIA_URL
-urlpatterns += static(
-    settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-)
-
-# Serve all media files under /materials/ in production and debug
+# Serve uploaded files under /materials/ in production and debug:
+# права, Range, ETag, при MEDIA_ACCEL — отдача фронтовым сервером
 urlpatterns += [
-    re_path(
-        r'^materials/(?P<path>.*)$',
-        static_serve,
-        {'document_root': settings.MEDIA_ROOT},
-    ),
+    re_path(r'^materials/(?P<path>.*)$', serve_media, name="media"),
 ]
 
 # React single‑page app – return index.html for any unmatched route except admin, api, materials
@@ -0,0 +1,57 @@
+#!/bin/sh
+# Запуск контейнера: gunicorn (ASGI) и воркер фоновых задач budget.jobs
+# (manage.py run_workers) под присмотром этого скрипта.
+# - Упавший run_workers перезапускается через WORKER_RESTART_DELAY секунд.
+# - Остановка gunicorn останавливает контейнер.
+# - SIGTERM/SIGINT (docker stop) передаётся обоим процессам. Воркер
+#   доделывает начатые задачи и выходит; недоделанные после SIGKILL
+#   вернёт в очередь следующий запуск (requeue_stale). Долгим задачам
+#   нужен docker stop -t / stop_grace_period больше 10 секунд.
+# Воркер можно вынести в отдельный сервис той же сборки (command:
+# python manage.py run_workers) и запускать контейнер с RUN_WORKERS=0.
+set -u
+
+WORKER_RESTART_DELAY=${WORKER_RESTART_DELAY:-5}
+stopping=0
+worker_pid=
+
+start_worker() {
+    if [ "${RUN_WORKERS:-1}" = "1" ]; then
+        python manage.py run_workers &
+        worker_pid=$!
+    fi
+}
+
+stop() {
+    stopping=1
+    kill -TERM "$web_pid" $worker_pid 2>/dev/null
+}
+trap stop TERM INT
+
+gunicorn -b 0.0.0.0:8000 config.asgi:application \
+    -k uvicorn_worker.UvicornWorker \
+    --workers=5 --max-requests=1000 --timeout=60 &
+web_pid=$!
+start_worker
+
+while [ "$stopping" -eq 0 ]; do
+    # sleep в фоне: wait прерывается сигналом, и trap срабатывает сразу
+    sleep "$WORKER_RESTART_DELAY" &
+    wait $!
+    [ "$stopping" -eq 0 ] || break
+    if ! kill -0 "$web_pid" 2>/dev/null; then
+        echo "gunicorn завершился, контейнер останавливается" >&2
+        stop
+        break
+    fi
+    if [ -n "$worker_pid" ] && ! kill -0 "$worker_pid" 2>/dev/null; then
+        wait "$worker_pid"
+        echo "run_workers завершился с кодом $?, перезапуск" >&2
+        start_worker
+    fi
+done
+
+wait "$web_pid"
+status=$?
+[ -z "$worker_pid" ] || wait "$worker_pid"
+exit "$status"